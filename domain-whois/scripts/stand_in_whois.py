@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Stand-in WHOIS server for tests and benchmarks
+
+Answers port-43 style queries from a dictionary of records, with an
+optional delay per answer and an optional rate limit, so the WHOIS client
+and bulk mode can be exercised offline:
+
+    python3 stand_in_whois.py --port 4343 --record example.com="Domain Name: EXAMPLE.COM"
+    python3 whois_lookup.py --bulk --server com=127.0.0.1:4343 --no-cache example.com
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+from collections import Counter
+
+RATE_LIMIT_ANSWER = 'Query rate limit exceeded. Try again later.\r\n'
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class StandInWhoisServer:
+    def __init__(self, records=None, delay=0.0, rate_limit=None, host='127.0.0.1', port=0):
+        """
+        records: domain -> answer text (callables get the domain)
+        delay: seconds to wait before answering
+        rate_limit: (queries, seconds); queries beyond it get a rate limit notice
+        """
+        self.records = {domain.lower(): text for domain, text in (records or {}).items()}
+        self.delay = delay
+        self.rate_limit = rate_limit
+        self.queries = Counter()
+        self.rate_limited = 0
+        self.active = 0
+        self.max_active = 0
+        self._window = []
+        self._lock = threading.Lock()
+        self.tcp = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self.tcp.server_address[:2]
+        return f'{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.tcp.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.tcp.shutdown()
+        self.tcp.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _over_limit(self):
+        if not self.rate_limit:
+            return False
+        count, seconds = self.rate_limit
+        now = time.monotonic()
+        with self._lock:
+            self._window = [t for t in self._window if now - t < seconds]
+            if len(self._window) >= count:
+                self.rate_limited += 1
+                return True
+            self._window.append(now)
+        return False
+
+    def answer(self, query):
+        # Flags some registries need ("domain x", "-T dn,ace x", "x/e") are ignored.
+        domain = query.split()[-1].lower() if query.split() else ''
+        if domain.endswith('/e'):
+            domain = domain[:-2]
+        with self._lock:
+            self.queries[domain] += 1
+        record = self.records.get(domain)
+        if callable(record):
+            record = record(domain)
+        if record is None:
+            return f'No match for "{domain.upper()}".\r\n'
+        return record if record.endswith('\n') else record + '\r\n'
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with server._lock:
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                try:
+                    query = self.rfile.readline(1024).decode('utf-8', 'replace').strip()
+                    if server.delay:
+                        time.sleep(server.delay)
+                    text = RATE_LIMIT_ANSWER if server._over_limit() else server.answer(query)
+                    self.wfile.write(text.encode('utf-8'))
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+        return Handler
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Stand-in WHOIS server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4343)
+    parser.add_argument('--record', action='append', default=[], metavar='DOMAIN=TEXT', help='answer for a domain')
+    parser.add_argument('--delay-ms', type=float, default=0, help='added to every answer')
+    parser.add_argument('--rate-limit', metavar='QUERIES/SECONDS', help='e.g. 10/60')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    records = dict(pair.partition('=')[::2] for pair in args.record)
+    rate_limit = None
+    if args.rate_limit:
+        count, _, seconds = args.rate_limit.partition('/')
+        rate_limit = (int(count), float(seconds))
+    server = StandInWhoisServer(records, args.delay_ms / 1000, rate_limit, args.host, args.port)
+    print(f'Stand-in WHOIS server listening on {server.address} with {len(records)} records')
+    try:
+        server.tcp.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.tcp.server_close()
@@ -0,0 +1,180 @@
+"""
+On-disk cache of WHOIS answers
+
+Answers are stored in SQLite under the normalized domain (lower case,
+IDNA-encoded), so "Example.COM." and "example.com" share one entry and
+"münchen.de" is stored as "xn--mnchen-3ya.de". Every answer of a lookup is
+stored, registry first, so a cached lookup parses like a fresh one.
+Registered domains are kept for a day; "no match" answers only for an
+hour, since an unregistered domain can be registered at any time. The most
+recently used entries are also held in memory.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path.home() / '.cache' / 'domain-whois' / 'whois.db'
+DEFAULT_TTL = 24 * 3600
+DEFAULT_NEGATIVE_TTL = 3600
+DEFAULT_MEMORY_SIZE = 1024
+
+NOT_FOUND = re.compile(
+    r'^[ \t]*(?:no match(?: for)?\b|not found\b|no data found|no entries found|no object found|'
+    r'domain not found|status:[ \t]*(?:free|available)\b)|\bis available for registration',
+    re.IGNORECASE | re.MULTILINE)
+
+# Bumped when the answers table changes; an older table is dropped.
+SCHEMA_VERSION = 2
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    domain TEXT PRIMARY KEY,
+    found INTEGER NOT NULL,
+    chain TEXT NOT NULL,
+    fetched REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+
+def normalize_domain(domain):
+    """Lower-cased, IDNA-encoded domain without the trailing dot."""
+    try:
+        return domain.strip().rstrip('.').lower().encode('idna').decode('ascii')
+    except UnicodeError:
+        raise ValueError(f"Invalid domain format: {domain}")
+
+
+def is_not_found(text):
+    """Whether a WHOIS answer says the domain is not registered."""
+    return bool(NOT_FOUND.search(text[:4000]))
+
+
+def final_text(chain):
+    """The last non-empty answer in a [(server, text)] chain."""
+    for _, text in reversed(chain):
+        if text.strip():
+            return text
+    return ''
+
+
+class CachedAnswer:
+    __slots__ = ('domain', 'found', 'chain', 'fetched')
+
+    def __init__(self, domain, found, chain, fetched):
+        self.domain = domain
+        self.found = found
+        # [(server, text)], registry first
+        self.chain = chain
+        self.fetched = fetched
+
+    @property
+    def servers(self):
+        return [server for server, _ in self.chain]
+
+    @property
+    def text(self):
+        return final_text(self.chain)
+
+
+class WhoisCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 memory_size=DEFAULT_MEMORY_SIZE, clock=time.time):
+        """
+        path: SQLite file (':memory:' keeps nothing on disk)
+        ttl: seconds a registered domain's answer is served
+        negative_ttl: seconds a "no match" answer is served
+        memory_size: answers also kept in memory, least recently used dropped first
+        """
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory_size = memory_size
+        self.clock = clock
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        if self._db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self._db.execute('DROP TABLE IF EXISTS answers')
+            self._db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self._db.execute(SCHEMA)
+        self._db.commit()
+
+    def _fresh(self, answer, now):
+        return now - answer.fetched < (self.ttl if answer.found else self.negative_ttl)
+
+    def _remember(self, answer):
+        self.memory[answer.domain] = answer
+        self.memory.move_to_end(answer.domain)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def _find(self, domain, now):
+        # Called with the lock held.
+        answer = self.memory.get(domain)
+        if answer is None:
+            row = self._db.execute(
+                'SELECT found, chain, fetched FROM answers WHERE domain = ?', (domain,)).fetchone()
+            if row:
+                chain = [(server, text) for server, text in json.loads(row[1])]
+                answer = CachedAnswer(domain, bool(row[0]), chain, row[2])
+        if answer is None or not self._fresh(answer, now):
+            self.memory.pop(domain, None)
+            return None
+        self._remember(answer)
+        return answer
+
+    def get(self, domain):
+        """The cached answer for domain while it is fresh, else None."""
+        domain = normalize_domain(domain)
+        with self._lock:
+            answer = self._find(domain, self.clock())
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return answer
+
+    def __contains__(self, domain):
+        """Whether a fresh answer is cached, without counting a hit or miss."""
+        domain = normalize_domain(domain)
+        with self._lock:
+            return self._find(domain, self.clock()) is not None
+
+    def put(self, domain, chain):
+        """Store the [(server, text)] answers of a lookup; returns them as a CachedAnswer."""
+        chain = [(server, text) for server, text in chain]
+        answer = CachedAnswer(normalize_domain(domain), not is_not_found(final_text(chain)), chain, self.clock())
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?)',
+                             (answer.domain, answer.found, json.dumps(chain), answer.fetched))
+            self._db.commit()
+            self._remember(answer)
+        return answer
+
+    def prune(self):
+        """Delete expired answers; returns how many were deleted."""
+        now = self.clock()
+        with self._lock:
+            deleted = self._db.execute(
+                'DELETE FROM answers WHERE fetched < ? - CASE WHEN found THEN ? ELSE ? END',
+                (now, self.ttl, self.negative_ttl)).rowcount
+            self._db.commit()
+            self.memory = OrderedDict((d, a) for d, a in self.memory.items() if self._fresh(a, now))
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+        return {'entries': entries, 'in_memory': len(self.memory), 'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
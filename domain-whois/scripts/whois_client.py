@@ -0,0 +1,262 @@
+"""
+Pure-Python WHOIS client (RFC 3912, TCP port 43)
+
+Finds the registry server for a domain from whois_servers.json (taken
+from the IANA root zone database), asks whois.iana.org for TLDs missing
+there, and follows the registry's referral to the registrar's server.
+Each hop has its own timeout. Per-server state spaces queries out and
+backs off after a server refuses or rate-limits us, and it is shared by
+every lookup made through the same client. With a WhoisCache, fresh
+answers are served from it and no server is asked.
+"""
+
+import asyncio
+import json
+import re
+import threading
+import time
+from pathlib import Path
+
+from whois_cache import final_text, normalize_domain
+
+SERVERS_PATH = Path(__file__).with_name('whois_servers.json')
+IANA_SERVER = 'whois.iana.org'
+WHOIS_PORT = 43
+DEFAULT_TIMEOUT = 10
+MAX_HOPS = 3
+# Larger answers are cut off; no real WHOIS record comes close.
+MAX_RESPONSE = 1024 * 1024
+# Pause between two queries to one server, and the back-off after it
+# refuses or rate-limits us (doubling up to MAX_BACKOFF).
+MIN_INTERVAL = 0.2
+BASE_BACKOFF = 10.0
+MAX_BACKOFF = 300.0
+
+REFERRAL = re.compile(
+    r'^\s*(?:registrar whois server|whois server|referralserver|refer|whois):\s*(?:r?whois://)?'
+    r'([a-z0-9-]+(?:\.[a-z0-9-]+)+)(?::(\d+))?/?\s*$', re.IGNORECASE | re.MULTILINE)
+RATE_LIMITED = re.compile(
+    r'limit exceeded|quota exceeded|too many (?:requests|queries)|try again later|rate limit',
+    re.IGNORECASE)
+
+
+class WhoisError(Exception):
+    pass
+
+
+class RateLimitedError(WhoisError):
+    pass
+
+
+class RefusedError(WhoisError):
+    pass
+
+
+def load_servers(path=SERVERS_PATH):
+    """(tld -> server, server -> query format) from the shipped IANA table."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data['servers'], data.get('query_formats', {})
+
+
+def split_server(server):
+    """'host' or 'host:port' -> (host, port)"""
+    host, _, port = server.partition(':')
+    return host.lower(), int(port) if port else WHOIS_PORT
+
+
+def find_referral(text, current):
+    """The next server named in a WHOIS answer, if it is not the current one."""
+    for match in REFERRAL.finditer(text):
+        server = match.group(1).lower() + (f":{match.group(2)}" if match.group(2) else '')
+        if split_server(server) != split_server(current):
+            return server
+    return None
+
+
+class ServerState:
+    """Query spacing and back-off for one server."""
+
+    def __init__(self, min_interval=MIN_INTERVAL):
+        self.min_interval = min_interval
+        self.next_allowed = 0.0
+        self.failures = 0
+        self.queries = 0
+
+    def delay(self, now):
+        return max(0.0, self.next_allowed - now)
+
+    def sent(self, now):
+        self.queries += 1
+        self.next_allowed = max(self.next_allowed, now + self.min_interval)
+
+    def succeeded(self):
+        self.failures = 0
+
+    def refused(self, now):
+        self.failures += 1
+        backoff = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (self.failures - 1))
+        self.next_allowed = max(self.next_allowed, now + backoff)
+
+
+class WhoisResponse:
+    def __init__(self, domain, chain, cached=False):
+        self.domain = domain
+        # [(server, text)], registry first
+        self.chain = chain
+        self.cached = cached
+
+    @classmethod
+    def from_cache(cls, answer):
+        return cls(answer.domain, list(answer.chain), cached=True)
+
+    @property
+    def server(self):
+        return self.chain[-1][0]
+
+    @property
+    def text(self):
+        """The registrar's answer when there is one, else the registry's."""
+        return final_text(self.chain)
+
+    def as_dict(self):
+        return {'domain': self.domain, 'servers': [server for server, _ in self.chain], 'text': self.text,
+                'cached': self.cached}
+
+
+class WhoisClient:
+    def __init__(self, servers=None, query_formats=None, timeout=DEFAULT_TIMEOUT, max_hops=MAX_HOPS,
+                 min_interval=MIN_INTERVAL, iana_server=IANA_SERVER, cache=None):
+        """
+        servers: tld -> server ('host' or 'host:port'), default from whois_servers.json
+        query_formats: server -> query text with {domain}, for servers that need flags
+        timeout: seconds per hop (connect, send and read)
+        max_hops: servers asked at most per lookup, referrals included
+        min_interval: seconds between two queries to the same server
+        cache: WhoisCache consulted before and filled after each lookup
+        """
+        if servers is None:
+            servers, shipped_formats = load_servers()
+            query_formats = dict(shipped_formats, **(query_formats or {}))
+        self.servers = {tld.lower(): server for tld, server in servers.items()}
+        self.query_formats = query_formats or {}
+        self.timeout = timeout
+        self.max_hops = max_hops
+        self.min_interval = min_interval
+        self.iana_server = iana_server
+        self.cache = cache
+        self.states = {}
+        self._lock = threading.Lock()
+
+    def state(self, server):
+        with self._lock:
+            state = self.states.get(server)
+            if state is None:
+                state = self.states[server] = ServerState(self.min_interval)
+            return state
+
+    def server_for(self, domain):
+        """The registry server for the longest known suffix of domain, or None."""
+        labels = domain.lower().rstrip('.').split('.')
+        for i in range(1, len(labels)):
+            server = self.servers.get('.'.join(labels[i:]))
+            if server:
+                return server
+        return None
+
+    async def _wait_turn(self, server):
+        state = self.state(server)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = state.delay(now)
+                if wait <= 0:
+                    state.sent(now)
+                    return state
+            await asyncio.sleep(wait)
+
+    async def query_async(self, server, text, timeout=None):
+        """Send one query to server and return its whole answer."""
+        timeout = self.timeout if timeout is None else timeout
+        host, port = split_server(server)
+        state = await self._wait_turn(server)
+
+        async def exchange():
+            reader, writer = await asyncio.open_connection(host, port)
+            try:
+                writer.write(text.encode('utf-8') + b'\r\n')
+                await writer.drain()
+                # The server closes the connection after its answer.
+                data = b''
+                while len(data) < MAX_RESPONSE:
+                    chunk = await reader.read(65536)
+                    if not chunk:
+                        break
+                    data += chunk
+                return data[:MAX_RESPONSE]
+            finally:
+                writer.close()
+
+        try:
+            data = await asyncio.wait_for(exchange(), timeout)
+        except asyncio.TimeoutError:
+            raise WhoisError(f"{host} did not answer within {timeout} seconds")
+        except (ConnectionRefusedError, ConnectionResetError) as e:
+            with self._lock:
+                state.refused(time.monotonic())
+            raise RefusedError(f"{host} refused the query: {e}")
+        except OSError as e:
+            raise WhoisError(f"Could not reach {host}: {e}")
+        answer = data.decode('utf-8', 'replace')
+        with self._lock:
+            if RATE_LIMITED.search(answer[:2000]) and len(answer) < 2000:
+                state.refused(time.monotonic())
+                raise RateLimitedError(f"{host} is rate limiting us: {answer.strip()[:200]}")
+            state.succeeded()
+        return answer
+
+    async def _registry_for(self, domain, timeout):
+        server = self.server_for(domain)
+        if server:
+            return server
+        # Ask IANA once per TLD and remember the answer.
+        tld = domain.lower().rstrip('.').rsplit('.', 1)[-1]
+        answer = await self.query_async(self.iana_server, tld, timeout)
+        server = find_referral(answer, self.iana_server)
+        if not server:
+            raise WhoisError(f"No WHOIS server known for .{tld}")
+        self.servers[tld] = server
+        return server
+
+    async def lookup_async(self, domain, timeout=None):
+        """
+        Look up domain at its registry and follow referrals.
+        Returns a WhoisResponse; raises WhoisError if the registry cannot be asked.
+        """
+        domain = normalize_domain(domain)
+        if self.cache is not None:
+            answer = self.cache.get(domain)
+            if answer is not None:
+                return WhoisResponse.from_cache(answer)
+        server = await self._registry_for(domain, timeout)
+        chain = []
+        while server and len(chain) < self.max_hops:
+            query = self.query_formats.get(split_server(server)[0], '{domain}').format(domain=domain)
+            try:
+                answer = await self.query_async(server, query, timeout)
+            except WhoisError:
+                if not chain:
+                    raise
+                # The registry answered; a registrar that fails only loses detail.
+                break
+            chain.append((server, answer))
+            server = find_referral(answer, server)
+            if server and any(split_server(server) == split_server(done) for done, _ in chain):
+                break
+        response = WhoisResponse(domain, chain)
+        if self.cache is not None and response.text.strip():
+            self.cache.put(domain, chain)
+        return response
+
+    def lookup(self, domain, timeout=None):
+        return asyncio.run(self.lookup_async(domain, timeout))
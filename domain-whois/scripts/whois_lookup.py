@@ -1,13 +1,44 @@
 #!/usr/bin/env python3
 """
 Secure whois lookup script
-Validates input and executes whois command safely, with fallback to python-whois library
+Validates input and queries the WHOIS servers directly (whois_client.py),
+falling back to the system whois command and then the python-whois library.
+Answers from the servers are cached on disk (whois_cache.py). With --json
+the answer is printed as a structured record (whois_parser.py):
+
+    python3 whois_lookup.py --json example.com
+
+Bulk mode looks up many domains concurrently and prints one JSON line per
+domain as each lookup completes:
+
+    python3 whois_lookup.py --bulk example.com example.org
+    python3 whois_lookup.py --bulk --workers 32 --file portfolio.txt > results.jsonl
+    cat portfolio.txt | python3 whois_lookup.py --bulk
+    python3 whois_lookup.py --bulk --parse --file portfolio.txt
+    python3 whois_lookup.py --bulk --rate 1 --progress --file portfolio.txt
+    python3 whois_lookup.py --bulk --server com=127.0.0.1:4343 --no-cache example.com
 """
 
+import argparse
+import asyncio
+import functools
+import json
 import sys
 import subprocess
 import re
 import shlex
+import sqlite3
+import time
+
+from whois_cache import DEFAULT_CACHE_PATH, WhoisCache, normalize_domain
+from whois_client import RateLimitedError, RefusedError, WhoisClient, WhoisError, WhoisResponse
+from whois_parser import parse_response, parse_whois
+from whois_scheduler import DEFAULT_BURST, DEFAULT_RATE, UNLIMITED, BulkScheduler
+
+DEFAULT_WORKERS = 16
+DEFAULT_TIMEOUT = 30
+# Server name of an answer from the whois command or python-whois
+FALLBACK_SERVER = 'whois'
 
 def validate_domain(domain):
     """
@@ -18,8 +49,28 @@ def validate_domain(domain):
     pattern = r'^[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?(\.[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?)*$'
     return bool(re.match(pattern, domain))
 
-def run_whois(domain):
-    """Execute whois command safely after validating the domain."""
+_client = None
+
+def make_client(cache_path=DEFAULT_CACHE_PATH):
+    """A WhoisClient caching in cache_path (None for no cache)."""
+    cache = None
+    if cache_path is not None:
+        try:
+            cache = WhoisCache(cache_path)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Whois cache unavailable, continuing without it: {e}", file=sys.stderr)
+    return WhoisClient(cache=cache)
+
+def default_client():
+    """One WhoisClient per process, so lookups share its per-server spacing and cache."""
+    global _client
+    if _client is None:
+        _client = make_client()
+    return _client
+
+def run_whois(domain, client=None):
+    """Look up domain safely after validating it."""
+    domain = normalize_domain(domain)
     if not validate_domain(domain):
         raise ValueError(f"Invalid domain format: {domain}")
     
@@ -27,7 +78,29 @@ def run_whois(domain):
     if any(char in domain for char in [';', '&', '|', '`', '$', '(', ')', '<', '>', '*']):
         raise ValueError(f"Domain contains invalid characters: {domain}")
     
-    # First, try the system whois command
+    # First, ask the WHOIS servers ourselves
+    try:
+        return (client or default_client()).lookup(domain).text
+    except (RateLimitedError, RefusedError):
+        # The whois command would query the same server during its back-off.
+        raise
+    except (WhoisError, OSError):
+        return run_system_whois(domain)
+
+def lookup_record(domain, client=None):
+    """Look up domain and parse the answer into a WhoisRecord."""
+    domain = normalize_domain(domain)
+    if not validate_domain(domain):
+        raise ValueError(f"Invalid domain format: {domain}")
+    try:
+        return parse_response((client or default_client()).lookup(domain))
+    except (RateLimitedError, RefusedError):
+        raise
+    except (WhoisError, OSError):
+        return parse_whois(run_system_whois(domain), domain)
+
+def run_system_whois(domain):
+    """Execute the system whois command, or python-whois if there is none."""
     try:
         result = subprocess.run(['whois', domain], 
                               capture_output=True, 
@@ -76,11 +149,228 @@ The domain '{domain}' appears to be valid based on format validation."""
         except Exception as e:
             return f"Error with python-whois library: {str(e)}"
 
+def read_domains(domains, files=(), stdin=None):
+    """Domains from arguments, files and stdin ('-'), without blanks, comments or repeats."""
+    sources = [domains]
+    for path in files:
+        if path == '-':
+            sources.append(stdin or sys.stdin)
+        else:
+            with open(path, encoding='utf-8') as f:
+                sources.append(f.read().splitlines())
+    seen = set()
+    for source in sources:
+        for line in source:
+            domain = line.split('#', 1)[0].strip().rstrip('.').lower()
+            if domain and domain not in seen:
+                seen.add(domain)
+                yield domain
+
+
+async def lookup_async(domain, timeout=DEFAULT_TIMEOUT, client=None):
+    """
+    Look up one domain without blocking the event loop: natively first,
+    then with the whois command in a subprocess. Returns a WhoisResponse.
+    A server that refused or rate-limited us is not asked again through the
+    whois command; its error is raised.
+    """
+    domain = normalize_domain(domain)
+    if not validate_domain(domain):
+        raise ValueError(f"Invalid domain format: {domain}")
+    deadline = time.monotonic() + timeout
+    try:
+        return await asyncio.wait_for((client or default_client()).lookup_async(domain), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Whois lookup timed out after {timeout} seconds")
+    except (RateLimitedError, RefusedError):
+        # The whois command would query the same server during its back-off.
+        raise
+    except WhoisError:
+        pass
+    text = await system_whois_async(domain, max(0.0, deadline - time.monotonic()), timeout)
+    return WhoisResponse(domain, [(FALLBACK_SERVER, text)])
+
+
+async def system_whois_async(domain, remaining, timeout):
+    """The whois command in a subprocess, killed after `remaining` of the lookup's `timeout` seconds."""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            'whois', domain, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    except FileNotFoundError:
+        # No whois binary: python-whois is blocking, so run it on a thread.
+        return await asyncio.get_running_loop().run_in_executor(None, run_system_whois, domain)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), remaining)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise TimeoutError(f"Whois command timed out after {timeout} seconds")
+    if process.returncode != 0:
+        raise RuntimeError(stderr.decode('utf-8', 'replace').strip() or f"whois exited with {process.returncode}")
+    return stdout.decode('utf-8', 'replace')
+
+
+async def bulk_lookup(domains, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, lookup=lookup_async, client=None,
+                      parse=False, rate=DEFAULT_RATE, burst=DEFAULT_BURST, rates=None, progress=None):
+    """
+    Look up domains with at most `workers` lookups in flight and at most
+    `rate` queries per second to each registry server (see whois_scheduler.py).
+    Yields one result dict per domain, in the order the lookups complete;
+    with parse, successful ones also carry the 'record' parsed from every
+    answer of the lookup, as with --json.
+    progress, if given, is called with the BulkProgress after each result.
+    """
+    client = client or default_client()
+    scheduler = BulkScheduler(functools.partial(route, client), workers, rate, burst, rates,
+                              backoff=lambda server: client.state(server).delay(time.monotonic()))
+    for domain in domains:
+        scheduler.add(domain)
+    async for server, domain, response, seconds in scheduler.run(lambda d: lookup(d, timeout, client=client)):
+        if isinstance(response, Exception):
+            result = {'domain': domain, 'ok': False, 'error': str(response)}
+        else:
+            result = {'domain': domain, 'ok': True, 'output': response.text}
+            if parse:
+                result['record'] = parse_response(response).as_dict()
+        result['server'] = server
+        result['seconds'] = round(seconds, 3)
+        if progress is not None:
+            progress(scheduler.progress)
+        yield result
+
+
+def route(client, domain):
+    """The registry server a bulk lookup of domain will ask, or UNLIMITED if it asks none."""
+    try:
+        domain = normalize_domain(domain)
+    except ValueError:
+        return UNLIMITED
+    if not validate_domain(domain) or (client.cache is not None and domain in client.cache):
+        return UNLIMITED
+    # Unknown TLDs share one group until the client has asked IANA about them.
+    return client.server_for(domain) or f".{domain.rsplit('.', 1)[-1]}"
+
+
+def run_bulk(domains, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, out=None, client=None, parse=False,
+             rate=DEFAULT_RATE, burst=DEFAULT_BURST, rates=None, progress=False):
+    """
+    Print one JSON line per domain as lookups complete; returns the number that failed.
+    With progress, a progress line goes to stderr every second and at the end.
+    """
+    out = out or sys.stdout
+    state = None
+    reported = 0.0
+    reported_done = 0
+
+    def report(progress_state):
+        nonlocal state, reported, reported_done
+        state = progress_state
+        if time.monotonic() - reported >= 1:
+            reported, reported_done = time.monotonic(), state.done
+            print(state.line(), file=sys.stderr, flush=True)
+
+    async def main():
+        failed = 0
+        async for result in bulk_lookup(domains, workers, timeout, client=client, parse=parse, rate=rate,
+                                        burst=burst, rates=rates, progress=report if progress else None):
+            failed += not result['ok']
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+            out.flush()
+        return failed
+
+    failed = asyncio.run(main())
+    if state is not None and state.done != reported_done:
+        print(state.line(), file=sys.stderr, flush=True)
+    return failed
+
+
+def server_override(value):
+    """'tld=host[:port]' -> (tld, server), for --server"""
+    tld, _, server = value.partition('=')
+    host, _, port = server.partition(':')
+    tld = tld.strip().lower().lstrip('.')
+    if not tld or not host or (port and not port.isdigit()):
+        raise argparse.ArgumentTypeError(f"expected TLD=HOST[:PORT], got {value!r}")
+    return tld, server.strip().lower()
+
+
+def server_rate(value):
+    """'server=qps' -> (server, qps), for --server-rate"""
+    server, _, qps = value.partition('=')
+    try:
+        qps = float(qps)
+    except ValueError:
+        qps = 0
+    if not server.strip() or not qps > 0:
+        raise argparse.ArgumentTypeError(f"expected SERVER=QPS with QPS above 0, got {value!r}")
+    return server.strip().lower(), qps
+
+
+def positive(convert):
+    def check(value):
+        try:
+            number = convert(value)
+        except ValueError:
+            number = 0
+        if not number > 0:
+            raise argparse.ArgumentTypeError(f"expected a number above 0, got {value!r}")
+        return number
+    return check
+
+
+def parse_bulk_args(argv):
+    parser = argparse.ArgumentParser(prog='whois_lookup.py --bulk', description='Look up many domains concurrently')
+    parser.add_argument('domains', nargs='*', help='domains to look up')
+    parser.add_argument('--file', action='append', default=[], help="file with one domain per line ('-' for stdin)")
+    parser.add_argument('--workers', type=positive(int), default=DEFAULT_WORKERS, help='lookups in flight at once')
+    parser.add_argument('--timeout', type=positive(float), default=DEFAULT_TIMEOUT, help='seconds per lookup')
+    parser.add_argument('--server', type=server_override, action='append', default=[], metavar='TLD=HOST[:PORT]',
+                        help='WHOIS server to ask for a TLD instead of the shipped one')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help=f'answer cache (default {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--no-cache', dest='cache', action='store_const', const=None, help='ask the servers every time')
+    parser.add_argument('--parse', action='store_true', help="add the parsed 'record' to each line")
+    parser.add_argument('--rate', type=positive(float), default=DEFAULT_RATE,
+                        help='queries per second to each registry server')
+    parser.add_argument('--burst', type=positive(int), default=DEFAULT_BURST,
+                        help='queries one registry server may get at once')
+    parser.add_argument('--server-rate', type=server_rate, action='append', default=[], metavar='SERVER=QPS',
+                        help='another rate for one registry server')
+    parser.add_argument('--progress', action='store_true', help='print progress and throughput to stderr')
+    args = parser.parse_args(argv)
+    if not args.domains and not args.file:
+        args.file = ['-']
+    return args
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--bulk':
+        args = parse_bulk_args(sys.argv[2:])
+        client = make_client(args.cache)
+        client.servers.update(args.server)
+        rates = dict(args.server_rate)
+        failed = run_bulk(list(read_domains(args.domains, args.file)), args.workers, args.timeout, client=client,
+                          parse=args.parse, rate=args.rate, burst=args.burst, rates=rates, progress=args.progress)
+        sys.exit(1 if failed else 0)
+
+    if len(sys.argv) == 3 and sys.argv[1] == '--json':
+        try:
+            record = lookup_record(sys.argv[2])
+        except (RateLimitedError, RefusedError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(record.as_dict(), indent=2, ensure_ascii=False))
+        sys.exit(0)
+
     if len(sys.argv) != 2:
         print("Usage: python3 whois_lookup.py <domain>")
+        print("       python3 whois_lookup.py --json <domain>")
+        print("       python3 whois_lookup.py --bulk [--workers N] [--rate QPS] [--file PATH] [domain ...]")
         sys.exit(1)
     
     domain = sys.argv[1]
-    result = run_whois(domain)
+    try:
+        result = run_whois(domain)
+    except (RateLimitedError, RefusedError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
     print(result)
\ No newline at end of file
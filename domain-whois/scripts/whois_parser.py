@@ -0,0 +1,253 @@
+"""
+Structured WHOIS records
+
+Turns a WHOIS answer into a WhoisRecord: registrar, created, expires,
+status and nameservers, with dates as UTC datetimes. Registries label
+these fields differently ("Registry Expiry Date:", "Expiry date:",
+"[Expires on]"), so each TLD with its own format has a field table,
+compiled once at import into a single line pattern. TLDs without one use
+the ICANN format table, which also covers the python-whois fallback's
+output.
+"""
+
+import re
+from datetime import datetime, timedelta, timezone
+
+from whois_cache import is_not_found
+
+FIELDS = ('domain', 'registrar', 'created', 'expires', 'status', 'nameservers')
+LIST_FIELDS = ('status', 'nameservers')
+DATE_FIELDS = ('created', 'expires')
+
+# label -> field; labels are matched case-insensitively at the start of a line
+ICANN = {
+    'domain name': 'domain',
+    'domain': 'domain',
+    'domain_name': 'domain',
+    'registrar': 'registrar',
+    'sponsoring registrar': 'registrar',
+    'registrar name': 'registrar',
+    'creation date': 'created',
+    'created': 'created',
+    'created on': 'created',
+    'registered on': 'created',
+    'creation_date': 'created',
+    'registry expiry date': 'expires',
+    'registrar registration expiration date': 'expires',
+    'expiration date': 'expires',
+    'expiry date': 'expires',
+    'expires on': 'expires',
+    'paid-till': 'expires',
+    'expiration_date': 'expires',
+    'domain status': 'status',
+    'status': 'status',
+    'name server': 'nameservers',
+    'nameserver': 'nameservers',
+    'nserver': 'nameservers',
+    'name servers': 'nameservers',
+    'name_servers': 'nameservers',
+}
+
+TLD_FIELDS = {
+    # DENIC has no registrar or dates in its public answer.
+    'de': {'domain': 'domain', 'status': 'status', 'nserver': 'nameservers'},
+    # Nominet puts values on the lines after the label.
+    'uk': {'domain name': 'domain', 'registrar': 'registrar', 'registered on': 'created',
+           'expiry date': 'expires', 'registration status': 'status', 'name servers': 'nameservers'},
+    # JPRS shows no registrar.
+    'jp': {'[domain name]': 'domain', '[created on]': 'created',
+           '[expires on]': 'expires', '[status]': 'status', '[state]': 'status', '[name server]': 'nameservers'},
+    'fr': {'domain': 'domain', 'registrar': 'registrar', 'created': 'created', 'expiry date': 'expires',
+           'status': 'status', 'nserver': 'nameservers'},
+    'eu': {'domain': 'domain', 'registrar': 'registrar', 'name servers': 'nameservers'},
+    'br': {'domain': 'domain', 'created': 'created', 'expires': 'expires', 'status': 'status',
+           'nserver': 'nameservers'},
+}
+# AFNIC also runs these.
+for _tld in ('re', 'pm', 'tf', 'wf', 'yt'):
+    TLD_FIELDS[_tld] = TLD_FIELDS['fr']
+
+MONTHS = {name: i for i, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1)}
+ISO_DATE = re.compile(
+    r'(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})(?:[T ](\d{1,2}):(\d{2})(?::(\d{2}))?(?:\.\d+)?)?\s*'
+    r'(Z|[+-]\d{2}:?\d{2})?')
+NAMED_MONTH_DATE = re.compile(r'(\d{1,2})[- ]([A-Za-z]{3})[a-z]*[- ](\d{4})')
+COMPACT_DATE = re.compile(r'^(\d{4})(\d{2})(\d{2})\b')
+TAG = re.compile(r'\s*\[Tag = [^\]]*\]\s*$')
+STATUS_URL = re.compile(r'\s+\(?https?://\S+$')
+
+
+class FieldTable:
+    """Labels of one WHOIS format, compiled into one line pattern."""
+
+    def __init__(self, labels):
+        self.labels = {label.lower(): field for label, field in labels.items()}
+        alternatives = '|'.join(re.escape(label) for label in sorted(self.labels, key=len, reverse=True))
+        # Optional "a. " item prefix (JPRS), then the label and ':' unless it is bracketed.
+        self.pattern = re.compile(
+            r'^[ \t]*(?:[a-z]\.[ \t]+)?(' + alternatives + r')(?:[ \t]*:|(?<=\]))[ \t]*(.*?)[ \t]*$',
+            re.IGNORECASE)
+
+    def fields(self, text):
+        """(field, value) pairs in answer order; labels alone on a line take the indented lines below."""
+        lines = text.splitlines()
+        i = 0
+        while i < len(lines):
+            match = self.pattern.match(lines[i])
+            i += 1
+            if not match:
+                continue
+            field = self.labels[match.group(1).lower()]
+            if match.group(2):
+                yield field, match.group(2)
+                continue
+            while i < len(lines) and lines[i][:1] in (' ', '\t') and lines[i].strip():
+                yield field, lines[i].strip()
+                i += 1
+
+
+GENERIC = FieldTable(ICANN)
+TABLES = {tld: FieldTable(labels) for tld, labels in TLD_FIELDS.items()}
+
+
+def table_for(domain):
+    """The field table for the longest suffix of domain that has one."""
+    labels = (domain or '').lower().rstrip('.').split('.')
+    for i in range(1, len(labels)):
+        table = TABLES.get('.'.join(labels[i:]))
+        if table:
+            return table
+    return GENERIC
+
+
+def parse_date(value):
+    """UTC datetime from the date formats registries use, or None."""
+    match = ISO_DATE.search(value)
+    if match:
+        year, month, day, hour, minute, second, offset = match.groups()
+        try:
+            moment = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0),
+                              int(second or 0), tzinfo=timezone.utc)
+        except ValueError:
+            return None
+        if offset and offset != 'Z':
+            sign = 1 if offset[0] == '+' else -1
+            digits = offset[1:].replace(':', '')
+            moment -= sign * timedelta(hours=int(digits[:2]), minutes=int(digits[2:]))
+        return moment
+    match = NAMED_MONTH_DATE.search(value)
+    if match and match.group(2).lower() in MONTHS:
+        day, month, year = match.groups()
+        try:
+            return datetime(int(year), MONTHS[month.lower()], int(day), tzinfo=timezone.utc)
+        except ValueError:
+            return None
+    match = COMPACT_DATE.match(value)
+    if match:
+        try:
+            return datetime(*map(int, match.groups()), tzinfo=timezone.utc)
+        except ValueError:
+            return None
+    return None
+
+
+def _clean(field, value):
+    if field == 'registrar':
+        value = TAG.sub('', value)
+        return value.split(':', 1)[1].strip() if value.lower().startswith('name:') else value
+    if field == 'domain':
+        return value.split()[0].lower().rstrip('.')
+    if field == 'nameservers':
+        # "ns1.example.com 192.0.2.1" and "NS1.EXAMPLE.COM."
+        return value.split()[0].lower().rstrip('.')
+    if field == 'status':
+        # "clientTransferProhibited https://icann.org/epp#clientTransferProhibited"
+        return STATUS_URL.sub('', value)
+    return value
+
+
+class WhoisRecord:
+    # found: False for a "no match" answer, None if nothing could be parsed
+    __slots__ = ('domain', 'found', 'registrar', 'created', 'expires', 'status', 'nameservers')
+
+    def __init__(self, domain=None, found=None, registrar=None, created=None, expires=None,
+                 status=(), nameservers=()):
+        self.domain = domain
+        self.found = found
+        self.registrar = registrar
+        self.created = created
+        self.expires = expires
+        self.status = tuple(status)
+        self.nameservers = tuple(nameservers)
+
+    def days_until_expiry(self, now=None):
+        """Whole days until the registration expires (negative once past), or None."""
+        if self.expires is None:
+            return None
+        return (self.expires - (now or datetime.now(timezone.utc))).days
+
+    def as_dict(self):
+        return {
+            'domain': self.domain,
+            'found': self.found,
+            'registrar': self.registrar,
+            'created': self.created.isoformat() if self.created else None,
+            'expires': self.expires.isoformat() if self.expires else None,
+            'status': list(self.status),
+            'nameservers': list(self.nameservers),
+        }
+
+    def __repr__(self):
+        return f"WhoisRecord({self.domain!r}, expires={self.expires and self.expires.date()})"
+
+
+def parse_whois(text, domain=None):
+    """WhoisRecord from one WHOIS answer; the first value of each field wins."""
+    values = {}
+    lists = {field: [] for field in LIST_FIELDS}
+    for field, value in table_for(domain).fields(text):
+        # python-whois prints lists as "a, b"
+        parts = value.split(', ') if field in LIST_FIELDS else [value]
+        for part in parts:
+            part = _clean(field, part.strip())
+            if not part:
+                continue
+            if field in LIST_FIELDS:
+                if part not in lists[field]:
+                    lists[field].append(part)
+            elif field not in values:
+                parsed = parse_date(part) if field in DATE_FIELDS else part
+                if parsed is not None:
+                    values[field] = parsed
+    # Answers with registration data are never "no match" answers, so only
+    # the others need the slower not-found search. DENIC's "Status: free"
+    # comes with the domain name, so neither counts.
+    if set(values) - {'domain'} or lists['nameservers']:
+        found = True
+    elif is_not_found(text):
+        found = False
+    else:
+        found = True if values or lists['status'] else None
+    return WhoisRecord(domain=values.get('domain', domain), found=found,
+                       registrar=values.get('registrar'), created=values.get('created'),
+                       expires=values.get('expires'), **lists)
+
+
+def parse_response(response):
+    """
+    WhoisRecord from a WhoisResponse. The registry's answer wins; the
+    registrar's fills in what it leaves out.
+    """
+    record = None
+    for _, text in response.chain:
+        if not text.strip():
+            continue
+        parsed = parse_whois(text, response.domain)
+        if record is None:
+            record = parsed
+            continue
+        for field in FIELDS + ('found',):
+            if not getattr(record, field):
+                setattr(record, field, getattr(parsed, field))
+    return record or WhoisRecord(response.domain)
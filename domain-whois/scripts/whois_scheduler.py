@@ -0,0 +1,214 @@
+"""
+Scheduling for bulk WHOIS lookups
+
+Domains are grouped by the registry server that answers for them, and
+each server gets a token bucket: `rate` queries per second on average and
+at most `burst` at once. The dispatcher takes servers in turn, so a long
+run of .com domains cannot hold up the .de ones behind it. Every worker
+stays busy as long as some server has a token, and no server is sent
+more than its bucket allows. A server the client is backing off from
+(after it refused or rate-limited us) is skipped until the back-off ends.
+
+Referrals to registrar servers are not scheduled here. Those queries are
+spread over many registrars and the client's per-server spacing covers
+them.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+DEFAULT_RATE = 2.0
+DEFAULT_BURST = 4
+# Group for domains that need no server: cache hits and invalid names.
+UNLIMITED = None
+
+
+class TokenBucket:
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, now=None):
+        """Seconds until a token is available (0 if one is now)."""
+        now = self.clock() if now is None else now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now=None):
+        """Take a token if there is one; returns whether it was taken."""
+        if self.wait(now) > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class BulkProgress:
+    """Counts for a bulk run, overall and per server."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.started = clock()
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.servers = OrderedDict()
+
+    def _server(self, server):
+        counts = self.servers.get(server)
+        if counts is None:
+            counts = self.servers[server] = {'queued': 0, 'in_flight': 0, 'done': 0, 'failed': 0}
+        return counts
+
+    def queued(self, server):
+        self.total += 1
+        self._server(server)['queued'] += 1
+
+    def dispatched(self, server):
+        self.in_flight += 1
+        counts = self._server(server)
+        counts['queued'] -= 1
+        counts['in_flight'] += 1
+
+    def finished(self, server, ok):
+        self.in_flight -= 1
+        self.done += 1
+        self.failed += not ok
+        counts = self._server(server)
+        counts['in_flight'] -= 1
+        counts['done'] += 1
+        counts['failed'] += not ok
+
+    def snapshot(self):
+        """Counts, elapsed seconds, lookups per second and estimated seconds left."""
+        elapsed = self.clock() - self.started
+        per_second = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.done
+        return {
+            'total': self.total,
+            'done': self.done,
+            'failed': self.failed,
+            'in_flight': self.in_flight,
+            'queued': remaining - self.in_flight,
+            'elapsed': round(elapsed, 3),
+            'per_second': round(per_second, 2),
+            'eta': round(remaining / per_second, 1) if per_second else None,
+            'servers': {server or '-': dict(counts) for server, counts in self.servers.items()},
+        }
+
+    def line(self):
+        """One line for a terminal: "[120/1000] 3 failed, 12.4 lookups/s, eta 71s"."""
+        snap = self.snapshot()
+        eta = f", eta {snap['eta']:.0f}s" if snap['eta'] is not None and snap['done'] < snap['total'] else ''
+        return f"[{snap['done']}/{snap['total']}] {snap['failed']} failed, {snap['per_second']} lookups/s{eta}"
+
+
+class BulkScheduler:
+    def __init__(self, route, workers, rate=DEFAULT_RATE, burst=DEFAULT_BURST, rates=None,
+                 backoff=None, clock=time.monotonic):
+        """
+        route: domain -> server key, or UNLIMITED for domains that need no server
+        workers: lookups in flight at most
+        rate, burst: default token bucket for each server
+        rates: server -> queries per second, for servers that need another rate
+        backoff: server -> seconds the client still holds off that server
+        """
+        self.route = route
+        self.workers = max(1, workers)
+        self.rate = rate
+        self.burst = burst
+        self.rates = rates or {}
+        self.backoff = backoff
+        self.clock = clock
+        self.buckets = {}
+        self.pending = OrderedDict()
+        self.progress = BulkProgress(clock)
+
+    def bucket(self, server):
+        bucket = self.buckets.get(server)
+        if bucket is None:
+            bucket = self.buckets[server] = TokenBucket(self.rates.get(server, self.rate), self.burst, self.clock)
+        return bucket
+
+    def add(self, domain):
+        server = self.route(domain)
+        self.pending.setdefault(server, deque()).append(domain)
+        self.progress.queued(server)
+
+    def _wait(self, server, now):
+        if server is UNLIMITED:
+            return 0.0
+        held_off = self.backoff(server) if self.backoff else 0.0
+        return max(held_off, self.bucket(server).wait(now))
+
+    def _dispatch(self, free):
+        """
+        Up to `free` (server, domain) pairs, taking servers in turn.
+        Returns them and the seconds until a waiting server is ready (None if none is waiting).
+        """
+        picked = []
+        next_ready = None
+        while len(picked) < free and self.pending:
+            now = self.clock()
+            progress = False
+            for server in list(self.pending):
+                if len(picked) >= free:
+                    break
+                wait = self._wait(server, now)
+                if wait > 0:
+                    next_ready = wait if next_ready is None else min(next_ready, wait)
+                    continue
+                if server is not UNLIMITED:
+                    self.bucket(server).take(now)
+                queue = self.pending[server]
+                picked.append((server, queue.popleft()))
+                if queue:
+                    self.pending.move_to_end(server)
+                else:
+                    del self.pending[server]
+                progress = True
+            if not progress:
+                break
+        return picked, next_ready
+
+    async def run(self, lookup):
+        """
+        Run lookup(domain) for every added domain.
+        Yields (server, domain, result or exception, seconds) as lookups complete.
+        """
+        running = {}
+
+        async def one(server, domain):
+            start = time.monotonic()
+            try:
+                result = await lookup(domain)
+            except Exception as e:
+                result = e
+            return server, domain, result, time.monotonic() - start
+
+        try:
+            while self.pending or running:
+                picked, next_ready = self._dispatch(self.workers - len(running))
+                for server, domain in picked:
+                    self.progress.dispatched(server)
+                    running[asyncio.ensure_future(one(server, domain))] = server
+                if not running:
+                    await asyncio.sleep(next_ready or 0)
+                    continue
+                done, _ = await asyncio.wait(running, timeout=next_ready, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    del running[task]
+                    server, domain, result, seconds = task.result()
+                    self.progress.finished(server, not isinstance(result, Exception))
+                    yield server, domain, result, seconds
+        finally:
+            for task in running:
+                task.cancel()
@@ -0,0 +1,497 @@
+"""
+Tests for the domain-whois skill
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+
+SCRIPTS = Path(__file__).resolve().parent / "scripts"
+sys.path.insert(0, str(SCRIPTS))
+
+from stand_in_whois import StandInWhoisServer
+from whois_cache import WhoisCache, is_not_found, normalize_domain
+from whois_client import RateLimitedError, RefusedError, WhoisClient, WhoisError, WhoisResponse, find_referral
+from whois_parser import parse_date, parse_response, parse_whois
+from whois_scheduler import BulkScheduler, TokenBucket
+from whois_lookup import bulk_lookup, lookup_record, parse_bulk_args, read_domains, run_whois
+
+FAKE_WHOIS = """#!/bin/sh
+sleep 0.3
+echo "Domain Name: $1"
+"""
+
+
+class FakeWhoisBinary:
+    """Puts a `whois` that sleeps 0.3 s first on PATH."""
+
+    def __enter__(self):
+        self.dir = tempfile.mkdtemp()
+        path = Path(self.dir) / "whois"
+        path.write_text(FAKE_WHOIS)
+        path.chmod(0o755)
+        self.old_path = os.environ.get("PATH", "")
+        os.environ["PATH"] = f"{self.dir}{os.pathsep}{self.old_path}"
+        return self
+
+    def __exit__(self, *exc):
+        os.environ["PATH"] = self.old_path
+        shutil.rmtree(self.dir)
+
+
+async def collect(generator):
+    return [item async for item in generator]
+
+
+VERISIGN_ANSWER = """   Domain Name: EXAMPLE.COM
+   Registrar WHOIS Server: whois.example-registrar.com
+   Updated Date: 2024-08-14T07:01:34Z
+   Creation Date: 1995-08-14T04:00:00Z
+   Registry Expiry Date: 2025-08-13T04:00:00Z
+   Registrar: Example Registrar, Inc.
+   Domain Status: clientDeleteProhibited https://icann.org/epp#clientDeleteProhibited
+   Domain Status: clientTransferProhibited https://icann.org/epp#clientTransferProhibited
+   Name Server: A.IANA-SERVERS.NET
+   Name Server: B.IANA-SERVERS.NET
+"""
+
+NOMINET_ANSWER = """
+    Domain name:
+        example.co.uk
+
+    Registrar:
+        Example Registrar Ltd [Tag = EXAMPLE]
+        URL: https://registrar.example
+
+    Relevant dates:
+        Registered on: 26-Aug-1996
+        Expiry date:  26-Aug-2026
+
+    Registration status:
+        Registered until expiry date.
+
+    Name servers:
+        ns1.example.co.uk         192.0.2.1
+        ns2.example.co.uk
+"""
+
+JPRS_ANSWER = """[ JPRS database provides information on network administration. ]
+a. [Domain Name]                EXAMPLE.JP
+p. [Name Server]                ns1.example.jp
+p. [Name Server]                ns2.example.jp
+[Created on]                    2001/01/01
+[Expires on]                    2026/01/31
+[Status]                        Active
+"""
+
+PYTHON_WHOIS_OUTPUT = """Domain: example.com
+==================================================
+Domain_Name: EXAMPLE.COM
+Registrar: Example Registrar, Inc.
+Creation_Date: 1995-08-14 04:00:00
+Expiration_Date: 2025-08-13 04:00:00
+Name_Servers: A.IANA-SERVERS.NET, B.IANA-SERVERS.NET
+"""
+
+
+def registrar_records(domains):
+    return {domain: f"Domain Name: {domain.upper()}\nRegistrar: Example Registrar" for domain in domains}
+
+
+class TestWhoisClient(unittest.TestCase):
+    def test_follows_referral_to_registrar(self):
+        with StandInWhoisServer(registrar_records(["example.com"])) as registrar:
+            registry = StandInWhoisServer({"example.com": f"Domain Name: EXAMPLE.COM\n"
+                                                          f"Registrar WHOIS Server: {registrar.address}"})
+            with registry:
+                client = WhoisClient(servers={"com": registry.address}, min_interval=0)
+                response = client.lookup("Example.COM")
+        self.assertEqual([server for server, _ in response.chain], [registry.address, registrar.address])
+        self.assertIn("Registrar: Example Registrar", response.text)
+
+    def test_registrar_failure_keeps_registry_answer(self):
+        with StandInWhoisServer({"example.com": "Domain Name: EXAMPLE.COM\n"
+                                                "Registrar WHOIS Server: 127.0.0.1:9"}) as registry:
+            client = WhoisClient(servers={"com": registry.address}, min_interval=0, timeout=1)
+            response = client.lookup("example.com")
+        self.assertEqual(response.server, registry.address)
+        self.assertIn("EXAMPLE.COM", response.text)
+
+    def test_unknown_tld_asks_iana(self):
+        with StandInWhoisServer(registrar_records(["example.dev"])) as registry:
+            iana = StandInWhoisServer({"dev": f"domain: DEV\nwhois: {registry.address}"})
+            with iana:
+                client = WhoisClient(servers={}, min_interval=0, iana_server=iana.address)
+                client.lookup("example.dev")
+                client.lookup("other.dev")
+        self.assertEqual(iana.queries["dev"], 1)
+        self.assertEqual(client.servers["dev"], registry.address)
+
+    def test_find_referral(self):
+        self.assertEqual(find_referral("   Registrar WHOIS Server: whois.example-registrar.com\n", "whois.verisign-grs.com"),
+                         "whois.example-registrar.com")
+        self.assertIsNone(find_referral("whois: whois.nic.dev\n", "whois.nic.dev"))
+        self.assertIsNone(find_referral("Registrar WHOIS Server: \n", "whois.verisign-grs.com"))
+
+    def test_queries_to_one_server_are_spaced(self):
+        with StandInWhoisServer(registrar_records(["a.com", "b.com", "c.com"])) as registry:
+            client = WhoisClient(servers={"com": registry.address}, min_interval=0.1)
+
+            async def lookups():
+                await asyncio.gather(*(client.lookup_async(d) for d in ["a.com", "b.com", "c.com"]))
+
+            start = time.monotonic()
+            asyncio.run(lookups())
+            self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(registry.max_active, 1)
+
+    def test_rate_limit_backs_off(self):
+        with StandInWhoisServer(registrar_records(["a.com", "b.com"]), rate_limit=(1, 60)) as registry:
+            client = WhoisClient(servers={"com": registry.address}, min_interval=0)
+            client.lookup("a.com")
+            with self.assertRaises(RateLimitedError):
+                client.lookup("b.com")
+        state = client.state(registry.address)
+        self.assertEqual(state.failures, 1)
+        self.assertGreater(state.delay(time.monotonic()), 5)
+
+    def test_refusal_backs_off(self):
+        client = WhoisClient(servers={"com": "127.0.0.1:9"}, min_interval=0)
+        with self.assertRaises(RefusedError):
+            client.lookup("example.com")
+        self.assertGreater(client.state("127.0.0.1:9").delay(time.monotonic()), 5)
+
+    def test_single_lookups_do_not_fall_back_when_throttled(self):
+        """run_whois and lookup_record report a rate limit or refusal instead of running the whois binary"""
+        with StandInWhoisServer(registrar_records(["a.com", "b.com"]), rate_limit=(1, 60)) as registry:
+            client = WhoisClient(servers={"com": registry.address}, min_interval=0)
+            with FakeWhoisBinary():
+                self.assertIn("Domain Name: A.COM", run_whois("a.com", client))
+                with self.assertRaises(RateLimitedError):
+                    run_whois("b.com", client)
+                refused = WhoisClient(servers={"com": "127.0.0.1:9"}, min_interval=0)
+                with self.assertRaises(RefusedError):
+                    lookup_record("b.com", refused)
+        self.assertEqual(registry.rate_limited, 1)
+
+    def test_timeout_per_hop(self):
+        with StandInWhoisServer(registrar_records(["slow.com"]), delay=1) as registry:
+            client = WhoisClient(servers={"com": registry.address}, min_interval=0, timeout=0.1)
+            start = time.monotonic()
+            with self.assertRaises(WhoisError):
+                client.lookup("slow.com")
+            self.assertLess(time.monotonic() - start, 0.5)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = Path(self.dir) / "whois.db"
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_normalize_domain(self):
+        self.assertEqual(normalize_domain(" Example.COM. "), "example.com")
+        self.assertEqual(normalize_domain("München.de"), "xn--mnchen-3ya.de")
+        with self.assertRaises(ValueError):
+            normalize_domain("a..com")
+
+    def test_not_found(self):
+        self.assertTrue(is_not_found('No match for "NOPE.COM".\r\n'))
+        self.assertTrue(is_not_found("Domain Name: nope.de\nStatus: free\n"))
+        self.assertFalse(is_not_found("Domain Name: EXAMPLE.COM\nRegistrar: Example Registrar\n"))
+
+    def test_separate_ttls(self):
+        cache = WhoisCache(self.path, ttl=100, negative_ttl=10, clock=self.clock)
+        cache.put("Example.COM", [("whois.verisign-grs.com", "Domain Name: EXAMPLE.COM")])
+        cache.put("nope.com", [("whois.verisign-grs.com", 'No match for "NOPE.COM".')])
+        self.assertTrue(cache.get("example.com").found)
+        self.assertFalse(cache.get("nope.com").found)
+        self.clock.now += 50
+        self.assertIsNotNone(cache.get("example.com"))
+        self.assertIsNone(cache.get("nope.com"))
+        self.clock.now += 60
+        self.assertIsNone(cache.get("example.com"))
+        self.assertEqual(cache.prune(), 2)
+
+    def test_persists_and_evicts_from_memory(self):
+        cache = WhoisCache(self.path, memory_size=2, clock=self.clock)
+        for domain in ["a.com", "b.com", "c.com"]:
+            cache.put(domain, [("whois.verisign-grs.com", f"Domain Name: {domain}")])
+        self.assertEqual(list(cache.memory), ["b.com", "c.com"])
+        self.assertEqual(cache.get("a.com").text, "Domain Name: a.com")
+        self.assertEqual(list(cache.memory), ["c.com", "a.com"])
+        cache.close()
+        reopened = WhoisCache(self.path, clock=self.clock)
+        self.assertEqual(reopened.get("b.com").servers, ["whois.verisign-grs.com"])
+
+    def test_client_answers_from_cache(self):
+        cache = WhoisCache(self.path, clock=self.clock)
+        with StandInWhoisServer(registrar_records(["example.com"])) as registry:
+            client = WhoisClient(servers={"com": registry.address}, min_interval=0, cache=cache)
+            first = client.lookup("example.com")
+            second = client.lookup("EXAMPLE.com.")
+            client.lookup("nope.com")
+            client.lookup("nope.com")
+        self.assertEqual(registry.queries["example.com"], 1)
+        self.assertEqual(registry.queries["nope.com"], 1)
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual((second.server, second.text), (first.server, first.text))
+        self.assertFalse(cache.get("nope.com").found)
+
+    def test_cached_lookup_parses_like_fresh(self):
+        cache = WhoisCache(":memory:")
+        with StandInWhoisServer({"example.com": "Registrar: Example Registrar, Inc."}) as registrar:
+            registry = StandInWhoisServer({"example.com": VERISIGN_ANSWER.replace(
+                "whois.example-registrar.com", registrar.address)})
+            with registry:
+                client = WhoisClient(servers={"com": registry.address}, min_interval=0, cache=cache)
+                fresh = client.lookup("example.com")
+                cached = client.lookup("example.com")
+        self.assertTrue(cached.cached)
+        self.assertEqual(cached.chain, fresh.chain)
+        record = parse_response(cached)
+        self.assertEqual(record.as_dict(), parse_response(fresh).as_dict())
+        self.assertEqual(record.nameservers, ("a.iana-servers.net", "b.iana-servers.net"))
+
+
+class TestParser(unittest.TestCase):
+    def test_icann_format(self):
+        record = parse_whois(VERISIGN_ANSWER, "example.com")
+        self.assertEqual(record.as_dict(), {
+            "domain": "example.com", "found": True, "registrar": "Example Registrar, Inc.",
+            "created": "1995-08-14T04:00:00+00:00", "expires": "2025-08-13T04:00:00+00:00",
+            "status": ["clientDeleteProhibited", "clientTransferProhibited"],
+            "nameservers": ["a.iana-servers.net", "b.iana-servers.net"]})
+        self.assertEqual(record.days_until_expiry(datetime(2025, 8, 1, tzinfo=timezone.utc)), 12)
+
+    def test_tld_formats(self):
+        uk = parse_whois(NOMINET_ANSWER, "example.co.uk")
+        self.assertEqual((uk.domain, uk.registrar), ("example.co.uk", "Example Registrar Ltd"))
+        self.assertEqual(uk.expires, datetime(2026, 8, 26, tzinfo=timezone.utc))
+        self.assertEqual(uk.status, ("Registered until expiry date.",))
+        self.assertEqual(uk.nameservers, ("ns1.example.co.uk", "ns2.example.co.uk"))
+        jp = parse_whois(JPRS_ANSWER, "example.jp")
+        self.assertEqual((jp.domain, jp.created.date().isoformat(), jp.status), ("example.jp", "2001-01-01", ("Active",)))
+        self.assertEqual(jp.nameservers, ("ns1.example.jp", "ns2.example.jp"))
+        fallback = parse_whois(PYTHON_WHOIS_OUTPUT, "example.com")
+        self.assertEqual(fallback.expires, datetime(2025, 8, 13, 4, tzinfo=timezone.utc))
+        self.assertEqual(fallback.nameservers, ("a.iana-servers.net", "b.iana-servers.net"))
+
+    def test_not_found_and_unparsed(self):
+        self.assertIs(parse_whois('No match for "NOPE.COM".', "nope.com").found, False)
+        self.assertIs(parse_whois("Domain: nope.de\nStatus: free\n", "nope.de").found, False)
+        self.assertIsNone(parse_whois("Whois command not found on this system", "example.com").found)
+
+    def test_parse_date(self):
+        expected = datetime(2025, 8, 13, 4, tzinfo=timezone.utc)
+        for value in ["2025-08-13T04:00:00Z", "2025-08-13T06:00:00+02:00", "2025-08-13 04:00:00",
+                      "2025-08-13T04:00:00.000+0000"]:
+            self.assertEqual(parse_date(value), expected, value)
+        self.assertEqual(parse_date("13-Aug-2025"), datetime(2025, 8, 13, tzinfo=timezone.utc))
+        self.assertEqual(parse_date("20250813"), datetime(2025, 8, 13, tzinfo=timezone.utc))
+        self.assertIsNone(parse_date("never"))
+
+    def test_registry_answer_wins(self):
+        registrar = "Domain Name: example.com\nRegistrar Registration Expiration Date: 2025-09-01T00:00:00Z\n" \
+                    "Registrar Abuse Contact Email: abuse@registrar.example\n"
+        record = parse_response(WhoisResponse("example.com", [("whois.verisign-grs.com", 'No data\n'),
+                                                              ("whois.example-registrar.com", registrar)]))
+        self.assertEqual(record.expires, datetime(2025, 9, 1, tzinfo=timezone.utc))
+        record = parse_response(WhoisResponse("example.com", [("whois.verisign-grs.com", VERISIGN_ANSWER),
+                                                              ("whois.example-registrar.com", registrar)]))
+        self.assertEqual(record.expires, datetime(2025, 8, 13, 4, tzinfo=timezone.utc))
+
+
+class TestScheduler(unittest.TestCase):
+    def test_token_bucket(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=2, clock=clock)
+        self.assertTrue(bucket.take())
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+        self.assertAlmostEqual(bucket.wait(), 0.5)
+        clock.now += 0.5
+        self.assertTrue(bucket.take())
+        clock.now += 10
+        self.assertAlmostEqual(bucket.wait(), 0)
+        self.assertEqual(bucket.tokens, 2)
+
+    def run_scheduler(self, scheduler, seconds=0.0):
+        started = []
+
+        async def lookup(domain):
+            started.append((domain, time.monotonic()))
+            await asyncio.sleep(seconds)
+            return domain
+
+        results = asyncio.run(collect(scheduler.run(lookup)))
+        return started, results
+
+    def test_servers_are_interleaved(self):
+        scheduler = BulkScheduler(lambda d: d[0], workers=1, rate=1000, burst=10)
+        for domain in ["a1", "a2", "a3", "a4", "b1", "b2"]:
+            scheduler.add(domain)
+        started, _ = self.run_scheduler(scheduler)
+        self.assertEqual([d for d, _ in started], ["a1", "b1", "a2", "b2", "a3", "a4"])
+
+    def test_slow_server_does_not_hold_up_others(self):
+        """One query per 0.1 s to "s"; "f" is done while "s" still waits"""
+        scheduler = BulkScheduler(lambda d: d[0], workers=4, rate=1000, burst=1, rates={"s": 10})
+        for domain in ["s1", "s2", "s3", "s4", "f1", "f2", "f3", "f4"]:
+            scheduler.add(domain)
+        started, results = self.run_scheduler(scheduler, seconds=0.01)
+        times = dict(started)
+        self.assertEqual(len(results), 8)
+        self.assertLess(max(times[f"f{i}"] for i in range(1, 5)), times["s2"])
+        gaps = [times[f"s{i + 1}"] - times[f"s{i}"] for i in range(1, 4)]
+        self.assertTrue(all(gap >= 0.09 for gap in gaps), gaps)
+        snapshot = scheduler.progress.snapshot()
+        self.assertEqual((snapshot["done"], snapshot["queued"], snapshot["in_flight"]), (8, 0, 0))
+        self.assertEqual(snapshot["servers"]["s"]["done"], 4)
+        self.assertGreater(snapshot["per_second"], 0)
+
+    def test_backoff_is_respected(self):
+        until = time.monotonic() + 0.2
+        scheduler = BulkScheduler(lambda d: d[0], workers=2, rate=1000,
+                                  backoff=lambda server: max(0.0, until - time.monotonic()) if server == "x" else 0)
+        scheduler.add("x1")
+        scheduler.add("y1")
+        started, _ = self.run_scheduler(scheduler)
+        self.assertEqual(started[0][0], "y1")
+        self.assertGreaterEqual(started[1][1], until)
+
+
+class TestBulk(unittest.TestCase):
+    def test_read_domains(self):
+        """Arguments, files and stdin are merged; comments and repeats are dropped"""
+        stdin = io.StringIO("Example.COM\n# portfolio\nexample.net.  # parked\n\n")
+        self.assertEqual(list(read_domains(["example.com", "example.org"], ["-"], stdin)),
+                         ["example.com", "example.org", "example.net"])
+
+    def test_bulk_args(self):
+        """--server and --server-rate are checked by argparse"""
+        args = parse_bulk_args(["--server", "COM=127.0.0.1:4343", "--server-rate", "whois.denic.de=0.5", "a.com"])
+        self.assertEqual(args.server, [("com", "127.0.0.1:4343")])
+        self.assertEqual(args.server_rate, [("whois.denic.de", 0.5)])
+        for bad in (["--server", "com"], ["--server", "com=host:port"], ["--server-rate", "x"],
+                    ["--server-rate", "whois.denic.de=0"], ["--rate", "0"]):
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()) as stderr:
+                parse_bulk_args(bad + ["a.com"])
+            self.assertIn("error: argument", stderr.getvalue())
+
+    def test_lookups_run_concurrently(self):
+        """Ten 0.3 s lookups over five workers take about two rounds"""
+        domains = [f"site{i}.com" for i in range(10)] + ["bad domain"]
+        with StandInWhoisServer(registrar_records(domains), delay=0.3) as registry:
+            client = WhoisClient(servers={"com": registry.address}, min_interval=0)
+            start = time.monotonic()
+            results = asyncio.run(collect(bulk_lookup(domains, workers=5, timeout=5, client=client, rate=100, burst=10)))
+            elapsed = time.monotonic() - start
+        self.assertLess(elapsed, 1.2)
+        self.assertEqual(sorted(r["domain"] for r in results), sorted(domains))
+        by_domain = {r["domain"]: r for r in results}
+        self.assertIn("Domain Name: SITE3.COM", by_domain["site3.com"]["output"])
+        self.assertFalse(by_domain["bad domain"]["ok"])
+        self.assertIn("Invalid domain format", by_domain["bad domain"]["error"])
+
+    def test_timeout(self):
+        with StandInWhoisServer(registrar_records(["slow.com"]), delay=1) as registry:
+            client = WhoisClient(servers={"com": registry.address}, min_interval=0)
+            results = asyncio.run(collect(bulk_lookup(["slow.com"], timeout=0.05, client=client)))
+        self.assertFalse(results[0]["ok"])
+        self.assertIn("timed out", results[0]["error"])
+
+    def test_falls_back_to_whois_command(self):
+        """A TLD no server is known for hands over to the whois binary"""
+        with StandInWhoisServer({}) as iana:
+            client = WhoisClient(servers={}, min_interval=0, timeout=1, iana_server=iana.address)
+            with FakeWhoisBinary():
+                results = asyncio.run(collect(bulk_lookup(["example.com"], timeout=5, client=client)))
+        self.assertEqual(results[0]["output"].strip(), "Domain Name: example.com")
+
+    def test_throttled_lookups_do_not_fall_back(self):
+        """Rate limits and refusals are reported, not retried through the whois binary"""
+        with StandInWhoisServer(registrar_records(["s1.com", "s2.com"]), rate_limit=(1, 60)) as registry:
+            client = WhoisClient(servers={"com": registry.address, "net": "127.0.0.1:9"}, min_interval=0)
+            with FakeWhoisBinary():
+                results = asyncio.run(collect(bulk_lookup(["s1.com", "s2.com", "s3.net"], timeout=2,
+                                                          client=client, rate=100)))
+        answered = [r["output"] for r in results if r["ok"]]
+        self.assertEqual(len(answered), 1)
+        self.assertIn("Registrar: Example Registrar", answered[0])
+        failed = {r["domain"]: r["error"] for r in results if not r["ok"]}
+        self.assertIn("refused", failed.pop("s3.net"))
+        self.assertEqual(len(failed), 1)
+        self.assertIn("rate limiting us", *failed.values())
+        self.assertEqual(registry.rate_limited, 1)
+
+    def test_cli_streams_jsonl(self):
+        with StandInWhoisServer(registrar_records(["a.com", "b.com", "c.com"])) as registry:
+            result = subprocess.run([sys.executable, str(SCRIPTS / "whois_lookup.py"), "--bulk", "--workers", "4",
+                                     "--server", f"com={registry.address}", "--no-cache"],
+                                    input="a.com\nb.com\nc.com\n", capture_output=True, text=True, timeout=10)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        lines = [json.loads(line) for line in result.stdout.splitlines()]
+        self.assertEqual(sorted(line["domain"] for line in lines), ["a.com", "b.com", "c.com"])
+        self.assertTrue(all(line["ok"] for line in lines))
+
+    def test_grouped_by_registry_with_progress(self):
+        domains = ["a.com", "b.com", "c.net", "bad domain"]
+        updates = []
+        with StandInWhoisServer(registrar_records(domains)) as com, StandInWhoisServer(registrar_records(domains)) as net:
+            client = WhoisClient(servers={"com": com.address, "net": net.address}, min_interval=0)
+            results = asyncio.run(collect(bulk_lookup(domains, client=client, rate=100,
+                                                      progress=lambda p: updates.append(p.snapshot()))))
+        servers = {r["domain"]: r["server"] for r in results}
+        self.assertEqual(servers, {"a.com": com.address, "b.com": com.address, "c.net": net.address,
+                                   "bad domain": None})
+        self.assertEqual([u["done"] for u in updates], [1, 2, 3, 4])
+        self.assertEqual(updates[-1]["failed"], 1)
+        self.assertEqual(updates[-1]["servers"][com.address]["done"], 2)
+
+    def test_parsed_records(self):
+        with StandInWhoisServer({"example.com": VERISIGN_ANSWER}) as registry:
+            client = WhoisClient(servers={"com": registry.address}, min_interval=0, max_hops=1)
+            results = asyncio.run(collect(bulk_lookup(["example.com"], client=client, parse=True)))
+        self.assertEqual(results[0]["record"]["expires"], "2025-08-13T04:00:00+00:00")
+
+    def test_parsed_records_keep_registry_fields(self):
+        """A thin registrar answer does not hide what the registry said"""
+        with StandInWhoisServer({"example.com": "Registrar: Example Registrar, Inc."}) as registrar:
+            registry = StandInWhoisServer({"example.com": VERISIGN_ANSWER.replace(
+                "whois.example-registrar.com", registrar.address)})
+            with registry:
+                client = WhoisClient(servers={"com": registry.address}, min_interval=0,
+                                     cache=WhoisCache(":memory:"))
+                results = [asyncio.run(collect(bulk_lookup(["example.com"], client=client, parse=True)))[0]
+                           for _ in range(2)]
+        self.assertEqual(registry.queries["example.com"], 1)
+        self.assertEqual(results[0]["output"].strip(), "Registrar: Example Registrar, Inc.")
+        for result in results:
+            self.assertEqual(result["record"]["expires"], "2025-08-13T04:00:00+00:00")
+            self.assertEqual(result["record"]["nameservers"], ["a.iana-servers.net", "b.iana-servers.net"])
+
+
+if __name__ == "__main__":
+    unittest.main()
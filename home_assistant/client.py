@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Tiny client for the Home Assistant daemon (daemon.py).
+
+Takes the same arguments as cli.py but only imports the standard library,
+so a command costs a socket round-trip instead of a Python start-up with
+requests. If no daemon is listening, it falls back to running cli.py.
+"""
+
+import json
+import os
+import socket
+import sys
+
+USAGE = "Usage: home_assistant_skill.py <action> [args]"
+
+
+def socket_path():
+    if os.environ.get('HOME_ASSISTANT_SOCKET'):
+        return os.environ['HOME_ASSISTANT_SOCKET']
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+    return os.path.join(runtime_dir, f'home_assistant-{os.getuid()}.sock')
+
+
+def send(request, path=None, timeout=60):
+    """Send one request to the daemon and return its decoded reply."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path or socket_path())
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as reply:
+            line = reply.readline()
+    if not line:
+        raise ConnectionError('Daemon closed the connection without replying')
+    return json.loads(line)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(USAGE)
+        sys.exit(1)
+
+    try:
+        reply = send({'action': sys.argv[1], 'args': sys.argv[2:]})
+    except (FileNotFoundError, ConnectionRefusedError):
+        cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+        os.execv(sys.executable, [sys.executable, cli] + sys.argv[1:])
+
+    print(reply['output'])
+    sys.exit(0 if reply['ok'] else 1)
+
+
+if __name__ == "__main__":
+    main()
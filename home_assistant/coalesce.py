@@ -0,0 +1,152 @@
+"""
+Per-entity command coalescing.
+
+Dragging a brightness slider produces a burst of light.turn_on calls for the
+same entity. Instead of sending each one, changes are held for a short
+window; a newer change for the same entity and service is merged into the
+pending one (later attributes win) and only the merged call is sent. The
+earlier requests are marked as superseded by the one that was sent.
+
+A single worker thread serves every entity.
+"""
+
+import itertools
+import threading
+import time
+
+DEFAULT_WINDOW = 0.15
+# A steady stream of changes keeps pushing the deadline back; never hold a
+# pending change for longer than this many windows.
+MAX_WINDOWS = 4
+
+
+class Ticket:
+    __slots__ = ('id', 'entity_id', 'superseded_by', '_done', '_result', '_error')
+
+    def __init__(self, ticket_id, entity_id):
+        self.id = ticket_id
+        self.entity_id = entity_id
+        self.superseded_by = None
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+    @property
+    def superseded(self):
+        return self.superseded_by is not None
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError(f'Request #{self.id} for {self.entity_id} is still pending')
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def _resolve(self, result=None, error=None):
+        self._result = result
+        self._error = error
+        self._done.set()
+
+
+class _Pending:
+    __slots__ = ('domain', 'service', 'data', 'tickets', 'first_at', 'deadline')
+
+    def __init__(self, domain, service, data, now, window):
+        self.domain = domain
+        self.service = service
+        self.data = dict(data or {})
+        self.tickets = []
+        self.first_at = now
+        self.deadline = now + window
+
+
+class Coalescer:
+    def __init__(self, send, window=DEFAULT_WINDOW):
+        """
+        Args:
+            send: callable(domain, service, entity_id, data) that performs the call
+            window: seconds to wait for further changes to the same entity
+        """
+        self.send = send
+        self.window = window
+        self.sent = 0
+        self.superseded = 0
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='coalescer', daemon=True)
+        self._worker.start()
+
+    def submit(self, domain, service, entity_id, data=None):
+        now = time.monotonic()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('Coalescer is closed')
+            ticket = Ticket(next(self._ids), entity_id)
+            pending = self._pending.get(entity_id)
+            if pending is not None and (pending.domain, pending.service) == (domain, service):
+                pending.data.update(data or {})
+                pending.deadline = min(now + self.window, pending.first_at + self.window * MAX_WINDOWS)
+            else:
+                # A different service (turn_off after turn_on) replaces whatever
+                # was pending: only the latest requested state matters.
+                previous = pending
+                pending = _Pending(domain, service, data, now, self.window)
+                if previous is not None:
+                    pending.tickets = previous.tickets
+                self._pending[entity_id] = pending
+            pending.tickets.append(ticket)
+            self._cond.notify()
+        return ticket
+
+    def flush(self):
+        """Send everything that is pending now, without waiting for the window."""
+        with self._cond:
+            for pending in self._pending.values():
+                pending.deadline = 0
+            self._cond.notify()
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+
+    def stats(self):
+        with self._cond:
+            return {'sent': self.sent, 'superseded': self.superseded, 'pending': len(self._pending)}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    due = [entity_id for entity_id, pending in self._pending.items() if pending.deadline <= now]
+                    if due:
+                        batch = [(entity_id, self._pending.pop(entity_id)) for entity_id in due]
+                        break
+                    if self._closed:
+                        return
+                    timeout = min((p.deadline for p in self._pending.values()), default=now + 1) - now
+                    self._cond.wait(timeout)
+            for entity_id, pending in batch:
+                self._dispatch(entity_id, pending)
+
+    def _dispatch(self, entity_id, pending):
+        winner = pending.tickets[-1]
+        try:
+            result, error = self.send(pending.domain, pending.service, entity_id, pending.data), None
+        except Exception as e:
+            result, error = None, e
+        with self._cond:
+            self.sent += 1
+            self.superseded += len(pending.tickets) - 1
+        for ticket in pending.tickets[:-1]:
+            ticket.superseded_by = winner.id
+            ticket._resolve(result, error)
+        winner._resolve(result, error)
@@ -0,0 +1,262 @@
+"""
+Durable queue for commands that should not make the caller wait.
+
+Queued commands are rows in a SQLite file, so they survive a restart of the
+daemon (or of the machine) and can be added by a one-shot cli.py while the
+daemon drains them. A small pool of worker threads runs them; failures that
+look temporary (connection errors, timeouts, 5xx) are retried with
+exponential backoff and jitter, anything else (4xx, validation errors) fails
+for good. The first success after an outage makes every backed-off command
+due again, so the queue drains at full rate once Home Assistant is back.
+
+Commands in the same lane (usually one device) run one at a time in the
+order they were queued; a retry holds back later commands in its lane.
+"""
+
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger('home_assistant.queue')
+
+DEFAULT_WORKERS = 4
+BASE_DELAY = 1.0
+MAX_DELAY = 300.0
+MAX_ATTEMPTS = 20
+# Upper bound on how long an idle worker sleeps, so rows added by other
+# processes are picked up without a notification.
+POLL_INTERVAL = 5.0
+# Finished rows are kept this long for `queue` status and idempotency.
+KEEP_FINISHED = 7 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    lane TEXT,
+    action TEXT NOT NULL,
+    args TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    output TEXT
+);
+CREATE INDEX IF NOT EXISTS commands_status ON commands (status, next_attempt);
+CREATE INDEX IF NOT EXISTS commands_lane ON commands (lane, status);
+"""
+
+# The oldest due command whose lane has nothing older still waiting.
+_CLAIM = """
+SELECT * FROM commands AS c
+WHERE status = 'pending' AND next_attempt <= ?
+  AND (lane IS NULL OR NOT EXISTS (
+      SELECT 1 FROM commands AS o
+      WHERE o.lane = c.lane AND o.id < c.id AND o.status IN ('pending', 'running')))
+ORDER BY id LIMIT 1
+"""
+
+
+def is_transient(exc):
+    """True for errors worth retrying: no answer, a timeout, or a 5xx/429."""
+    response = getattr(exc, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is not None:
+        return status >= 500 or status in (408, 429)
+    # requests' ConnectionError and Timeout are OSErrors as well.
+    return isinstance(exc, OSError)
+
+
+def backoff(attempts, base=BASE_DELAY, maximum=MAX_DELAY):
+    """Delay before the next try after `attempts` failures, with jitter."""
+    delay = min(maximum, base * 2 ** (attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+
+class CommandQueue:
+    def __init__(self, path, execute=None, workers=DEFAULT_WORKERS, base_delay=BASE_DELAY,
+                 max_delay=MAX_DELAY, max_attempts=MAX_ATTEMPTS, classify=is_transient):
+        """
+        Args:
+            path: SQLite file holding the queue
+            execute: callable(action, args) returning the command output
+                (only needed by processes that run workers)
+            workers: number of worker threads started by start()
+            base_delay: seconds before the first retry; doubles every failure
+            max_delay: cap on the retry delay
+            max_attempts: tries before a transient failure becomes permanent
+            classify: callable(exception) -> True if the command should be retried
+        """
+        self.path = path
+        self.execute = execute
+        self.workers = workers
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.classify = classify
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._closed = False
+        self._outage = False
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._db() as db:
+            db.executescript(SCHEMA)
+
+    def _db(self):
+        # One connection per thread; autocommit, with explicit transactions
+        # where a read and a write must not interleave with other workers.
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+        return db
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['args'] = json.loads(job['args'])
+        return job
+
+    def enqueue(self, action, args=(), key=None, lane=None):
+        """
+        Queue a command and return (job, created). A key that was queued
+        before returns the existing job with created False, so a retried
+        request is never run twice.
+        """
+        key = key or uuid.uuid4().hex
+        now = time.time()
+        db = self._db()
+        cursor = db.execute(
+            'INSERT INTO commands (key, lane, action, args, next_attempt, created, updated) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO NOTHING',
+            (key, lane, action, json.dumps(list(args)), now, now, now))
+        created = cursor.rowcount == 1
+        if created:
+            with self._cond:
+                self._cond.notify()
+        return self._job(db.execute('SELECT * FROM commands WHERE key = ?', (key,)).fetchone()), created
+
+    def get(self, id_or_key):
+        db = self._db()
+        row = None
+        if str(id_or_key).isdigit():
+            row = db.execute('SELECT * FROM commands WHERE id = ?', (int(id_or_key),)).fetchone()
+        if row is None:
+            row = db.execute('SELECT * FROM commands WHERE key = ?', (str(id_or_key),)).fetchone()
+        return self._job(row)
+
+    def counts(self):
+        rows = self._db().execute('SELECT status, COUNT(*) FROM commands GROUP BY status')
+        return {status: count for status, count in rows}
+
+    def recent(self, limit=10):
+        rows = self._db().execute('SELECT * FROM commands ORDER BY id DESC LIMIT ?', (limit,))
+        return [self._job(row) for row in rows]
+
+    def start(self):
+        """Recover interrupted commands and start the worker threads."""
+        now = time.time()
+        db = self._db()
+        # Commands that were running when the previous process died are
+        # run again; Home Assistant services are safe to repeat.
+        db.execute("UPDATE commands SET status = 'pending', next_attempt = ?, updated = ? "
+                   "WHERE status = 'running'", (now, now))
+        db.execute("DELETE FROM commands WHERE status IN ('done', 'failed') AND updated < ?",
+                   (now - KEEP_FINISHED,))
+        self._closed = False
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'queue-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def close(self, timeout=5):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _claim(self):
+        db = self._db()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(_CLAIM, (now,)).fetchone()
+            if row is not None:
+                db.execute("UPDATE commands SET status = 'running', attempts = attempts + 1, updated = ? "
+                           "WHERE id = ?", (now, row['id']))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        job = self._job(row)
+        if job is not None:
+            job['attempts'] += 1
+        return job
+
+    def _idle_timeout(self):
+        row = self._db().execute("SELECT MIN(next_attempt) FROM commands WHERE status = 'pending'").fetchone()
+        if row[0] is None:
+            return POLL_INTERVAL
+        return max(0.0, min(POLL_INTERVAL, row[0] - time.time()))
+
+    def _work(self):
+        try:
+            while not self._closed:
+                job = self._claim()
+                if job is None:
+                    timeout = self._idle_timeout()
+                    with self._cond:
+                        if not self._closed:
+                            self._cond.wait(timeout)
+                    continue
+                self._run(job)
+        finally:
+            db = getattr(self._local, 'db', None)
+            if db is not None:
+                db.close()
+
+    def _finish(self, job, status, output, next_attempt=None):
+        now = time.time()
+        self._db().execute(
+            'UPDATE commands SET status = ?, output = ?, next_attempt = ?, updated = ? WHERE id = ?',
+            (status, output, next_attempt or now, now, job['id']))
+        with self._cond:
+            # The next command in this lane may be runnable now.
+            self._cond.notify_all()
+
+    def _run(self, job):
+        try:
+            output = self.execute(job['action'], job['args'])
+        except Exception as e:
+            if self.classify(e) and job['attempts'] < self.max_attempts:
+                delay = backoff(job['attempts'], self.base_delay, self.max_delay)
+                logger.info('Command #%d %s failed (%s), retrying in %.1fs', job['id'], job['action'], e, delay)
+                self._outage = True
+                self._finish(job, 'pending', str(e), time.time() + delay)
+            else:
+                logger.warning('Command #%d %s failed: %s', job['id'], job['action'], e)
+                self._finish(job, 'failed', str(e))
+            return
+
+        if self._outage:
+            # Home Assistant answers again: stop waiting out the backoff.
+            self._outage = False
+            now = time.time()
+            self._db().execute("UPDATE commands SET next_attempt = ? WHERE status = 'pending' AND next_attempt > ?",
+                               (now, now))
+            logger.info('Command #%d succeeded, draining the queue', job['id'])
+        self._finish(job, 'done', output)
@@ -0,0 +1,433 @@
+"""
+Command table shared by cli.py and the daemon. Each command takes the
+argument list after the action name and returns the text to show the user.
+"""
+
+import json
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+from main import turn_on_light, turn_off_light, toggle_light, get_light_state, set_brightness, call_home_assistant, get_papa_light_entity_id
+from main import PAPA_LIGHT, call_service, find_entity_id, get_entity_index, get_service_registry, get_state_cache, load_config
+from coalesce import Coalescer
+from command_queue import DEFAULT_WORKERS, CommandQueue
+from intents import CACHE_DIR, dispatch
+from fuzzy import resolve
+from scheduler import Scheduler, parse_duration, parse_time
+from tracing import format_stats, span, stats, stats_from_file, trace_path
+
+# Set by enable_coalescing() in long-running processes (the daemon); a
+# one-shot cli.py run has nothing to coalesce with.
+_coalescer = None
+# Opened on first use; the daemon starts its workers with enable_queue().
+_command_queue = None
+
+# Started by enable_scheduler() in the daemon; schedules live in its memory.
+_scheduler = None
+
+QUEUE_PATH = CACHE_DIR / 'commands.db'
+# Commands that change something; reads are never worth queueing.
+QUEUEABLE = ("turn_on", "turn_off", "toggle", "set_brightness", "say", "call")
+SCHEDULABLE = ("turn_on", "turn_off", "toggle", "set_brightness", "say", "call", "fade")
+
+# domain -> (service, field) used to fade a device of that domain.
+FADES = {
+    "light": ("turn_on", "brightness_pct"),
+    "cover": ("set_cover_position", "position"),
+    "climate": ("set_temperature", "temperature"),
+    "fan": ("set_percentage", "percentage"),
+}
+# Intents whose slot value can be faded, and the value turn_on/off fade to.
+_FADE_INTENTS = {
+    "set_brightness": ("brightness", None),
+    "turn_on_light": (None, 100),
+    "turn_off_light": (None, 0),
+    "set_cover_position": ("position", None),
+    "set_temperature": ("temperature", None),
+    "set_fan_speed": ("percentage", None),
+}
+# "... at 23:00", "... in 10 minutes", "... gradually over 10 minutes"
+_WHEN_SUFFIX = re.compile(r'\s+(?:(at \d{1,2}:\d{2})|(in \d.*?)|(?:(?:gradually|slowly) )?over (\d.*?))\s*$', re.IGNORECASE)
+
+
+class CommandError(Exception):
+    """Bad usage or an utterance that could not be understood."""
+
+
+def _turn_on(args):
+    brightness = int(args[0]) if args else None
+    result = turn_on_light(brightness_pct=brightness)
+    return f"Turned on light: {result}"
+
+
+def _turn_off(args):
+    result = turn_off_light()
+    return f"Turned off light: {result}"
+
+
+def _toggle(args):
+    result = toggle_light()
+    return f"Toggled light: {result}"
+
+
+def _status(args):
+    state = get_light_state()
+    return f"Light state: {state}"
+
+
+def _set_brightness(args):
+    if not args:
+        raise CommandError("Usage: home_assistant_skill.py set_brightness <value>")
+    brightness = int(args[0])
+    if _coalescer is None:
+        result = set_brightness(brightness)
+        return f"Set brightness to {brightness}%: {result}"
+
+    entity_id = get_papa_light_entity_id()
+    if not entity_id:
+        result = {'error': 'Papa light entity not found'}
+        return f"Set brightness to {brightness}%: {result}"
+    data = {'brightness_pct': brightness}
+    # The coalescer sends straight to Home Assistant, so validate as call_service would.
+    get_service_registry().validate('light', 'turn_on', data)
+    ticket = _coalescer.submit('light', 'turn_on', entity_id, data)
+    result = ticket.result()
+    if ticket.superseded:
+        return f"Set brightness to {brightness}%: superseded by request #{ticket.superseded_by}"
+    return f"Set brightness to {brightness}%: {result}"
+
+
+def _split_timing(text):
+    """Strip "at 23:00" / "in 10 minutes" / "over 10 minutes" off an utterance."""
+    when = over = None
+    while True:
+        suffix = _WHEN_SUFFIX.search(text)
+        if suffix is None:
+            return text, when, over
+        try:
+            if suffix.group(3):
+                over = over if over is not None else parse_duration(suffix.group(3))
+            else:
+                when = when if when is not None else parse_time(suffix.group(1) or suffix.group(2))
+        except ValueError:
+            return text, when, over
+        text = text[:suffix.start()]
+
+
+def _say(args):
+    if not args:
+        raise CommandError("Usage: home_assistant_skill.py say <utterance>")
+    text = " ".join(args)
+    utterance, when, over = _split_timing(text)
+    if when is not None or over is not None:
+        return _schedule_utterance(utterance, when, over)
+    match = resolve(text)
+    if match is None:
+        raise CommandError(f"No intent matched: {text}")
+    result = dispatch(match)
+    return f"{match.intent} {match.slots}: {result}"
+
+
+def _parse_value(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def _call(args):
+    if len(args) < 2:
+        raise CommandError("Usage: home_assistant_skill.py call <domain> <service> [target] [field=value ...]")
+    domain, service, rest = args[0], args[1], args[2:]
+    target = None
+    if rest and '=' not in rest[0]:
+        target, rest = rest[0], rest[1:]
+    data = {}
+    for field in rest:
+        name, _, value = field.partition('=')
+        data[name] = _parse_value(value)
+    result = call_service(domain, service, target, data)
+    return f"Called {domain}.{service}: {result}"
+
+
+def _devices(args):
+    domain = args[0] if args else None
+    cache = get_state_cache()
+    lines = []
+    for entity_id in sorted(get_entity_index().entity_ids(cache, domain)):
+        state = cache.get(entity_id) or {}
+        name = (state.get('attributes') or {}).get('friendly_name', '')
+        lines.append(f"{entity_id}\t{state.get('state')}\t{name}".rstrip())
+    return "\n".join(lines) or "No devices found"
+
+
+def _stats(args):
+    # A one-shot cli.py has no history in memory; read the trace file if
+    # one is configured. The daemon answers from its own histograms.
+    if trace_path() and (not stats() or args[:1] == ['file']):
+        return format_stats(stats_from_file(trace_path()))
+    return format_stats(stats())
+
+
+def _lane(action, args):
+    # Commands for the same device must not overtake each other.
+    if action == "call":
+        return args[2] if len(args) > 2 and '=' not in args[2] else f"{args[0]}.{args[1]}"
+    if action == "say":
+        match = resolve(" ".join(args))
+        if match is None:
+            raise CommandError(f"No intent matched: {' '.join(args)}")
+        return match.slots.get('device', PAPA_LIGHT)
+    return PAPA_LIGHT
+
+
+def _format_job(job):
+    line = f"#{job['id']} {job['action']} {' '.join(job['args'])}".rstrip()
+    line += f": {job['status']}"
+    if job['status'] == 'pending' and job['attempts']:
+        line += f" (attempt {job['attempts']} failed: {job['output']})"
+    elif job['output']:
+        line += f" - {job['output']}"
+    return line
+
+
+def _queue(args):
+    usage = "Usage: home_assistant_skill.py queue [--key KEY] <action> [args] | queue status [id|key]"
+    queue = get_command_queue()
+    if not args:
+        counts = queue.counts()
+        summary = ", ".join(f"{counts.get(status, 0)} {status}" for status in ("pending", "running", "done", "failed"))
+        return "\n".join([f"Queue: {summary}"] + [_format_job(job) for job in queue.recent()])
+    if args[0] == "status":
+        if len(args) != 2:
+            raise CommandError(usage)
+        job = queue.get(args[1])
+        if job is None:
+            raise CommandError(f"No queued command {args[1]}")
+        return _format_job(job)
+
+    key = None
+    if args[0] == "--key":
+        if len(args) < 3:
+            raise CommandError(usage)
+        key, args = args[1], args[2:]
+    action, rest = args[0], args[1:]
+    if action not in QUEUEABLE:
+        raise CommandError(f"Cannot queue {action}; queueable actions: {', '.join(QUEUEABLE)}")
+    if action in ("say", "call", "set_brightness") and not rest:
+        raise CommandError(usage)
+    if action == "call" and len(rest) < 2:
+        raise CommandError(usage)
+    job, created = queue.enqueue(action, rest, key=key, lane=_lane(action, rest))
+    if not created:
+        return f"Already queued as #{job['id']}: {job['status']}"
+    return f"Queued #{job['id']}: {action} {' '.join(rest)}".rstrip()
+
+
+def _get_scheduler():
+    if _scheduler is None:
+        raise CommandError("Scheduling needs the daemon: start daemon.py and use client.py")
+    return _scheduler
+
+
+def _format_when(when):
+    moment = datetime.fromtimestamp(when)
+    if moment.date() == datetime.now().date():
+        return moment.strftime("%H:%M:%S")
+    return moment.strftime("%Y-%m-%d %H:%M")
+
+
+def _resolve(target, domain=None):
+    entity_id = find_entity_id(target, domain)
+    if entity_id is None:
+        raise CommandError(f"No {domain or 'device'} found matching '{target}'")
+    return entity_id
+
+
+def _papa_light_id():
+    entity_id = get_papa_light_entity_id()
+    if entity_id is None:
+        raise CommandError("Papa light entity not found")
+    return entity_id
+
+
+def _current_value(entity_id, field):
+    state = get_state_cache().get(entity_id)
+    if state is None:
+        return None
+    attributes = state.get('attributes') or {}
+    if field == "brightness_pct":
+        if state.get('state') != 'on':
+            return 0
+        return round((attributes.get('brightness') or 0) * 100 / 255)
+    if field == "position":
+        return attributes.get('current_position')
+    return attributes.get(field)
+
+
+def _schedule_fade(when, entity_id, value, duration):
+    domain = entity_id.split('.', 1)[0]
+    if domain not in FADES:
+        raise CommandError(f"Cannot fade {entity_id}; fading works for {', '.join(FADES)}")
+    service, field = FADES[domain]
+    get_service_registry().validate(domain, service, {field: value})
+    return _get_scheduler().fade(when, domain, service, entity_id, field, value, duration,
+                                 f"fade {entity_id} {field} to {value} over {duration:g}s")
+
+
+def _schedule_utterance(text, when, over):
+    scheduler = _get_scheduler()
+    match = resolve(text)
+    if match is None:
+        raise CommandError(f"No intent matched: {text}")
+    when = time.time() if when is None else when
+    if over is not None:
+        if match.intent not in _FADE_INTENTS:
+            raise CommandError(f"Cannot do {match.intent} gradually")
+        slot, value = _FADE_INTENTS[match.intent]
+        value = match.slots[slot] if slot else value
+        entity_id = _resolve(match.slots['device']) if 'device' in match.slots else _papa_light_id()
+        entry = _schedule_fade(when, entity_id, value, over)
+    else:
+        entry = scheduler.run_at(when, lambda: dispatch(match), f"say {text}")
+    return f"Scheduled #{entry.id} at {_format_when(entry.when)}: {entry.description}"
+
+
+def _service_call(action, args):
+    """Turn a schedulable command into (domain, service, entity_id, data)."""
+    if action in ("turn_on", "set_brightness"):
+        if action == "set_brightness" and not args:
+            raise CommandError("Usage: home_assistant_skill.py schedule <when> set_brightness <value>")
+        data = {'brightness_pct': int(args[0])} if args else {}
+        return 'light', 'turn_on', _papa_light_id(), data
+    if action in ("turn_off", "toggle"):
+        return 'light', action, _papa_light_id(), {}
+
+    if len(args) < 2:
+        raise CommandError("Usage: home_assistant_skill.py schedule <when> call <domain> <service> [target] [field=value ...]")
+    domain, service, rest = args[0], args[1], args[2:]
+    entity_id = None
+    if rest and '=' not in rest[0]:
+        entity_id, rest = _resolve(rest[0], domain), rest[1:]
+    data = {}
+    for field in rest:
+        name, _, value = field.partition('=')
+        data[name] = _parse_value(value)
+    return domain, service, entity_id, data
+
+
+def _schedule(args):
+    usage = ("Usage: home_assistant_skill.py schedule <now|in 10m|at 23:00> <action> [args] "
+             "(actions: " + ", ".join(SCHEDULABLE) + ")")
+    scheduler = _get_scheduler()
+    split = next((i for i, arg in enumerate(args) if arg in SCHEDULABLE), None)
+    if not split or split == len(args):
+        raise CommandError(usage)
+    try:
+        when = parse_time(" ".join(args[:split]))
+    except ValueError as e:
+        raise CommandError(f"{e}. {usage}")
+    action, rest = args[split], args[split + 1:]
+
+    if action == "say":
+        if not rest:
+            raise CommandError(usage)
+        return _schedule_utterance(" ".join(rest), when, None)
+    if action == "fade":
+        # fade [target] <value> over <duration>
+        if "over" not in rest or rest.index("over") not in (1, 2):
+            raise CommandError("Usage: home_assistant_skill.py schedule <when> fade [target] <value> over <duration>")
+        over = rest.index("over")
+        try:
+            duration = parse_duration(" ".join(rest[over + 1:]))
+        except ValueError as e:
+            raise CommandError(str(e))
+        entity_id = _resolve(rest[0]) if over == 2 else _papa_light_id()
+        entry = _schedule_fade(when, entity_id, _parse_value(rest[over - 1]), duration)
+    else:
+        domain, service, entity_id, data = _service_call(action, rest)
+        get_service_registry().validate(domain, service, data)
+        entry = scheduler.call_at(when, domain, service, entity_id, data,
+                                  f"{action} {' '.join(rest)}".rstrip())
+    return f"Scheduled #{entry.id} at {_format_when(entry.when)}: {entry.description}"
+
+
+def _schedules(args):
+    pending = _get_scheduler().pending()
+    if not pending:
+        return "Nothing scheduled"
+    return "\n".join(f"#{entry['id']} {_format_when(entry['when'])} {entry['description']}" for entry in pending)
+
+
+def _unschedule(args):
+    if len(args) != 1 or not args[0].lstrip('#').isdigit():
+        raise CommandError("Usage: home_assistant_skill.py unschedule <id>")
+    if not _get_scheduler().cancel(int(args[0].lstrip('#'))):
+        raise CommandError(f"No schedule #{args[0].lstrip('#')}")
+    return f"Cancelled #{args[0].lstrip('#')}"
+
+
+COMMANDS = {
+    "turn_on": _turn_on,
+    "turn_off": _turn_off,
+    "toggle": _toggle,
+    "status": _status,
+    "set_brightness": _set_brightness,
+    "say": _say,
+    "call": _call,
+    "devices": _devices,
+    "stats": _stats,
+    "queue": _queue,
+    "schedule": _schedule,
+    "schedules": _schedules,
+    "unschedule": _unschedule,
+}
+
+
+def enable_coalescing(window):
+    """Route brightness changes through a per-entity coalescing queue."""
+    global _coalescer
+    if _coalescer is not None:
+        _coalescer.close()
+    _coalescer = Coalescer(call_home_assistant, window) if window > 0 else None
+    return _coalescer
+
+
+def enable_scheduler():
+    """Start the scheduler thread that runs timed calls and fades."""
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.close()
+    _scheduler = Scheduler(call_home_assistant, current=_current_value).start()
+    return _scheduler
+
+
+def get_command_queue():
+    global _command_queue
+    if _command_queue is None:
+        try:
+            path = load_config().get('queue_path')
+        except FileNotFoundError:
+            path = None
+        _command_queue = CommandQueue(Path(path) if path else QUEUE_PATH, run)
+    return _command_queue
+
+
+def enable_queue(workers=DEFAULT_WORKERS):
+    """Start draining the command queue with this many worker threads."""
+    queue = get_command_queue()
+    queue.close()
+    queue.workers = workers
+    return queue.start() if workers > 0 else queue
+
+
+def run(action, args):
+    command = COMMANDS.get(action)
+    if command is None:
+        raise CommandError(f"Unknown action: {action}")
+    if action in ("stats", "queue"):
+        return command(list(args))
+    with span('command', action=action):
+        return command(list(args))
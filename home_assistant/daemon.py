@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Resident Home Assistant command daemon.
+
+Keeps the pooled HTTP session, cached config/token, resolved entity ids and
+the intent matchers warm, and serves commands over a Unix socket. Each
+request is one JSON line, {"action": "turn_on", "args": ["50"]}, answered
+with one JSON line, {"ok": true, "output": "..."}. Use client.py to talk
+to it.
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import socketserver
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+import tracing
+from client import socket_path
+from coalesce import DEFAULT_WINDOW
+from command_queue import DEFAULT_WORKERS
+from commands import CommandError, enable_coalescing, enable_queue, enable_scheduler, run
+from fuzzy import get_resolver
+from intents import get_matcher
+
+logger = logging.getLogger('home_assistant.daemon')
+
+
+def handle_request(request):
+    action = request.get('action')
+    args = request.get('args', [])
+    logger.debug('Request: %s %s', action, args)
+    if action == 'ping':
+        return {'ok': True, 'output': 'pong'}
+    if action == 'reload':
+        main.forget_entity_ids()
+        return {'ok': True, 'output': 'Entity cache cleared'}
+    try:
+        return {'ok': True, 'output': run(action, args)}
+    except CommandError as e:
+        return {'ok': False, 'output': str(e)}
+    except Exception as e:
+        logger.exception('Command %s failed', action)
+        return {'ok': False, 'output': f"Error: {str(e)}"}
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                reply = {'ok': False, 'output': 'Error: request is not valid JSON'}
+            else:
+                reply = handle_request(request)
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class CommandServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def warm_up():
+    get_matcher()
+    get_resolver()
+    try:
+        main.get_session()
+        main.get_token()
+        main.get_papa_light_entity_id()
+    except Exception as e:
+        # Home Assistant may still be starting; the caches fill on first use.
+        logger.warning('Could not warm up Home Assistant caches: %s', e)
+
+
+def configure_tracing():
+    if tracing.trace_path():
+        return
+    try:
+        trace_file = main.load_config().get('trace_file')
+    except Exception:
+        trace_file = None
+    if trace_file:
+        tracing.configure(trace_file)
+
+
+def coalesce_window():
+    try:
+        window_ms = main.load_config().get('coalesce_window_ms')
+    except Exception:
+        window_ms = None
+    return DEFAULT_WINDOW if window_ms is None else window_ms / 1000
+
+
+def queue_workers():
+    try:
+        workers = main.load_config().get('queue_workers')
+    except Exception:
+        workers = None
+    return DEFAULT_WORKERS if workers is None else workers
+
+
+def serve(path=None, window=None, workers=None):
+    path = path or socket_path()
+    if os.path.exists(path):
+        os.unlink(path)
+
+    old_umask = os.umask(0o177)
+    try:
+        server = CommandServer(path, CommandHandler)
+    finally:
+        os.umask(old_umask)
+
+    def shutdown(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, shutdown)
+    configure_tracing()
+    enable_coalescing(coalesce_window() if window is None else window)
+    queue = enable_queue(queue_workers() if workers is None else workers)
+    scheduler = enable_scheduler()
+    warm_up()
+    logger.info('Listening on %s', path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.close()
+        queue.close()
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Home Assistant command daemon')
+    parser.add_argument('--socket', help='Unix socket path (default: $HOME_ASSISTANT_SOCKET or the runtime dir)')
+    parser.add_argument('--coalesce-window', type=float, metavar='MS',
+                        help='merge brightness changes to the same light within this many ms '
+                             '(default: coalesce_window_ms from the config, or 150; 0 disables)')
+    parser.add_argument('--queue-workers', type=int, metavar='N',
+                        help='threads draining queued commands '
+                             '(default: queue_workers from the config, or 4; 0 only accepts them)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log every request')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    serve(args.socket, None if args.coalesce_window is None else args.coalesce_window / 1000, args.queue_workers)
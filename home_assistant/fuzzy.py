@@ -0,0 +1,327 @@
+"""
+Fuzzy intent resolution for utterances that intents.json does not cover
+literally ("could you switch the light on please", "唔該幫我開下燈").
+
+Patterns and device names are broken into word tokens, character trigrams
+and, for Chinese text, character unigrams and bigrams. An inverted index
+from gram to entries narrows the candidates, which are then ranked by gram
+overlap (Dice) and word-level edit distance. A candidate is only accepted
+if it names the same device as the utterance, so "switch the tv on" does
+not turn on the light. The index is cached on disk and only the entries
+whose text changed are re-tokenized when intents.json is edited.
+"""
+
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from intents import CACHE_DIR, INTENTS_PATH, SLOT_TYPES, VALUE_SLOTS, IntentMatch, get_matcher, normalize
+
+CACHE_PATH = CACHE_DIR / 'intent_index.json'
+INDEX_VERSION = 2
+
+MIN_SCORE = 0.45
+MAX_CANDIDATES = 8
+
+_SLOT_RE = re.compile(r'\{\w+\}')
+_WORD_RE = re.compile(r'[a-z0-9]+|[㐀-鿿]+')
+_CJK_RE = re.compile(r'[㐀-鿿]')
+
+# Filler that carries no intent on its own.
+STOP_WORDS = {'a', 'the', 'please', 'could', 'can', 'you', 'would', 'me', 'my', 'to', 'for', 'just', 'now'}
+CJK_FILLER = set('唔該幫我下啦呀啊喇吖個咗一')
+# Words that name a device even when no device in intents.json is called that.
+DEVICE_NOUNS = {
+    'light', 'lights', 'lamp', 'tv', 'television', 'fan', 'heater', 'aircon', 'ac', 'air', 'conditioner',
+    'curtain', 'curtains', 'blind', 'blinds', 'cover', 'door', 'garage', 'lock', 'speaker', 'plug', 'socket',
+    'thermostat', 'kettle', 'vacuum', 'radio',
+    '燈', '電', '視', '風', '扇', '冷', '氣', '窗', '簾', '門', '鎖',
+}
+
+
+def words(text):
+    """Content words of the text; Chinese is split into single characters."""
+    result = []
+    for word in _WORD_RE.findall(normalize(text)):
+        if _CJK_RE.match(word):
+            result.extend(char for char in word if char not in CJK_FILLER)
+        elif word not in STOP_WORDS:
+            result.append(word)
+    return result
+
+
+def tokenize(text):
+    grams = set()
+    sequence = words(text)
+    for word in sequence:
+        grams.add(word)
+        if len(word) > 1:
+            padded = f'#{word}#'
+            grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    cjk = [word for word in sequence if _CJK_RE.match(word)]
+    grams.update(a + b for a, b in zip(cjk, cjk[1:]))
+    return grams
+
+
+def edit_distance(a, b, substitution_cost=None):
+    """
+    Edit distance between two sequences (strings or word lists), counting an
+    adjacent transposition ("lihgt") as a single edit.
+    """
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, item_a in enumerate(a, 1):
+        current = [i]
+        for j, item_b in enumerate(b, 1):
+            if item_a == item_b:
+                cost = 0
+            elif substitution_cost is None:
+                cost = 1
+            else:
+                cost = substitution_cost(item_a, item_b)
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if before is not None and j > 1 and item_a == b[j - 2] and a[i - 2] == item_b:
+                distance = min(distance, before[j - 2] + 1)
+            current.append(distance)
+        before, previous = previous, current
+    return previous[-1]
+
+
+@lru_cache(maxsize=4096)
+def _word_cost(a, b):
+    # A misspelt word ("lihgt") costs less than a different word.
+    return min(1.0, edit_distance(a, b) / max(len(a), len(b)) * 2)
+
+
+def _mentions(sequence, word):
+    """Whether the word, or a misspelling of it, is in the sequence."""
+    return any(item == word or _word_cost(item, word) < 1 for item in sequence)
+
+
+def _literal(text):
+    return normalize(_SLOT_RE.sub(' ', text)).strip()
+
+
+def _entry_key(kind, name, text):
+    return hashlib.sha1(f'{kind}\0{name}\0{text}'.encode('utf-8')).hexdigest()[:16]
+
+
+class FuzzyMatch(IntentMatch):
+    __slots__ = ('score', 'device')
+
+    def __init__(self, intent, action, slots, pattern, score, device=None):
+        super().__init__(intent, action, slots, pattern)
+        self.score = score
+        self.device = device
+
+    def as_dict(self):
+        result = super().as_dict()
+        result.update({'score': round(self.score, 3), 'device': self.device})
+        return result
+
+    def __repr__(self):
+        return f'FuzzyMatch({self.intent!r}, slots={self.slots!r}, score={self.score:.2f})'
+
+
+class FuzzyIndex:
+    def __init__(self, entries):
+        # entries: key -> {'kind', 'name', 'action', 'text', 'slots', 'grams'}
+        self.entries = entries
+        self.postings = {'intent': {}, 'device': {}}
+        # device -> words of all its names
+        self.device_names = {}
+        for key, entry in entries.items():
+            postings = self.postings[entry['kind']]
+            for gram in entry['grams']:
+                postings.setdefault(gram, []).append(key)
+            if entry['kind'] == 'device':
+                self.device_names.setdefault(entry['name'], set()).update(entry['words'])
+        self.device_words = DEVICE_NOUNS.union(*self.device_names.values())
+
+    @classmethod
+    def build(cls, data, previous=None):
+        """Build the index, reusing tokenized entries from a previous index."""
+        previous = previous or {}
+        entries = {}
+
+        def add(kind, name, action, text):
+            key = _entry_key(kind, name, text)
+            if key in previous:
+                entries[key] = previous[key]
+                return
+            entries[key] = {
+                'kind': kind,
+                'name': name,
+                'action': action,
+                'text': _literal(text),
+                'slots': _SLOT_RE.findall(text),
+                'words': words(_literal(text)),
+                'grams': sorted(tokenize(_literal(text))),
+            }
+
+        for intent_name, intent in data.get('intents', {}).items():
+            for pattern in intent.get('patterns', []):
+                add('intent', intent_name, intent.get('action', intent_name), pattern)
+        for device, names in data.get('devices', {}).items():
+            for name in [device.replace('_', ' ')] + list(names):
+                add('device', device, None, name)
+        return cls(entries)
+
+    @classmethod
+    def load(cls, intents_path=INTENTS_PATH, cache_path=CACHE_PATH):
+        intents_path = Path(intents_path)
+        cache_path = Path(cache_path)
+        stat = intents_path.stat()
+        signature = [INDEX_VERSION, stat.st_mtime_ns, stat.st_size]
+
+        cached = {}
+        try:
+            payload = json.loads(cache_path.read_text(encoding='utf-8'))
+            if payload.get('version') == INDEX_VERSION:
+                cached = payload.get('entries', {})
+                if payload.get('signature') == signature:
+                    return cls(cached)
+        except (OSError, ValueError):
+            pass
+
+        data = json.loads(intents_path.read_text(encoding='utf-8'))
+        index = cls.build(data, previous=cached)
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps({
+                'version': INDEX_VERSION,
+                'signature': signature,
+                'entries': index.entries,
+            }, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # The cache is only an optimisation; a read-only home is fine.
+            pass
+        return index
+
+    def candidates(self, grams, kind):
+        counts = {}
+        postings = self.postings[kind]
+        for gram in grams:
+            for key in postings.get(gram, ()):
+                counts[key] = counts.get(key, 0) + 1
+        scored = []
+        for key, common in counts.items():
+            entry = self.entries[key]
+            dice = 2 * common / (len(grams) + len(entry['grams']))
+            scored.append((dice, key))
+        scored.sort(reverse=True)
+        return scored[:MAX_CANDIDATES]
+
+    def rank(self, text, kind):
+        literal = _literal(text)
+        grams = tokenize(literal)
+        if not grams:
+            return []
+        sequence = words(literal)
+        ranked = []
+        for dice, key in self.candidates(grams, kind):
+            entry = self.entries[key]
+            # Edit distance over words rather than characters: cheaper, and
+            # "light on" vs "on light" should not look like a typo.
+            longest = max(len(sequence), len(entry['words'])) or 1
+            similarity = 1 - edit_distance(sequence, entry['words'], _word_cost) / longest
+            ranked.append((0.5 * dice + 0.5 * similarity, key))
+        ranked.sort(reverse=True)
+        return [(score, self.entries[key]) for score, key in ranked]
+
+
+def extract_slots(text, slot_names):
+    """Search free text for the values of the given slots."""
+    text = normalize(text)
+    slots = {}
+    for slot_name in slot_names:
+        slot_regex, convert = SLOT_TYPES.get(slot_name, (None, None))
+        if slot_regex is None:
+            return None
+        found = re.search(slot_regex, text)
+        if not found:
+            return None
+        try:
+            slots[slot_name] = convert(found.group())
+        except ValueError:
+            return None
+        text = text[:found.start()] + ' ' + text[found.end():]
+    return slots
+
+
+def _strip_slot_values(text):
+    text = normalize(text)
+    for slot_name in VALUE_SLOTS:
+        text = re.sub(SLOT_TYPES[slot_name][0], ' ', text)
+    return text
+
+
+class FuzzyResolver:
+    def __init__(self, index, min_score=MIN_SCORE):
+        self.index = index
+        self.min_score = min_score
+
+    @classmethod
+    def load(cls, intents_path=INTENTS_PATH, cache_path=CACHE_PATH, min_score=MIN_SCORE):
+        return cls(FuzzyIndex.load(intents_path, cache_path), min_score=min_score)
+
+    def same_device(self, sequence, entry, device):
+        """
+        Whether the utterance and the pattern name the same device: every
+        device word of the pattern is in the utterance, and every device word
+        of the utterance is in the pattern or in the names of the device
+        filling its {device} slot.
+        """
+        device_words = self.index.device_words
+        if not all(_mentions(sequence, word) for word in entry['words'] if word in device_words):
+            return False
+        covered = list(entry['words'])
+        if device is not None and '{device}' in entry['slots']:
+            covered.extend(self.index.device_names.get(device, ()))
+        return all(_mentions(covered, word) for word in sequence if word in device_words)
+
+    def resolve(self, text):
+        stripped = _strip_slot_values(text)
+        sequence = words(stripped)
+        devices = self.index.rank(stripped, 'device')
+        device = devices[0][1]['name'] if devices and devices[0][0] >= self.min_score else None
+        for score, entry in self.index.rank(stripped, 'intent'):
+            if score < self.min_score:
+                break
+            slot_names = [name.strip('{}') for name in entry['slots']]
+            # {device} is free text in a pattern; here it can only be one of
+            # the aliases known to the index.
+            if 'device' in slot_names and device is None:
+                continue
+            if not self.same_device(sequence, entry, device):
+                continue
+            slots = extract_slots(text, [name for name in slot_names if name != 'device'])
+            if slots is None:
+                continue
+            if 'device' in slot_names:
+                slots['device'] = device
+            return FuzzyMatch(entry['name'], entry['action'], slots, entry['text'], score, device=device)
+        return None
+
+
+_resolver = None
+
+
+def get_resolver():
+    global _resolver
+    if _resolver is None:
+        _resolver = FuzzyResolver.load()
+    return _resolver
+
+
+def resolve(text):
+    """Exact match first, then the fuzzy index."""
+    match = get_matcher().match(text)
+    if match is not None:
+        return match
+    return get_resolver().resolve(text)
@@ -0,0 +1,231 @@
+"""
+Intent matcher for the Home Assistant skill.
+
+All patterns in intents.json are compiled into a single anchored regex at
+load time. Each pattern becomes one named alternative, so a match tells us
+the pattern (and therefore the intent) directly via ``match.lastgroup``
+instead of trying the patterns one by one.
+"""
+
+import json
+import os
+import re
+from pathlib import Path
+
+INTENTS_PATH = Path(__file__).with_name('intents.json')
+CACHE_DIR = Path(os.environ.get(
+    'HOME_ASSISTANT_CACHE_DIR',
+    Path.home() / '.cache' / 'home_assistant'
+))
+
+COLOR_NAMES = {
+    'red': [255, 0, 0],
+    'green': [0, 255, 0],
+    'blue': [0, 0, 255],
+    'white': [255, 255, 255],
+    'warm white': [255, 180, 107],
+    'yellow': [255, 255, 0],
+    'orange': [255, 165, 0],
+    'purple': [128, 0, 128],
+    'pink': [255, 192, 203],
+    'cyan': [0, 255, 255],
+    'magenta': [255, 0, 255],
+    '紅色': [255, 0, 0],
+    '綠色': [0, 255, 0],
+    '藍色': [0, 0, 255],
+    '白色': [255, 255, 255],
+    '暖白色': [255, 180, 107],
+    '黃色': [255, 255, 0],
+    '橙色': [255, 165, 0],
+    '紫色': [128, 0, 128],
+    '粉紅色': [255, 192, 203],
+}
+
+_COLOR_NAME_RE = '|'.join(re.escape(name) for name in sorted(COLOR_NAMES, key=len, reverse=True))
+
+_DEFAULT_SLOT = (r'.+?', str.strip)
+_SLOT_RE = re.compile(r'\{(\w+)\}')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def _to_percent(value):
+    pct = int(value.rstrip('% '))
+    if not 0 <= pct <= 100:
+        raise ValueError(f'Percentage must be between 0 and 100: {pct}')
+    return pct
+
+
+# Number and unit as separate groups, so "02700k" is not mis-sliced.
+_COLOR_TEMP = r'(\d{2,5})\s*(k|kelvin|mireds?)?'
+_COLOR_TEMP_RE = re.compile(_COLOR_TEMP)
+# 10000 K to 1000 K
+MIN_MIREDS = 100
+MAX_MIREDS = 1000
+
+
+def _to_color_temp(value):
+    number, unit = _COLOR_TEMP_RE.fullmatch(value.strip()).groups()
+    number = int(number)
+    if number == 0:
+        raise ValueError(f'Color temperature must not be 0: {value}')
+    # Anything that looks like kelvin is converted to mireds, which is what
+    # light.turn_on expects for color_temp.
+    if (unit or '').startswith('k') or (not unit and number >= 1000):
+        number = round(1000000 / number)
+    if not MIN_MIREDS <= number <= MAX_MIREDS:
+        raise ValueError(f'Color temperature must be between {MIN_MIREDS} and {MAX_MIREDS} mireds: {value}')
+    return number
+
+
+def _to_rgb(value):
+    value = value.strip()
+    if value in COLOR_NAMES:
+        return list(COLOR_NAMES[value])
+    if value.startswith('#'):
+        return [int(value[i:i + 2], 16) for i in (1, 3, 5)]
+    rgb = [int(part) for part in value.split(',')]
+    if any(channel > 255 for channel in rgb):
+        raise ValueError(f'RGB channels must be between 0 and 255: {value}')
+    return rgb
+
+
+# Slot name -> (regex, converter). Slots that are not listed here, such as
+# {device}, fall back to a lazy catch-all and are passed through as
+# stripped strings.
+SLOT_TYPES = {
+    'brightness': (r'\d{1,3}\s*%?', _to_percent),
+    'color_temp': (_COLOR_TEMP, _to_color_temp),
+    'rgb_color': (
+        rf'(?:{_COLOR_NAME_RE}|#[0-9a-f]{{6}}|\d{{1,3}}\s*,\s*\d{{1,3}}\s*,\s*\d{{1,3}})',
+        _to_rgb,
+    ),
+    'temperature': (r'\d{1,2}(?:\.\d+)?', float),
+    'position': (r'\d{1,3}\s*%?', _to_percent),
+    'percentage': (r'\d{1,3}\s*%?', _to_percent),
+    'hvac_mode': (
+        r'(?:off|heat[ _]cool|heat|cool|auto|dry|fan[ _]only)',
+        lambda value: value.replace(' ', '_'),
+    ),
+}
+
+# Slots that hold a measurable value rather than words of the command; the
+# fuzzy resolver removes these from the text before comparing phrasing.
+VALUE_SLOTS = ('brightness', 'color_temp', 'rgb_color', 'temperature', 'position', 'percentage')
+
+# Intent slot name -> keyword argument of the action in main.py
+SLOT_ARGUMENTS = {
+    'brightness': 'brightness_pct',
+}
+
+
+def normalize(text):
+    return _SPACE_RE.sub(' ', text.strip().lower()).rstrip('.!?')
+
+
+class IntentMatch:
+    __slots__ = ('intent', 'action', 'slots', 'pattern')
+
+    def __init__(self, intent, action, slots, pattern):
+        self.intent = intent
+        self.action = action
+        self.slots = slots
+        self.pattern = pattern
+
+    def arguments(self):
+        return {SLOT_ARGUMENTS.get(name, name): value for name, value in self.slots.items()}
+
+    def as_dict(self):
+        return {'intent': self.intent, 'action': self.action, 'slots': self.slots, 'pattern': self.pattern}
+
+    def __repr__(self):
+        return f'IntentMatch({self.intent!r}, slots={self.slots!r})'
+
+
+class IntentMatcher:
+    def __init__(self, intents):
+        self.intents = intents
+        self._patterns = []
+        alternatives = []
+
+        entries = []
+        for intent_name, intent in intents.items():
+            for pattern in intent.get('patterns', []):
+                entries.append((intent_name, intent.get('action', intent_name), pattern))
+
+        # More literal text first, so "make light {brightness}% bright" is
+        # tried before the looser "make light {rgb_color}".
+        entries.sort(key=lambda entry: len(_SLOT_RE.sub('', entry[2])), reverse=True)
+
+        for index, (intent_name, action, pattern) in enumerate(entries):
+            group = f'p{index}'
+            slots = []
+            regex = ''
+            position = 0
+            text = normalize(pattern)
+            for slot in _SLOT_RE.finditer(text):
+                regex += re.escape(text[position:slot.start()])
+                slot_name = slot.group(1)
+                slot_regex, _ = SLOT_TYPES.get(slot_name, _DEFAULT_SLOT)
+                regex += f'(?P<{group}_{len(slots)}>{slot_regex})'
+                slots.append(slot_name)
+                position = slot.end()
+            regex += re.escape(text[position:])
+            alternatives.append(f'(?P<{group}>{regex})')
+            self._patterns.append((intent_name, action, pattern, group, slots))
+
+        self._regex = re.compile('^(?:' + '|'.join(alternatives) + ')$') if alternatives else None
+        self._by_group = {entry[3]: entry for entry in self._patterns}
+
+    @classmethod
+    def from_file(cls, path=INTENTS_PATH):
+        data = json.loads(Path(path).read_text(encoding='utf-8'))
+        return cls(data.get('intents', {}))
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def match(self, text):
+        if self._regex is None:
+            return None
+        m = self._regex.match(normalize(text))
+        if not m:
+            return None
+
+        intent_name, action, pattern, group, slot_names = self._by_group[m.lastgroup]
+        slots = {}
+        for index, slot_name in enumerate(slot_names):
+            _, convert = SLOT_TYPES.get(slot_name, _DEFAULT_SLOT)
+            try:
+                slots[slot_name] = convert(m.group(f'{group}_{index}'))
+            except ValueError:
+                return None
+        return IntentMatch(intent_name, action, slots, pattern)
+
+
+_matcher = None
+
+
+def get_matcher():
+    global _matcher
+    if _matcher is None:
+        _matcher = IntentMatcher.from_file()
+    return _matcher
+
+
+def dispatch(match):
+    # Imported lazily so matching alone does not pull in requests.
+    import main
+
+    action = getattr(main, match.action, None)
+    if action is None:
+        raise ValueError(f'Intent {match.intent} maps to unknown action: {match.action}')
+    return action(**match.arguments())
+
+
+def handle(text, matcher=None):
+    if matcher is None:
+        matcher = get_matcher()
+    match = matcher.match(text)
+    if match is None:
+        return None, None
+    return match, dispatch(match)
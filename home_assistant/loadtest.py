@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Load generator for the Home Assistant client.
+
+Drives N concurrent workers issuing commands through main.py (or through a
+running daemon with --socket) and reports throughput, latency percentiles
+and the per-span timings from tracing. By default an in-process
+mock_server.MockHomeAssistant is started, so it runs fully offline:
+
+    python3 loadtest.py --concurrency 16 --requests 2000 --entities 500 --latency-ms 10
+    python3 loadtest.py --cold --command status       # reset caches before every command
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+import tracing
+from commands import run
+from mock_server import MockHomeAssistant
+from services import ServiceRegistry
+
+
+class ResetGate:
+    """Commands run side by side; a reset waits until none is in flight and holds new ones back."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._running = 0
+        self._resetting = False
+
+    @contextmanager
+    def command(self):
+        with self._condition:
+            while self._resetting:
+                self._condition.wait()
+            self._running += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
+
+    def reset(self, reset):
+        with self._condition:
+            while self._resetting:
+                self._condition.wait()
+            # Claim the gate first so a steady stream of commands cannot starve the reset.
+            self._resetting = True
+            while self._running:
+                self._condition.wait()
+        try:
+            reset()
+        finally:
+            with self._condition:
+                self._resetting = False
+                self._condition.notify_all()
+
+
+def local_reset(registry_path=None):
+    """
+    A cold start for commands run in this process. With registry_path the
+    service schemas are cached there instead of the user's cache dir.
+    """
+    def reset():
+        main.reset_caches()
+        if registry_path is not None:
+            main._registry = ServiceRegistry(main.get_services, cache_path=registry_path)
+    return reset
+
+
+def run_load(execute, commands, concurrency, total, reset=None):
+    """
+    Run total commands over concurrency threads; returns the report dict.
+    With reset, it is called before every command while no other command is in flight.
+    """
+    latencies = []
+    errors = []
+    counter = iter(range(total))
+    counter_lock = threading.Lock()
+    gate = ResetGate()
+
+    def worker():
+        while True:
+            with counter_lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            action, args = commands[index % len(commands)]
+            if reset is not None:
+                gate.reset(reset)
+            with gate.command():
+                start = time.perf_counter()
+                try:
+                    execute(action, args)
+                except Exception as e:
+                    errors.append(f'{action}: {e}')
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        'commands': total,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'first_errors': errors[:5],
+        'seconds': round(elapsed, 3),
+        'throughput_per_s': round(total / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': round(tracing.percentile(ordered, 50), 3),
+            'p95': round(tracing.percentile(ordered, 95), 3),
+            'p99': round(tracing.percentile(ordered, 99), 3),
+            'max': round(ordered[-1], 3) if ordered else 0.0,
+        },
+    }
+
+
+def parse_command(text):
+    parts = text.split()
+    return parts[0], parts[1:]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the Home Assistant client')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--command', action='append', metavar='"ACTION ARGS"',
+                        help='command to issue, may be repeated to mix (default: a light mix)')
+    parser.add_argument('--cold', action='store_true', help='reset session and caches before every command')
+    parser.add_argument('--socket', help='send commands to a running daemon instead of calling main.py')
+    parser.add_argument('--config', help='use an existing Home Assistant config instead of the mock server')
+    parser.add_argument('--entities', type=int, default=200, help='mock server entity count')
+    parser.add_argument('--latency-ms', type=float, default=5, help='mock server latency')
+    parser.add_argument('--error-rate', type=float, default=0, help='mock server service error rate')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    commands = [parse_command(text) for text in (args.command or ['turn_on 40', 'status', 'set_brightness 70', 'toggle'])]
+
+    server = None
+    reset = None
+    if args.socket:
+        from client import send
+
+        def execute(action, action_args):
+            reply = send({'action': action, 'args': action_args}, args.socket)
+            if not reply['ok']:
+                raise RuntimeError(reply['output'])
+    else:
+        if args.config:
+            main.CONFIG_PATH = main.Path(args.config)
+            reset = local_reset()
+        else:
+            server = MockHomeAssistant(entities=args.entities, latency=args.latency_ms / 1000,
+                                       error_rate=args.error_rate).start()
+            config_dir = tempfile.mkdtemp(prefix='ha-loadtest-')
+            main.CONFIG_PATH = server.write_config(config_dir)
+            # Keep the mock server's schemas out of the user's cache dir, cold starts included.
+            reset = local_reset(main.Path(config_dir) / 'services.json')
+            reset()
+        execute = run
+
+    tracing.reset()
+    try:
+        report = run_load(execute, commands, args.concurrency, args.requests, reset=reset if args.cold else None)
+    finally:
+        if server is not None:
+            report_requests = dict(server.requests)
+            server.stop()
+    if server is not None:
+        report['server_requests'] = report_requests
+    report['spans'] = tracing.stats()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['commands']} commands, concurrency {report['concurrency']}, {report['errors']} errors")
+    print(f"{report['throughput_per_s']} commands/s over {report['seconds']} s")
+    latency = report['latency_ms']
+    print(f"latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    if 'server_requests' in report:
+        print('server requests: ' + ', '.join(f'{k} {v}' for k, v in sorted(report['server_requests'].items())))
+    for error in report['first_errors']:
+        print(f'error: {error}')
+    if report['spans']:
+        print()
+        print(tracing.format_stats(report['spans']))
+
+
+if __name__ == '__main__':
+    main_cli()
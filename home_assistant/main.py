@@ -1,30 +1,83 @@
 import json
+import os
+import threading
 import requests
 from pathlib import Path
 
+from services import SERVICES_CACHE_TTL, EntityIndex, ServiceRegistry
+from state_cache import DEFAULT_TTL as STATE_CACHE_TTL, StateCache
+from tracing import traced
+
+CONFIG_PATH = Path(os.environ.get(
+    'HOME_ASSISTANT_CONFIG',
+    '/home/neo/.openclaw/config/home_assistant_config.json'
+))
+
+PAPA_LIGHT = 'papa_light'
+
+# Seconds to wait for a connection and for each read; override with
+# request_timeout in the config (a number or [connect, read]).
+REQUEST_TIMEOUT = (3.05, 10)
+
+_lock = threading.Lock()
+_file_cache = {}
+_session = None
+_state_cache = None
+_registry = None
+_entity_index = None
+
+def _read_cached(path, parse):
+    # Re-read a file only when its mtime changes, so a long-running process
+    # still picks up config edits without paying for a read on every call.
+    mtime = path.stat().st_mtime_ns
+    cached = _file_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    value = parse(path.read_text())
+    _file_cache[path] = (mtime, value)
+    return value
+
+@traced('load_config')
 def load_config():
-    config_path = Path('/home/neo/.openclaw/config/home_assistant_config.json')
+    config_path = CONFIG_PATH
     if config_path.exists():
-        return json.loads(config_path.read_text())
+        return _read_cached(config_path, json.loads)
     else:
         raise FileNotFoundError('Home Assistant config not found')
 
+@traced('get_token')
 def get_token():
     config = load_config()
     token_path = Path(config['token_file_path'])
     if token_path.exists():
-        return token_path.read_text().strip()
+        return _read_cached(token_path, str.strip)
     else:
         raise FileNotFoundError('Home Assistant token not found')
 
-def call_home_assistant(service_domain, service, entity_id=None, data=None):
-    config = load_config()
-    url = f"{config['home_assistant_url']}/api/services/{service_domain}/{service}"
-    
-    headers = {
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+def _timeout():
+    timeout = load_config().get('request_timeout', REQUEST_TIMEOUT)
+    return tuple(timeout) if isinstance(timeout, list) else timeout
+
+def _headers():
+    return {
         'Authorization': f'Bearer {get_token()}',
         'Content-Type': 'application/json'
     }
+
+@traced('call_home_assistant')
+def call_home_assistant(service_domain, service, entity_id=None, data=None):
+    config = load_config()
+    url = f"{config['home_assistant_url']}/api/services/{service_domain}/{service}"
     
     payload = {}
     if entity_id:
@@ -32,90 +85,165 @@ def call_home_assistant(service_domain, service, entity_id=None, data=None):
     if data:
         payload.update(data)
     
-    response = requests.post(url, headers=headers, json=payload)
+    response = get_session().post(url, headers=_headers(), json=payload, timeout=_timeout())
     response.raise_for_status()
-    return response.json()
+    result = response.json()
+    get_state_cache().record_call(service_domain, service, entity_id, data, result)
+    return result
 
+@traced('get_states')
 def get_states():
     config = load_config()
     url = f"{config['home_assistant_url']}/api/states"
     
-    headers = {
-        'Authorization': f'Bearer {get_token()}',
-        'Content-Type': 'application/json'
-    }
+    response = get_session().get(url, headers=_headers(), timeout=_timeout())
+    response.raise_for_status()
+    return response.json()
+
+@traced('get_state')
+def get_state(entity_id):
+    config = load_config()
+    url = f"{config['home_assistant_url']}/api/states/{entity_id}"
+    
+    response = get_session().get(url, headers=_headers(), timeout=_timeout())
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+def get_state_cache():
+    global _state_cache
+    with _lock:
+        if _state_cache is None:
+            ttl = load_config().get('state_cache_ttl', STATE_CACHE_TTL)
+            _state_cache = StateCache(get_states, get_state, ttl=ttl)
+        return _state_cache
+
+@traced('get_services')
+def get_services():
+    config = load_config()
+    url = f"{config['home_assistant_url']}/api/services"
     
-    response = requests.get(url, headers=headers)
+    response = get_session().get(url, headers=_headers(), timeout=_timeout())
     response.raise_for_status()
     return response.json()
 
+def get_service_registry():
+    global _registry
+    with _lock:
+        if _registry is None:
+            ttl = load_config().get('services_cache_ttl', SERVICES_CACHE_TTL)
+            _registry = ServiceRegistry(get_services, ttl=ttl)
+        return _registry
+
+def get_entity_index():
+    global _entity_index
+    with _lock:
+        if _entity_index is None:
+            _entity_index = EntityIndex.from_intents()
+        return _entity_index
+
+@traced('resolve_entity')
+def find_entity_id(name, domain=None):
+    return get_entity_index().resolve(get_state_cache(), name, domain)
+
+def forget_entity_ids():
+    if _state_cache is not None:
+        _state_cache.invalidate()
+
+def reset_caches():
+    """Drop the session and every cache, as if the process had just started."""
+    global _session, _state_cache, _registry, _entity_index
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = _state_cache = _registry = _entity_index = None
+        _file_cache.clear()
+
+def call_service(domain, service, target=None, data=None):
+    """
+    Validate and send domain.service for target (entity id, friendly name or
+    alias). With domain None the domain of the resolved entity is used, so
+    turn_on works the same for lights, switches and fans.
+    """
+    entity_id = None
+    if target is not None:
+        entity_id = find_entity_id(target, domain)
+        if entity_id is None:
+            raise LookupError(f"No {domain or 'device'} found matching '{target}'")
+        domain = domain or entity_id.split('.', 1)[0]
+    if domain is None:
+        raise ValueError('A domain or a target is required')
+    
+    data = {key: value for key, value in (data or {}).items() if value is not None}
+    get_service_registry().validate(domain, service, data)
+    return call_home_assistant(domain, service, entity_id, data)
+
 def get_papa_light_entity_id():
-    states = get_states()
-    for entity in states:
-        if 'papa_light' in entity['entity_id']:
-            return entity['entity_id']
-    return None
+    return find_entity_id(PAPA_LIGHT, 'light')
 
-def turn_on_light(brightness_pct=None, rgb_color=None, color_temp=None):
-    entity_id = get_papa_light_entity_id()
-    if not entity_id:
+def _papa_light(service, data=None):
+    try:
+        return call_service('light', service, PAPA_LIGHT, data)
+    except LookupError:
         return {'error': 'Papa light entity not found'}
-    
-    data = {}
-    if brightness_pct:
-        data['brightness_pct'] = brightness_pct
-    if rgb_color:
-        data['rgb_color'] = rgb_color
-    if color_temp:
-        data['color_temp'] = color_temp
-        
-    return call_home_assistant('light', 'turn_on', entity_id, data)
+
+def turn_on_light(brightness_pct=None, rgb_color=None, color_temp=None):
+    data = {'brightness_pct': brightness_pct, 'rgb_color': rgb_color, 'color_temp': color_temp}
+    return _papa_light('turn_on', data)
 
 def turn_off_light():
-    entity_id = get_papa_light_entity_id()
-    if not entity_id:
-        return {'error': 'Papa light entity not found'}
-    
-    return call_home_assistant('light', 'turn_off', entity_id)
+    return _papa_light('turn_off')
 
 def toggle_light():
-    entity_id = get_papa_light_entity_id()
-    if not entity_id:
-        return {'error': 'Papa light entity not found'}
-    
-    return call_home_assistant('light', 'toggle', entity_id)
+    return _papa_light('toggle')
 
 def get_light_state():
     entity_id = get_papa_light_entity_id()
     if not entity_id:
         return {'error': 'Papa light entity not found'}
     
-    states = get_states()
-    for entity in states:
-        if entity['entity_id'] == entity_id:
-            return entity
-    return None
+    return get_state_cache().get(entity_id)
 
 def set_brightness(brightness_pct):
-    entity_id = get_papa_light_entity_id()
-    if not entity_id:
-        return {'error': 'Papa light entity not found'}
-    
-    data = {'brightness_pct': brightness_pct}
-    return call_home_assistant('light', 'turn_on', entity_id, data)
+    return _papa_light('turn_on', {'brightness_pct': brightness_pct})
 
 def set_color_temperature(color_temp):
-    entity_id = get_papa_light_entity_id()
-    if not entity_id:
-        return {'error': 'Papa light entity not found'}
-    
-    data = {'color_temp': color_temp}
-    return call_home_assistant('light', 'turn_on', entity_id, data)
+    return _papa_light('turn_on', {'color_temp': color_temp})
 
 def set_rgb_color(rgb_color):
-    entity_id = get_papa_light_entity_id()
+    return _papa_light('turn_on', {'rgb_color': rgb_color})
+
+def get_device_state(device):
+    entity_id = find_entity_id(device)
     if not entity_id:
-        return {'error': 'Papa light entity not found'}
+        return {'error': f"No device found matching '{device}'"}
     
-    data = {'rgb_color': rgb_color}
-    return call_home_assistant('light', 'turn_on', entity_id, data)
\ No newline at end of file
+    return get_state_cache().get(entity_id)
+
+def turn_on_device(device):
+    return call_service(None, 'turn_on', device)
+
+def turn_off_device(device):
+    return call_service(None, 'turn_off', device)
+
+def toggle_device(device):
+    return call_service(None, 'toggle', device)
+
+def open_cover(device):
+    return call_service('cover', 'open_cover', device)
+
+def close_cover(device):
+    return call_service('cover', 'close_cover', device)
+
+def set_cover_position(device, position):
+    return call_service('cover', 'set_cover_position', device, {'position': position})
+
+def set_temperature(device, temperature):
+    return call_service('climate', 'set_temperature', device, {'temperature': temperature})
+
+def set_hvac_mode(device, hvac_mode):
+    return call_service('climate', 'set_hvac_mode', device, {'hvac_mode': hvac_mode})
+
+def set_fan_speed(device, percentage):
+    return call_service('fan', 'set_percentage', device, {'percentage': percentage})
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Stand-in Home Assistant server for tests and benchmarks.
+
+Serves the parts of the REST and WebSocket APIs this skill uses:
+
+    GET  /api/                      API status
+    GET  /api/states                all entity states
+    GET  /api/states/<entity_id>    one entity state
+    GET  /api/services              service schemas (from services.BUILTIN_SERVICES)
+    POST /api/services/<d>/<s>      call a service, returns the changed states
+    GET  /api/websocket             auth, get_states, call_service,
+                                    subscribe_events (state_changed), ping
+
+The number of entities, response latency and an error rate can be set, so
+caching and pooling changes can be measured offline:
+
+    python3 mock_server.py --entities 500 --latency-ms 20 --write-config /tmp/ha
+    HOME_ASSISTANT_CONFIG=/tmp/ha/home_assistant_config.json python3 cli.py status
+"""
+
+import argparse
+import base64
+import copy
+import hashlib
+import json
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from services import BUILTIN_SERVICES
+from state_cache import predict_state
+
+DEFAULT_TOKEN = 'mock-token'
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+DOMAINS = ('light', 'switch', 'fan', 'cover', 'climate')
+
+
+def make_entities(count):
+    """light.papa_light plus count - 1 entities spread over the domains."""
+    states = [{
+        'entity_id': 'light.papa_light',
+        'state': 'off',
+        'attributes': {'friendly_name': 'Papa Light', 'brightness': None},
+    }]
+    for i in range(1, count):
+        domain = DOMAINS[i % len(DOMAINS)]
+        attributes = {'friendly_name': f'{domain.title()} {i}'}
+        state = 'off'
+        if domain == 'cover':
+            state, attributes['current_position'] = 'closed', 0
+        elif domain == 'climate':
+            attributes.update({'temperature': 24, 'hvac_modes': ['off', 'cool', 'heat', 'auto']})
+        states.append({'entity_id': f'{domain}.{domain}_{i}', 'state': state, 'attributes': attributes})
+    return states
+
+
+def apply_service(state, domain, service, data):
+    """Best-effort state change for a service call, like Home Assistant would report."""
+    new_state = predict_state(state, domain, service, data)
+    if new_state is not None:
+        return new_state
+    new_state = copy.deepcopy(state)
+    attributes = new_state.setdefault('attributes', {})
+    if service == 'open_cover':
+        new_state['state'], attributes['current_position'] = 'open', 100
+    elif service == 'close_cover':
+        new_state['state'], attributes['current_position'] = 'closed', 0
+    elif service == 'set_cover_position':
+        attributes['current_position'] = data.get('position', 0)
+        new_state['state'] = 'open' if attributes['current_position'] else 'closed'
+    elif service == 'set_hvac_mode':
+        new_state['state'] = data.get('hvac_mode', new_state['state'])
+    elif service.startswith('set_'):
+        attributes.update(data)
+    return new_state
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections when a load test opens many
+    # at once, which shows up as 1 s SYN retransmits in the latencies.
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up before a slow reply is written.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockHomeAssistant:
+    def __init__(self, entities=50, latency=0.0, jitter=0.0, error_rate=0.0, token=DEFAULT_TOKEN,
+                 host='127.0.0.1', port=0):
+        """
+        Args:
+            entities: number of entity states to serve
+            latency: seconds added to every response
+            jitter: extra random latency, up to this many seconds
+            error_rate: fraction of service calls answered with HTTP 500
+            token: bearer token clients must send
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.token = token
+        self.states = {state['entity_id']: state for state in make_entities(entities)}
+        self.requests = {}
+        self.service_calls = []
+        self.lock = threading.Lock()
+        self._subscribers = []
+        self._random = random.Random(0)
+        self.httpd = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def write_config(self, directory):
+        """Write a config and token file for main.py; returns the config path."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        token_path = directory / 'home_assistant_token.txt'
+        token_path.write_text(self.token)
+        config_path = directory / 'home_assistant_config.json'
+        config_path.write_text(json.dumps({'home_assistant_url': self.url, 'token_file_path': str(token_path)}))
+        return config_path
+
+    def services_payload(self):
+        return [{'domain': domain, 'services': {name: {'fields': fields} for name, fields in services.items()}}
+                for domain, services in BUILTIN_SERVICES.items()]
+
+    def delay(self):
+        pause = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if pause:
+            time.sleep(pause)
+
+    def count(self, key):
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def call_service(self, domain, service, data):
+        data = dict(data or {})
+        entity_ids = data.pop('entity_id', [])
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        changed = []
+        with self.lock:
+            self.service_calls.append((domain, service, list(entity_ids), data))
+            for entity_id in entity_ids:
+                old = self.states.get(entity_id)
+                if old is None:
+                    continue
+                new = apply_service(old, domain, service, data)
+                self.states[entity_id] = new
+                changed.append(copy.deepcopy(new))
+            subscribers = list(self._subscribers)
+        for state in changed:
+            for send in subscribers:
+                send(state)
+        return changed
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                # Headers and body are written separately; without this,
+                # Nagle plus delayed ACKs add ~40 ms to every keep-alive reply.
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _authorized(self):
+                if self.headers.get('Authorization') == f'Bearer {mock.token}':
+                    return True
+                self._send_json({'message': 'Unauthorized'}, 401)
+                return False
+
+            def do_GET(self):
+                if self.path == '/api/websocket' and self.headers.get('Upgrade', '').lower() == 'websocket':
+                    mock.count('websocket')
+                    self._websocket()
+                    return
+                mock.count(f'GET {self.path.split("?")[0]}')
+                mock.delay()
+                if not self._authorized():
+                    return
+                if self.path == '/api/':
+                    self._send_json({'message': 'API running.'})
+                elif self.path == '/api/states':
+                    with mock.lock:
+                        self._send_json(list(mock.states.values()))
+                elif self.path.startswith('/api/states/'):
+                    with mock.lock:
+                        state = mock.states.get(self.path[len('/api/states/'):])
+                    if state is None:
+                        self._send_json({'message': 'Entity not found.'}, 404)
+                    else:
+                        self._send_json(state)
+                elif self.path == '/api/services':
+                    self._send_json(mock.services_payload())
+                else:
+                    self._send_json({'message': 'Not found'}, 404)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                mock.count('POST /api/services')
+                mock.delay()
+                if not self._authorized():
+                    return
+                parts = self.path.strip('/').split('/')
+                if len(parts) != 4 or parts[:2] != ['api', 'services']:
+                    self._send_json({'message': 'Not found'}, 404)
+                    return
+                if mock.error_rate and mock._random.random() < mock.error_rate:
+                    self._send_json({'message': 'Injected failure'}, 500)
+                    return
+                try:
+                    data = json.loads(body or b'{}')
+                except ValueError:
+                    self._send_json({'message': 'Invalid JSON'}, 400)
+                    return
+                self._send_json(mock.call_service(parts[2], parts[3], data))
+
+            # -- WebSocket -----------------------------------------------------
+
+            def _websocket(self):
+                key = self.headers.get('Sec-WebSocket-Key', '')
+                accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+                self.send_response(101, 'Switching Protocols')
+                self.send_header('Upgrade', 'websocket')
+                self.send_header('Connection', 'Upgrade')
+                self.send_header('Sec-WebSocket-Accept', accept)
+                self.end_headers()
+                self.close_connection = True
+
+                send_lock = threading.Lock()
+                subscriptions = []
+
+                def send(payload):
+                    data = json.dumps(payload).encode('utf-8')
+                    header = bytes([0x81])
+                    if len(data) < 126:
+                        header += bytes([len(data)])
+                    elif len(data) < 65536:
+                        header += bytes([126]) + struct.pack('!H', len(data))
+                    else:
+                        header += bytes([127]) + struct.pack('!Q', len(data))
+                    with send_lock:
+                        self.wfile.write(header + data)
+                        self.wfile.flush()
+
+                def on_state(state):
+                    for subscription_id in subscriptions:
+                        try:
+                            send({'id': subscription_id, 'type': 'event', 'event': {
+                                'event_type': 'state_changed',
+                                'data': {'entity_id': state['entity_id'], 'new_state': state},
+                            }})
+                        except OSError:
+                            pass
+
+                send({'type': 'auth_required', 'ha_version': 'mock'})
+                authenticated = False
+                try:
+                    while True:
+                        message = self._read_frame(send_lock)
+                        if message is None:
+                            break
+                        try:
+                            request = json.loads(message)
+                        except ValueError:
+                            continue
+                        if not authenticated:
+                            if request.get('type') == 'auth' and request.get('access_token') == mock.token:
+                                authenticated = True
+                                send({'type': 'auth_ok', 'ha_version': 'mock'})
+                                continue
+                            send({'type': 'auth_invalid', 'message': 'Invalid access token'})
+                            break
+                        self._websocket_command(request, send, subscriptions, on_state)
+                finally:
+                    with mock.lock:
+                        if on_state in mock._subscribers:
+                            mock._subscribers.remove(on_state)
+
+            def _websocket_command(self, request, send, subscriptions, on_state):
+                message_id = request.get('id')
+                kind = request.get('type')
+                mock.delay()
+                if kind == 'ping':
+                    send({'id': message_id, 'type': 'pong'})
+                elif kind == 'get_states':
+                    with mock.lock:
+                        states = list(mock.states.values())
+                    send({'id': message_id, 'type': 'result', 'success': True, 'result': states})
+                elif kind == 'call_service':
+                    data = dict(request.get('service_data') or {})
+                    target = request.get('target') or {}
+                    if 'entity_id' in target:
+                        data['entity_id'] = target['entity_id']
+                    mock.call_service(request.get('domain'), request.get('service'), data)
+                    send({'id': message_id, 'type': 'result', 'success': True, 'result': {'context': {}}})
+                elif kind == 'subscribe_events':
+                    subscriptions.append(message_id)
+                    with mock.lock:
+                        if on_state not in mock._subscribers:
+                            mock._subscribers.append(on_state)
+                    send({'id': message_id, 'type': 'result', 'success': True, 'result': None})
+                else:
+                    send({'id': message_id, 'type': 'result', 'success': False,
+                          'error': {'code': 'unknown_command', 'message': f'Unknown command: {kind}'}})
+
+            def _read_frame(self, send_lock):
+                """Return the next text message, or None when the socket closes."""
+                while True:
+                    header = self.rfile.read(2)
+                    if len(header) < 2:
+                        return None
+                    opcode = header[0] & 0x0F
+                    masked = header[1] & 0x80
+                    length = header[1] & 0x7F
+                    if length == 126:
+                        length = struct.unpack('!H', self.rfile.read(2))[0]
+                    elif length == 127:
+                        length = struct.unpack('!Q', self.rfile.read(8))[0]
+                    mask = self.rfile.read(4) if masked else b'\0\0\0\0'
+                    payload = bytearray(self.rfile.read(length))
+                    for i in range(len(payload)):
+                        payload[i] ^= mask[i % 4]
+                    if opcode == 0x8:
+                        return None
+                    if opcode == 0x9:
+                        with send_lock:
+                            self.wfile.write(bytes([0x8A, len(payload)]) + bytes(payload))
+                            self.wfile.flush()
+                        continue
+                    if opcode in (0x1, 0x0):
+                        return payload.decode('utf-8')
+
+        return Handler
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Stand-in Home Assistant server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8123)
+    parser.add_argument('--entities', type=int, default=50, help='number of entities to serve')
+    parser.add_argument('--latency-ms', type=float, default=0, help='added to every response')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='extra random latency, up to this much')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of service calls that fail with 500')
+    parser.add_argument('--token', default=DEFAULT_TOKEN)
+    parser.add_argument('--write-config', metavar='DIR', help='write a config and token file for main.py into DIR')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    server = MockHomeAssistant(entities=args.entities, latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                               error_rate=args.error_rate, token=args.token, host=args.host, port=args.port)
+    if args.write_config:
+        print(f'Config written to {server.write_config(args.write_config)}')
+    print(f'Mock Home Assistant listening on {server.url} with {len(server.states)} entities')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
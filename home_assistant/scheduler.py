@@ -0,0 +1,273 @@
+"""
+Timed service calls and gradual transitions for the daemon.
+
+All schedules share one heap and one thread, which sleeps until the earliest
+entry is due, so thousands of them cost a heap entry each rather than a
+thread or a timer. Entries that come due within the same merge window are
+sent together: the latest data per entity wins, and entities that end up
+with the same service and data share a single call.
+
+A transition ("fade") is one entry that re-arms itself after every step, so
+its steps are computed as they fire and the start value is read when it
+starts, not when it is scheduled.
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger('home_assistant.scheduler')
+
+# Entries due within this many seconds of each other are merged.
+MERGE_WINDOW = 0.05
+# Transitions never step faster than this, whatever the distance.
+MIN_STEP = 1.0
+
+_DURATION = re.compile(
+    r'(\d+(?:\.\d+)?)\s*(h|hrs?|hours?|m|mins?|minutes?|s|secs?|seconds?)\b', re.IGNORECASE)
+_UNITS = {'h': 3600, 'm': 60, 's': 1}
+_CLOCK = re.compile(r'^(\d{1,2}):(\d{2})$')
+
+
+def parse_duration(text):
+    """'10m', '1h 30m', '90 seconds' -> seconds; ValueError otherwise."""
+    text = text.strip()
+    total = 0.0
+    end = 0
+    for match in _DURATION.finditer(text):
+        if text[end:match.start()].strip():
+            break
+        total += float(match.group(1)) * _UNITS[match.group(2)[0].lower()]
+        end = match.end()
+    if not end or text[end:].strip():
+        raise ValueError(f'Not a duration: {text!r}')
+    return total
+
+
+def parse_time(text, now=None):
+    """
+    'now', 'in 10m' or 'at 23:00' (also a bare '23:00', meaning the next
+    time the clock shows it) -> epoch seconds; ValueError otherwise.
+    """
+    now = now if now is not None else time.time()
+    text = text.strip().lower()
+    if text == 'now':
+        return now
+    if text.startswith('in '):
+        return now + parse_duration(text[3:])
+    if text.startswith('at '):
+        text = text[3:].strip()
+    clock = _CLOCK.match(text)
+    if clock is None:
+        raise ValueError(f'Not a time: {text!r}')
+    hour, minute = int(clock.group(1)), int(clock.group(2))
+    if hour > 23 or minute > 59:
+        raise ValueError(f'Not a time: {text!r}')
+    today = datetime.fromtimestamp(now)
+    when = today.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if when.timestamp() <= now:
+        when += timedelta(days=1)
+    return when.timestamp()
+
+
+class Schedule:
+    __slots__ = ('id', 'when', 'description', 'domain', 'service', 'entity_id', 'data',
+                 'callback', 'fade', 'cancelled')
+
+    def __init__(self, id, when, description, domain=None, service=None, entity_id=None, data=None,
+                 callback=None, fade=None):
+        self.id = id
+        self.when = when
+        self.description = description
+        self.domain = domain
+        self.service = service
+        self.entity_id = entity_id
+        self.data = data or {}
+        self.callback = callback
+        # [field, start, end, started_at, duration] while a transition runs.
+        self.fade = fade
+        self.cancelled = False
+
+    def as_dict(self):
+        return {'id': self.id, 'when': self.when, 'description': self.description}
+
+
+class Scheduler:
+    def __init__(self, send, current=None, merge_window=MERGE_WINDOW, clock=time.time):
+        """
+        Args:
+            send: callable(domain, service, entity_ids, data) making one call
+            current: callable(entity_id, field) returning the value a
+                transition starts from (None starts at the end value)
+            merge_window: seconds within which due entries share a batch
+            clock: returns the current epoch time
+        """
+        self.send = send
+        self.current = current
+        self.merge_window = merge_window
+        self.clock = clock
+        self._heap = []
+        self._entries = {}
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self.batches = 0
+        self.calls = 0
+
+    def start(self):
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self, timeout=5):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _push(self, entry):
+        with self._cond:
+            self._entries[entry.id] = entry
+            heapq.heappush(self._heap, (entry.when, entry.id, entry))
+            if self._heap[0][2] is entry:
+                self._cond.notify()
+        return entry
+
+    def call_at(self, when, domain, service, entity_id=None, data=None, description=None):
+        """Schedule domain.service for entity_id at the epoch time `when`."""
+        description = description or f'{domain}.{service} {entity_id or ""} {data or ""}'.strip()
+        return self._push(Schedule(next(self._ids), when, description, domain, service, entity_id, data))
+
+    def run_at(self, when, callback, description):
+        """Schedule an arbitrary callable; it is never merged with others."""
+        return self._push(Schedule(next(self._ids), when, description, callback=callback))
+
+    def fade(self, when, domain, service, entity_id, field, end, duration, description=None):
+        """Move `field` of entity_id to `end` in steps over `duration` seconds."""
+        description = description or f'fade {entity_id} {field} to {end} over {duration:g}s'
+        entry = Schedule(next(self._ids), when, description, domain, service, entity_id,
+                         fade=[field, None, end, None, duration])
+        return self._push(entry)
+
+    def cancel(self, schedule_id):
+        with self._cond:
+            entry = self._entries.pop(schedule_id, None)
+            if entry is None:
+                return False
+            # Left in the heap and skipped when it comes up; cheaper than
+            # re-heapifying for every cancellation.
+            entry.cancelled = True
+            return True
+
+    def pending(self):
+        with self._cond:
+            return sorted((entry.as_dict() for entry in self._entries.values()), key=lambda e: (e['when'], e['id']))
+
+    def _fade_step(self, entry, now):
+        """Return (data to send or None, when to fire next or None)."""
+        field, start, end, started_at, duration = entry.fade
+        if start is None:
+            try:
+                start = self.current(entry.entity_id, field) if self.current else None
+            except Exception as e:
+                logger.warning('Could not read %s of %s: %s', field, entry.entity_id, e)
+            if start is None or start == end or duration <= 0:
+                return {field: end}, None
+            entry.fade[1], entry.fade[3] = start, now
+            started_at = now
+
+        # One step per unit of change (one percent, one degree), but no
+        # faster than MIN_STEP.
+        steps = max(1, min(int(abs(end - start)), int(duration // MIN_STEP)))
+        interval = duration / steps
+        step = round((now - started_at) / interval)
+        if step < 1:
+            return None, started_at + interval
+        if step >= steps:
+            return {field: end}, None
+        value = start + (end - start) * step / steps
+        return {field: round(value) if isinstance(end, int) else round(value, 1)}, started_at + interval * (step + 1)
+
+    def _due(self, now):
+        """Pop every live entry due before now + merge_window."""
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now + self.merge_window:
+                _, _, entry = heapq.heappop(self._heap)
+                if not entry.cancelled:
+                    due.append(entry)
+        return due
+
+    def _send(self, calls):
+        batches = {}
+        for (domain, entity_id), (service, data) in calls.items():
+            key = (domain, service, json.dumps(data, sort_keys=True))
+            batches.setdefault(key, (data, []))[1].append(entity_id)
+        for (domain, service, _), (data, entity_ids) in batches.items():
+            targets = sorted(e for e in entity_ids if e is not None)
+            target = None if not targets else targets[0] if len(targets) == 1 else targets
+            try:
+                self.send(domain, service, target, data)
+            except Exception as e:
+                logger.warning('Scheduled %s.%s for %s failed: %s', domain, service, target, e)
+            self.calls += 1
+        calls.clear()
+
+    def _fire(self, entries, now):
+        calls = {}
+        for entry in entries:
+            if entry.callback is not None:
+                # Keep the order: calls due before the callback go out first.
+                self._send(calls)
+                with self._cond:
+                    self._entries.pop(entry.id, None)
+                try:
+                    entry.callback()
+                except Exception:
+                    logger.exception('Scheduled %s failed', entry.description)
+                continue
+
+            data, again = self._fade_step(entry, now) if entry.fade else (entry.data, None)
+            if data is not None:
+                # The latest call for an entity wins; the same service twice
+                # is merged field by field.
+                key = (entry.domain, entry.entity_id)
+                if key in calls and calls[key][0] == entry.service:
+                    calls[key][1].update(data)
+                else:
+                    calls.pop(key, None)
+                    calls[key] = (entry.service, dict(data))
+            with self._cond:
+                if again is not None and not entry.cancelled:
+                    entry.when = again
+                    heapq.heappush(self._heap, (entry.when, entry.id, entry))
+                else:
+                    self._entries.pop(entry.id, None)
+        self._send(calls)
+        if entries:
+            self.batches += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._heap:
+                        timeout = self._heap[0][0] - self.clock()
+                        if timeout <= self.merge_window:
+                            break
+                        self._cond.wait(timeout)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            now = self.clock()
+            self._fire(self._due(now), now)
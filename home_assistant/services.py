@@ -0,0 +1,277 @@
+"""
+Service schemas and entity lookup for the generic dispatcher in main.py.
+
+main.call_service() resolves a target (entity id, friendly name or alias)
+through EntityIndex, validates the payload with ServiceRegistry and sends it
+with the pooled client. Schemas come from /api/services, which is fetched
+once and cached on disk; the built-in table below is used when Home
+Assistant cannot be asked (and documents what the skill expects).
+"""
+
+import json
+import os
+import threading
+import time
+
+from intents import CACHE_DIR, INTENTS_PATH, normalize
+
+SERVICES_CACHE_PATH = CACHE_DIR / 'services.json'
+SERVICES_CACHE_TTL = 24 * 3600
+
+
+def _number(minimum=None, maximum=None):
+    return {'selector': {'number': {'min': minimum, 'max': maximum}}}
+
+
+def _select(*options):
+    return {'selector': {'select': {'options': list(options)}}}
+
+
+def _boolean():
+    return {'selector': {'boolean': {}}}
+
+
+def _text():
+    return {'selector': {'text': {}}}
+
+
+def _rgb():
+    return {'selector': {'color_rgb': {}}}
+
+
+_LIGHT_ON = {
+    'brightness_pct': _number(0, 100),
+    'brightness': _number(0, 255),
+    'rgb_color': _rgb(),
+    'color_temp': _number(100, 1000),
+    'kelvin': _number(1000, 10000),
+    'transition': _number(0, 300),
+    'effect': _text(),
+}
+_HVAC_MODES = ('off', 'heat', 'cool', 'heat_cool', 'auto', 'dry', 'fan_only')
+
+# domain -> service -> field -> schema, in the shape /api/services returns.
+BUILTIN_SERVICES = {
+    'light': {
+        'turn_on': _LIGHT_ON,
+        'turn_off': {'transition': _number(0, 300)},
+        'toggle': _LIGHT_ON,
+    },
+    'switch': {
+        'turn_on': {},
+        'turn_off': {},
+        'toggle': {},
+    },
+    'climate': {
+        'turn_on': {},
+        'turn_off': {},
+        'set_temperature': {
+            'temperature': _number(5, 35),
+            'target_temp_high': _number(5, 35),
+            'target_temp_low': _number(5, 35),
+            'hvac_mode': _select(*_HVAC_MODES),
+        },
+        'set_hvac_mode': {'hvac_mode': dict(_select(*_HVAC_MODES), required=True)},
+        'set_fan_mode': {'fan_mode': dict(_text(), required=True)},
+    },
+    'cover': {
+        'open_cover': {},
+        'close_cover': {},
+        'stop_cover': {},
+        'toggle': {},
+        'set_cover_position': {'position': dict(_number(0, 100), required=True)},
+    },
+    'fan': {
+        'turn_on': {'percentage': _number(0, 100), 'preset_mode': _text()},
+        'turn_off': {},
+        'toggle': {},
+        'set_percentage': {'percentage': dict(_number(0, 100), required=True)},
+        'set_direction': {'direction': dict(_select('forward', 'reverse'), required=True)},
+        'oscillate': {'oscillating': dict(_boolean(), required=True)},
+        'set_preset_mode': {'preset_mode': dict(_text(), required=True)},
+    },
+    'homeassistant': {
+        'turn_on': {},
+        'turn_off': {},
+        'toggle': {},
+    },
+}
+
+
+class ServiceError(ValueError):
+    """A service call that Home Assistant would reject."""
+
+
+def _check_field(domain, service, name, value, schema):
+    selector = schema.get('selector') or {}
+    where = f'{domain}.{service} {name}'
+    if 'number' in selector:
+        options = selector['number'] or {}
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ServiceError(f'{where} must be a number, got {value!r}')
+        if options.get('min') is not None and value < options['min']:
+            raise ServiceError(f'{where} must be at least {options["min"]}, got {value}')
+        if options.get('max') is not None and value > options['max']:
+            raise ServiceError(f'{where} must be at most {options["max"]}, got {value}')
+    elif 'boolean' in selector:
+        if not isinstance(value, bool):
+            raise ServiceError(f'{where} must be true or false, got {value!r}')
+    elif 'select' in selector:
+        options = [option['value'] if isinstance(option, dict) else option
+                   for option in (selector['select'] or {}).get('options', [])]
+        if options and value not in options:
+            raise ServiceError(f'{where} must be one of {", ".join(map(str, options))}, got {value!r}')
+    elif 'color_rgb' in selector:
+        if (not isinstance(value, (list, tuple)) or len(value) != 3
+                or not all(isinstance(channel, int) and 0 <= channel <= 255 for channel in value)):
+            raise ServiceError(f'{where} must be three integers between 0 and 255, got {value!r}')
+
+
+class ServiceRegistry:
+    def __init__(self, fetch_services=None, cache_path=SERVICES_CACHE_PATH, ttl=SERVICES_CACHE_TTL, services=None):
+        """
+        Args:
+            fetch_services: callable returning the /api/services payload
+            cache_path: where the parsed schemas are kept between processes
+            ttl: seconds before the on-disk copy is fetched again
+            services: preloaded schemas (skips fetching entirely)
+        """
+        self.fetch_services = fetch_services
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self._services = services
+        self._retry_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _flatten(fields):
+        # Newer Home Assistant versions group optional fields into sections
+        # ({"advanced_fields": {"collapsed": true, "fields": {...}}}).
+        flat = {}
+        for name, field in (fields or {}).items():
+            if isinstance(field, dict) and isinstance(field.get('fields'), dict):
+                flat.update(ServiceRegistry._flatten(field['fields']))
+            else:
+                flat[name] = field or {}
+        return flat
+
+    @classmethod
+    def _from_api(cls, payload):
+        services = {}
+        for entry in payload:
+            services[entry['domain']] = {
+                name: cls._flatten((service or {}).get('fields'))
+                for name, service in (entry.get('services') or {}).items()
+            }
+        return services
+
+    def _load(self):
+        try:
+            if time.time() - self.cache_path.stat().st_mtime < self.ttl:
+                return json.loads(self.cache_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            pass
+
+        try:
+            services = self._from_api(self.fetch_services())
+        except Exception:
+            # Home Assistant unreachable or too old to list services; the
+            # built-in table is good enough to validate common calls, and we
+            # ask again after a minute.
+            self._retry_at = time.monotonic() + 60
+            return BUILTIN_SERVICES
+        self._retry_at = None
+
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(services), encoding='utf-8')
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
+        return services
+
+    @property
+    def services(self):
+        with self._lock:
+            if self._services is None or (self._retry_at is not None and time.monotonic() >= self._retry_at):
+                self._services = self._load()
+            return self._services
+
+    def fields(self, domain, service):
+        services = self.services
+        if domain in services and service in services[domain]:
+            return services[domain][service]
+        if domain in BUILTIN_SERVICES and service in BUILTIN_SERVICES[domain]:
+            return BUILTIN_SERVICES[domain][service]
+        if domain not in services and domain not in BUILTIN_SERVICES:
+            raise ServiceError(f'Unknown domain: {domain}')
+        raise ServiceError(f'Unknown service: {domain}.{service}')
+
+    def validate(self, domain, service, data):
+        fields = self.fields(domain, service)
+        for name, value in (data or {}).items():
+            if name not in fields:
+                known = ', '.join(sorted(fields)) or 'none'
+                raise ServiceError(f'{domain}.{service} does not accept {name} (fields: {known})')
+            _check_field(domain, service, name, value, fields[name] or {})
+        for name, schema in fields.items():
+            if (schema or {}).get('required') and name not in (data or {}):
+                raise ServiceError(f'{domain}.{service} requires {name}')
+
+
+class EntityIndex:
+    """Name lookup over the state cache, rebuilt only when the cache reloads."""
+
+    def __init__(self, aliases=None):
+        self.aliases = aliases or {}
+        self._generation = None
+        self._names = {}
+        self._entity_ids = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_intents(cls, path=INTENTS_PATH):
+        try:
+            devices = json.loads(path.read_text(encoding='utf-8')).get('devices', {})
+        except (OSError, ValueError):
+            devices = {}
+        aliases = {normalize(name): device for device, names in devices.items() for name in names}
+        return cls(aliases)
+
+    def _rebuild(self, cache):
+        states = cache.all()
+        names = {}
+        for state in states:
+            entity_id = state['entity_id']
+            object_id = entity_id.split('.', 1)[1]
+            friendly_name = (state.get('attributes') or {}).get('friendly_name')
+            for name in (entity_id, object_id, object_id.replace('_', ' '), friendly_name):
+                if name:
+                    names.setdefault(normalize(name), []).append(entity_id)
+        self._names = names
+        self._entity_ids = [state['entity_id'] for state in states]
+        self._generation = cache.generation
+
+    def entity_ids(self, cache, domain=None):
+        with self._lock:
+            if self._generation != cache.generation or not self._entity_ids:
+                self._rebuild(cache)
+            return [e for e in self._entity_ids if domain is None or e.startswith(domain + '.')]
+
+    def resolve(self, cache, target, domain=None):
+        def in_domain(entity_ids):
+            return [e for e in entity_ids if domain is None or e.startswith(domain + '.')]
+
+        with self._lock:
+            if self._generation != cache.generation or not self._entity_ids:
+                self._rebuild(cache)
+            name = normalize(target)
+            name = self.aliases.get(name, name)
+            candidates = in_domain(self._names.get(name) or self._names.get(name.replace(' ', '_'), []))
+            if not candidates:
+                # Same fallback as the original Papa light lookup: any entity
+                # id that contains the name.
+                fragment = name.replace(' ', '_')
+                candidates = in_domain(e for e in self._entity_ids if fragment in e)
+        return candidates[0] if candidates else None
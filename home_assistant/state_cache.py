@@ -0,0 +1,150 @@
+"""
+Write-through cache of Home Assistant entity states.
+
+The full /api/states list is downloaded once and then kept up to date from
+our own service calls: the expected state is applied as soon as a call
+succeeds, the states Home Assistant returns from the call overwrite it, and
+a background fetch of the touched entities reconciles anything the
+prediction or the response missed. Reads are answered from memory until the
+cache is older than its TTL.
+"""
+
+import copy
+import threading
+import time
+
+DEFAULT_TTL = 60
+RECONCILE_DELAY = 1.0
+
+
+def _brightness_from_pct(pct):
+    return round(max(0, min(100, pct)) * 255 / 100)
+
+
+def predict_state(state, domain, service, data):
+    """Return the state we expect after calling domain.service with data."""
+    state = copy.deepcopy(state)
+    attributes = state.setdefault('attributes', {})
+    data = data or {}
+
+    if service == 'toggle':
+        service = 'turn_off' if state.get('state') == 'on' else 'turn_on'
+
+    if service == 'turn_on':
+        state['state'] = 'on'
+        if 'brightness_pct' in data:
+            attributes['brightness'] = _brightness_from_pct(data['brightness_pct'])
+        if 'brightness' in data:
+            attributes['brightness'] = data['brightness']
+        for key in ('rgb_color', 'color_temp', 'percentage', 'preset_mode'):
+            if key in data:
+                attributes[key] = data[key]
+    elif service == 'turn_off':
+        state['state'] = 'off'
+        if domain == 'light':
+            attributes['brightness'] = None
+    else:
+        # Services we do not know how to predict are left to reconciliation.
+        return None
+    return state
+
+
+class StateCache:
+    def __init__(self, fetch_states, fetch_state, ttl=DEFAULT_TTL, reconcile_delay=RECONCILE_DELAY):
+        """
+        Args:
+            fetch_states: callable returning the full list of states
+            fetch_state: callable(entity_id) returning one state or None
+            ttl: seconds before a full refresh is forced
+            reconcile_delay: seconds to wait before re-reading touched entities
+                (None disables background reconciliation)
+        """
+        self.fetch_states = fetch_states
+        self.fetch_state = fetch_state
+        self.ttl = ttl
+        self.reconcile_delay = reconcile_delay
+        self._lock = threading.Lock()
+        self._states = {}
+        self._loaded_at = None
+        # Bumped whenever the set of entities may have changed, so indexes
+        # built on top of the cache know when to rebuild.
+        self.generation = 0
+        self._reconcile = set()
+        self._timer = None
+
+    def _fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def refresh(self):
+        states = self.fetch_states()
+        with self._lock:
+            self._states = {state['entity_id']: state for state in states}
+            self._loaded_at = time.monotonic()
+            self.generation += 1
+        return states
+
+    def all(self):
+        if not self._fresh():
+            self.refresh()
+        with self._lock:
+            return [copy.deepcopy(state) for state in self._states.values()]
+
+    def get(self, entity_id):
+        if not self._fresh():
+            self.refresh()
+        with self._lock:
+            state = self._states.get(entity_id)
+            return copy.deepcopy(state) if state is not None else None
+
+    def update(self, states):
+        with self._lock:
+            for state in states or []:
+                if isinstance(state, dict) and 'entity_id' in state:
+                    self._states[state['entity_id']] = state
+
+    def record_call(self, domain, service, entity_ids, data, response):
+        """Apply a successful service call to the cache."""
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        entity_ids = list(entity_ids or [])
+        with self._lock:
+            for entity_id in entity_ids:
+                current = self._states.get(entity_id)
+                if current is None:
+                    continue
+                predicted = predict_state(current, domain, service, data)
+                if predicted is not None:
+                    self._states[entity_id] = predicted
+        self.update(response if isinstance(response, list) else [])
+        self._schedule_reconcile(entity_ids)
+
+    def _schedule_reconcile(self, entity_ids):
+        if self.reconcile_delay is None or not entity_ids:
+            return
+        with self._lock:
+            self._reconcile.update(entity_ids)
+            if self._timer is None:
+                self._timer = threading.Timer(self.reconcile_delay, self.reconcile)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def reconcile(self):
+        """Re-read entities touched by recent calls from Home Assistant."""
+        with self._lock:
+            entity_ids, self._reconcile = self._reconcile, set()
+            self._timer = None
+        for entity_id in entity_ids:
+            try:
+                state = self.fetch_state(entity_id)
+            except Exception:
+                # Keep the predicted state; the next refresh will correct it.
+                continue
+            with self._lock:
+                if state is None:
+                    self._states.pop(entity_id, None)
+                else:
+                    self._states[entity_id] = state
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
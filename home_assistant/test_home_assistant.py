@@ -0,0 +1,650 @@
+"""
+Tests for the Home Assistant skill
+"""
+import base64
+import json
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from intents import INTENTS_PATH, IntentMatcher, get_matcher
+from fuzzy import FuzzyIndex, FuzzyResolver, edit_distance
+from coalesce import Coalescer
+from command_queue import CommandQueue
+import scheduler
+from scheduler import Scheduler, parse_duration, parse_time
+from mock_server import MockHomeAssistant
+import main
+from services import EntityIndex, ServiceError, ServiceRegistry
+from state_cache import StateCache
+import tracing
+import client
+import daemon
+import commands
+import loadtest
+
+
+class TestIntentMatcher(unittest.TestCase):
+    def setUp(self):
+        self.matcher = get_matcher()
+
+    def test_plain_patterns(self):
+        """Patterns without slots match case and punctuation insensitively"""
+        self.assertEqual(self.matcher.match("Turn on the light").intent, "turn_on_light")
+        self.assertEqual(self.matcher.match("light off!").intent, "turn_off_light")
+        self.assertEqual(self.matcher.match("  flip   the light ").intent, "toggle_light")
+
+    def test_brightness_slot(self):
+        """Brightness is extracted as an integer percentage"""
+        match = self.matcher.match("make light 40% bright")
+        self.assertEqual(match.intent, "set_brightness")
+        self.assertEqual(match.slots, {"brightness": 40})
+        self.assertEqual(match.arguments(), {"brightness_pct": 40})
+        self.assertIsNone(self.matcher.match("set brightness to 150"))
+
+    def test_color_slots(self):
+        """Colour names, hex and triplets become RGB lists; kelvin becomes mireds"""
+        self.assertEqual(self.matcher.match("make light red").slots, {"rgb_color": [255, 0, 0]})
+        self.assertEqual(self.matcher.match("set color to #00FF00").slots, {"rgb_color": [0, 255, 0]})
+        self.assertEqual(self.matcher.match("change color to 1, 2, 3").slots, {"rgb_color": [1, 2, 3]})
+        self.assertEqual(self.matcher.match("set color temperature to 2500K").slots, {"color_temp": 400})
+        self.assertEqual(self.matcher.match("set color temperature to 02700k").slots, {"color_temp": 370})
+        self.assertEqual(self.matcher.match("set color temperature to 250 mireds").slots, {"color_temp": 250})
+        for value in ["00k", "00", "50000k", "20 mireds"]:
+            self.assertIsNone(self.matcher.match(f"set color temperature to {value}"), value)
+
+    def test_device_patterns(self):
+        """Generic device patterns capture the device name and typed values"""
+        match = self.matcher.match("open the blinds to 40%")
+        self.assertEqual((match.intent, match.slots), ("set_cover_position", {"device": "blinds", "position": 40}))
+        match = self.matcher.match("set the aircon to 24.5 degrees")
+        self.assertEqual(match.slots, {"device": "aircon", "temperature": 24.5})
+        self.assertEqual(self.matcher.match("turn on the kitchen fan").slots, {"device": "kitchen fan"})
+
+    def test_unknown_utterance(self):
+        """Utterances that no pattern covers return None"""
+        self.assertIsNone(self.matcher.match("what's the weather like"))
+        self.assertIsNone(IntentMatcher({}).match("turn on the light"))
+
+
+class TestFuzzyResolver(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.test_dir, 'intent_index.json')
+        self.resolver = FuzzyResolver.load(cache_path=self.cache_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_edit_distance(self):
+        """Transpositions count as one edit"""
+        self.assertEqual(edit_distance("kitten", "sitting"), 3)
+        self.assertEqual(edit_distance("lihgt", "light"), 1)
+        self.assertEqual(edit_distance(["turn", "on"], ["turn", "off"]), 1)
+
+    def test_paraphrases(self):
+        """Paraphrased, misspelt and Cantonese utterances resolve to the right intent"""
+        self.assertEqual(self.resolver.resolve("could you switch the light on please").intent, "turn_on_light")
+        self.assertEqual(self.resolver.resolve("toggel the lihgt").intent, "toggle_light")
+        self.assertEqual(self.resolver.resolve("唔該幫我開下燈呀").intent, "turn_on_light")
+        self.assertIsNone(self.resolver.resolve("what is the weather"))
+
+    def test_slots_and_devices(self):
+        """Slots are pulled out of free text and device aliases are resolved"""
+        match = self.resolver.resolve("please make the light 30 percent")
+        self.assertEqual(match.intent, "set_brightness")
+        self.assertEqual(match.slots, {"brightness": 30})
+        self.assertEqual(self.resolver.resolve("幫我熄咗爸爸盞燈").device, "papa_light")
+
+    def test_other_devices_are_rejected(self):
+        """Utterances naming a device the pattern does not cover do not resolve to it"""
+        for text in ["switch the tv on", "turn the fan on", "switch on the tv", "開風扇",
+                     "turn off the light in the fan room"]:
+            self.assertIsNone(self.resolver.resolve(text), text)
+
+    def test_incremental_rebuild(self):
+        """Only new patterns are tokenized when intents.json changes"""
+        intents_path = os.path.join(self.test_dir, 'intents.json')
+        data = json.loads(INTENTS_PATH.read_text(encoding='utf-8'))
+        with open(intents_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        first = FuzzyIndex.load(intents_path, self.cache_path)
+
+        data['intents']['turn_on_light']['patterns'].append('lights up')
+        with open(intents_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        second = FuzzyIndex.load(intents_path, self.cache_path)
+
+        self.assertEqual(len(second.entries), len(first.entries) + 1)
+        reused = [key for key in first.entries if second.entries.get(key) == first.entries[key]]
+        self.assertEqual(len(reused), len(first.entries))
+        self.assertEqual(FuzzyResolver(second).resolve("lights up!").intent, "turn_on_light")
+
+
+class TestCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.coalescer = Coalescer(lambda *call: self.calls.append(call) or 'ok', window=0.05)
+
+    def tearDown(self):
+        self.coalescer.close()
+
+    def test_burst_is_merged(self):
+        """A burst of changes to one entity becomes a single call with the latest values"""
+        tickets = [self.coalescer.submit('light', 'turn_on', 'light.a', {'brightness_pct': pct}) for pct in (10, 20, 30)]
+        tickets.append(self.coalescer.submit('light', 'turn_on', 'light.a', {'rgb_color': [255, 0, 0]}))
+        self.assertEqual(tickets[-1].result(timeout=2), 'ok')
+        self.assertEqual(self.calls, [('light', 'turn_on', 'light.a', {'brightness_pct': 30, 'rgb_color': [255, 0, 0]})])
+        self.assertEqual([t.superseded_by for t in tickets], [4, 4, 4, None])
+        self.assertEqual(self.coalescer.stats(), {'sent': 1, 'superseded': 3, 'pending': 0})
+
+    def test_entities_and_services_are_separate(self):
+        """Different entities are sent independently; a new service replaces the pending one"""
+        self.coalescer.submit('light', 'turn_on', 'light.a', {'brightness_pct': 10})
+        last = self.coalescer.submit('light', 'turn_off', 'light.a')
+        other = self.coalescer.submit('light', 'turn_on', 'light.b', {'brightness_pct': 50})
+        last.result(timeout=2)
+        other.result(timeout=2)
+        self.assertEqual(sorted(self.calls), [
+            ('light', 'turn_off', 'light.a', {}),
+            ('light', 'turn_on', 'light.b', {'brightness_pct': 50}),
+        ])
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f'HTTP {status_code}')
+        self.response = type('Response', (), {'status_code': status_code})()
+
+
+class TestCommandQueue(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.calls = []
+        self.failures = {}
+        self.queue = CommandQueue(Path(self.test_dir) / 'commands.db', self.execute, workers=4,
+                                  base_delay=0.05, max_delay=0.2, max_attempts=5)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def execute(self, action, args):
+        self.calls.append((action, args))
+        failure = self.failures.get(action)
+        if callable(failure):
+            failure = failure()
+        if failure:
+            raise failure
+        return f'{action} ok'
+
+    def wait_for(self, job_id, statuses=('done', 'failed'), timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = self.queue.get(job_id)
+            if job['status'] in statuses:
+                return job
+            time.sleep(0.01)
+        self.fail(f'job {job_id} still {job["status"]}')
+
+    def test_idempotency_key(self):
+        """A key that was already queued returns the first job"""
+        first, created = self.queue.enqueue('turn_on', ['50'], key='msg-1')
+        self.assertTrue(created)
+        again, created = self.queue.enqueue('turn_on', ['50'], key='msg-1')
+        self.assertFalse(created)
+        self.assertEqual(again['id'], first['id'])
+        self.queue.start()
+        self.wait_for(first['id'])
+        self.assertEqual(self.calls, [('turn_on', ['50'])])
+
+    def test_transient_failures_are_retried(self):
+        """Connection errors and 5xx back off and retry; 4xx fails at once"""
+        self.failures['turn_on'] = ConnectionError('refused')
+        self.failures['call'] = lambda: HTTPStatusError(400)
+        self.queue.start()
+        retried, _ = self.queue.enqueue('turn_on', [])
+        rejected, _ = self.queue.enqueue('call', ['light', 'bogus'])
+        self.assertEqual(self.wait_for(rejected['id'])['status'], 'failed')
+        self.wait_for(retried['id'], statuses=('pending',))
+        time.sleep(0.15)
+        self.failures['turn_on'] = None
+        job = self.wait_for(retried['id'])
+        self.assertEqual(job['status'], 'done')
+        self.assertGreater(job['attempts'], 1)
+        self.assertEqual(self.calls.count(('call', ['light', 'bogus'])), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        self.failures['toggle'] = lambda: HTTPStatusError(503)
+        self.queue.start()
+        job, _ = self.queue.enqueue('toggle', [])
+        job = self.wait_for(job['id'])
+        self.assertEqual((job['status'], job['attempts']), ('failed', 5))
+
+    def test_lanes_keep_order(self):
+        """Commands for one device run in order, even across a retry"""
+        errors = [ConnectionError('refused'), ConnectionError('refused')]
+        self.failures['turn_on'] = lambda: errors.pop() if errors else None
+        first, _ = self.queue.enqueue('turn_on', [], lane='light')
+        second, _ = self.queue.enqueue('turn_off', [], lane='light')
+        other, _ = self.queue.enqueue('toggle', [], lane='fan')
+        self.queue.start()
+        self.wait_for(second['id'])
+        order = [action for action, _ in self.calls]
+        self.assertEqual(order.count('turn_on'), 3)
+        self.assertEqual(order[-1], 'turn_off')
+        self.assertEqual(self.wait_for(other['id'])['attempts'], 1)
+
+    def test_survives_restart(self):
+        """Queued commands are on disk and run by the next process"""
+        job, _ = self.queue.enqueue('turn_off', [])
+        queue = CommandQueue(self.queue.path, self.execute, workers=1)
+        try:
+            queue.start()
+            self.assertEqual(self.wait_for(job['id'])['output'], 'turn_off ok')
+        finally:
+            queue.close()
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.sent = threading.Event()
+        self.values = {}
+        self.scheduler = Scheduler(self.send, current=lambda entity_id, field: self.values.get(entity_id))
+        self.min_step = scheduler.MIN_STEP
+        scheduler.MIN_STEP = 0.02
+
+    def tearDown(self):
+        scheduler.MIN_STEP = self.min_step
+        self.scheduler.close()
+
+    def send(self, domain, service, entity_id, data):
+        self.calls.append((domain, service, entity_id, data))
+        self.sent.set()
+
+    def test_parsing(self):
+        self.assertEqual(parse_duration('1h 30m'), 5400)
+        self.assertEqual(parse_duration('90 seconds'), 90)
+        with self.assertRaises(ValueError):
+            parse_duration('soon')
+        now = time.time()
+        self.assertEqual(parse_time('in 10 minutes', now), now + 600)
+        when = parse_time('at 23:00', now)
+        self.assertTrue(now < when <= now + 86400)
+        self.assertEqual(time.localtime(when)[3:5], (23, 0))
+
+    def test_calls_due_together_are_merged(self):
+        """Same service and data share a call; later data for an entity wins"""
+        when = time.time() + 0.1
+        for i in range(5):
+            self.scheduler.call_at(when, 'light', 'turn_off', f'light.l{i}')
+        self.scheduler.call_at(when, 'light', 'turn_on', 'light.x', {'brightness_pct': 10})
+        self.scheduler.call_at(when + 0.01, 'light', 'turn_on', 'light.x', {'brightness_pct': 60})
+        cancelled = self.scheduler.call_at(when, 'switch', 'turn_on', 'switch.s')
+        self.assertTrue(self.scheduler.cancel(cancelled.id))
+        self.assertEqual(len(self.scheduler.pending()), 7)
+        self.scheduler.start()
+        deadline = time.monotonic() + 2
+        while self.scheduler.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(sorted(self.calls, key=str), [
+            ('light', 'turn_off', [f'light.l{i}' for i in range(5)], {}),
+            ('light', 'turn_on', 'light.x', {'brightness_pct': 60}),
+        ])
+        self.assertEqual(self.scheduler.batches, 1)
+
+    def test_fade(self):
+        """A fade starts from the current value and steps to the target"""
+        self.values['light.x'] = 50
+        self.scheduler.start()
+        self.scheduler.fade(time.time(), 'light', 'turn_on', 'light.x', 'brightness_pct', 40, 0.3)
+        deadline = time.monotonic() + 2
+        while self.scheduler.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        values = [data['brightness_pct'] for _, _, _, data in self.calls]
+        self.assertEqual(values[-1], 40)
+        self.assertEqual(values, sorted(values, reverse=True))
+        self.assertGreater(len(values), 3)
+        self.assertTrue(all(40 <= value < 50 for value in values))
+
+
+class TestStateCache(unittest.TestCase):
+    def setUp(self):
+        self.remote = {
+            'light.a': {'entity_id': 'light.a', 'state': 'off', 'attributes': {'brightness': None}},
+            'switch.b': {'entity_id': 'switch.b', 'state': 'on', 'attributes': {}},
+        }
+        self.downloads = 0
+        self.cache = StateCache(self.fetch_states, self.remote.get, ttl=60, reconcile_delay=None)
+
+    def fetch_states(self):
+        self.downloads += 1
+        return [dict(state) for state in self.remote.values()]
+
+    def test_reads_are_cached(self):
+        """The state list is downloaded once and served from memory afterwards"""
+        self.assertEqual(self.cache.get('light.a')['state'], 'off')
+        self.assertEqual(len(self.cache.all()), 2)
+        self.assertIsNone(self.cache.get('light.missing'))
+        self.assertEqual(self.downloads, 1)
+
+    def test_write_through(self):
+        """Successful calls update the cache with the predicted state, then the response"""
+        self.cache.get('light.a')
+        self.cache.record_call('light', 'turn_on', 'light.a', {'brightness_pct': 100}, [])
+        self.assertEqual(self.cache.get('light.a')['state'], 'on')
+        self.assertEqual(self.cache.get('light.a')['attributes']['brightness'], 255)
+
+        self.cache.record_call('switch', 'toggle', 'switch.b', None, [])
+        self.assertEqual(self.cache.get('switch.b')['state'], 'off')
+
+        changed = {'entity_id': 'light.a', 'state': 'on', 'attributes': {'brightness': 128}}
+        self.cache.record_call('light', 'turn_on', 'light.a', {'brightness_pct': 100}, [changed])
+        self.assertEqual(self.cache.get('light.a'), changed)
+        self.assertEqual(self.downloads, 1)
+
+    def test_reconcile(self):
+        """Reconciliation replaces predictions with what Home Assistant reports"""
+        self.cache.get('light.a')
+        self.cache.record_call('light', 'turn_on', 'light.a', None, [])
+        self.remote['light.a'] = {'entity_id': 'light.a', 'state': 'unavailable', 'attributes': {}}
+        self.cache._reconcile.add('light.a')
+        self.cache.reconcile()
+        self.assertEqual(self.cache.get('light.a')['state'], 'unavailable')
+
+
+class TestServices(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.fetches = 0
+        self.registry = ServiceRegistry(self.fetch_services, cache_path=Path(self.test_dir) / 'services.json')
+        self.cache = StateCache(lambda: [
+            {'entity_id': 'light.papa_light', 'state': 'off', 'attributes': {'friendly_name': 'Papa Light'}},
+            {'entity_id': 'fan.bedroom_fan', 'state': 'off', 'attributes': {'friendly_name': 'Bedroom Fan'}},
+            {'entity_id': 'switch.bedroom_fan_plug', 'state': 'on', 'attributes': {}},
+        ], lambda entity_id: None, reconcile_delay=None)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def fetch_services(self):
+        self.fetches += 1
+        return [{'domain': 'fan', 'services': {'set_percentage': {'fields': {
+            'percentage': {'required': True, 'selector': {'number': {'min': 0, 'max': 100}}},
+        }}}}]
+
+    def test_validation(self):
+        """Payloads are checked against the fetched schema, which is cached on disk"""
+        self.registry.validate('fan', 'set_percentage', {'percentage': 40})
+        with self.assertRaises(ServiceError):
+            self.registry.validate('fan', 'set_percentage', {'percentage': 140})
+        with self.assertRaises(ServiceError):
+            self.registry.validate('fan', 'set_percentage', {})
+        with self.assertRaises(ServiceError):
+            self.registry.validate('fan', 'set_percentage', {'percentage': 40, 'speed': 'high'})
+        # Domains missing from the fetched schema fall back to the built-in table
+        with self.assertRaises(ServiceError):
+            self.registry.validate('cover', 'set_cover_position', {'position': 'half'})
+
+        ServiceRegistry(self.fetch_services, cache_path=self.registry.cache_path).validate('fan', 'set_percentage', {'percentage': 1})
+        self.assertEqual(self.fetches, 1)
+
+    def test_entity_resolution(self):
+        """Targets resolve by entity id, friendly name, alias or id fragment, optionally per domain"""
+        index = EntityIndex({'爸爸燈': 'papa_light'})
+        self.assertEqual(index.resolve(self.cache, 'Bedroom Fan'), 'fan.bedroom_fan')
+        self.assertEqual(index.resolve(self.cache, 'bedroom fan', 'switch'), 'switch.bedroom_fan_plug')
+        self.assertEqual(index.resolve(self.cache, '爸爸燈'), 'light.papa_light')
+        self.assertEqual(index.resolve(self.cache, 'papa'), 'light.papa_light')
+        self.assertIsNone(index.resolve(self.cache, 'garage door'))
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        tracing.reset()
+
+    def tearDown(self):
+        tracing.configure(None)
+        tracing.reset()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_percentiles(self):
+        """Nearest-rank percentiles over recorded spans"""
+        for ms in range(1, 101):
+            tracing.record('call', float(ms))
+        summary = tracing.stats()['call']
+        self.assertEqual((summary['count'], summary['p50_ms'], summary['p95_ms'], summary['p99_ms']), (100, 50.0, 95.0, 99.0))
+        self.assertIn('call', tracing.format_stats(tracing.stats()))
+
+    def test_nested_spans_and_trace_file(self):
+        """Spans record their parent, errors, and can be replayed from the trace file"""
+        path = os.path.join(self.test_dir, 'trace.jsonl')
+        tracing.configure(path)
+        with tracing.span('command', action='status'):
+            with tracing.span('get_states'):
+                pass
+        with self.assertRaises(KeyError):
+            with tracing.span('command', action='bad'):
+                raise KeyError('x')
+        tracing.configure(None)
+
+        with open(path, encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual([e['span'] for e in entries], ['get_states', 'command', 'command'])
+        self.assertEqual(entries[0]['parent'], 'command')
+        self.assertEqual(entries[0]['trace'], entries[1]['trace'])
+        self.assertEqual(entries[2]['error'], 'KeyError')
+        self.assertEqual(tracing.stats_from_file(path)['command']['errors'], 1)
+
+
+def websocket_connect(url):
+    host, port = url.split('//')[1].split(':')
+    sock = socket.create_connection((host, int(port)), timeout=5)
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall((f"GET /api/websocket HTTP/1.1\r\nHost: {host}\r\nUpgrade: websocket\r\n"
+                  f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    reader = sock.makefile('rb')
+    while reader.readline() not in (b'\r\n', b''):
+        pass
+    return sock, reader
+
+
+def websocket_send(sock, payload):
+    data = json.dumps(payload).encode()
+    mask = os.urandom(4)
+    sock.sendall(bytes([0x81, 0x80 | len(data)]) + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(data)))
+
+
+def websocket_receive(reader):
+    header = reader.read(2)
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', reader.read(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', reader.read(8))[0]
+    return json.loads(reader.read(length))
+
+
+class TestAgainstMockServer(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.server = MockHomeAssistant(entities=20).start()
+        self.config_path = main.CONFIG_PATH
+        main.CONFIG_PATH = self.server.write_config(self.test_dir)
+        main.reset_caches()
+        main._registry = ServiceRegistry(main.get_services, cache_path=Path(self.test_dir) / 'services.json')
+
+    def tearDown(self):
+        main.CONFIG_PATH = self.config_path
+        main.reset_caches()
+        self.server.stop()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_light_commands(self):
+        """Light helpers call the service and status is answered from the cache"""
+        result = main.turn_on_light(brightness_pct=40)
+        self.assertEqual(result[0]['state'], 'on')
+        self.assertEqual(self.server.states['light.papa_light']['attributes']['brightness'], 102)
+        main.toggle_light()
+        for _ in range(3):
+            self.assertEqual(main.get_light_state()['state'], 'off')
+        self.assertEqual(self.server.requests['GET /api/states'], 1)
+        self.assertEqual(self.server.requests['POST /api/services'], 2)
+
+    def test_other_domains(self):
+        """Covers resolve by friendly name; invalid payloads never reach the server"""
+        main.call_service('cover', 'set_cover_position', 'Cover 3', {'position': 40})
+        self.assertEqual(self.server.states['cover.cover_3']['attributes']['current_position'], 40)
+        with self.assertRaises(ServiceError):
+            main.call_service('cover', 'set_cover_position', 'Cover 3', {'position': 400})
+        with self.assertRaises(LookupError):
+            main.call_service('fan', 'turn_on', 'Cover 3')
+        self.assertEqual(self.server.requests['POST /api/services'], 1)
+
+    def test_cold_load(self):
+        """Cold starts keep the test's schema cache and never run beside a command"""
+        registry_path = Path(self.test_dir) / 'services.json'
+        cold_start = loadtest.local_reset(registry_path)
+        in_flight = []
+        resets = []
+        lock = threading.Lock()
+
+        def execute(action, args):
+            with lock:
+                in_flight.append(action)
+            try:
+                commands.run(action, args)
+            finally:
+                with lock:
+                    in_flight.remove(action)
+
+        def reset():
+            resets.append(len(in_flight))
+            cold_start()
+
+        report = loadtest.run_load(execute, [('turn_on', ['40']), ('status', [])], 4, 20, reset=reset)
+        self.assertEqual(report['errors'], 0, report['first_errors'])
+        self.assertEqual(resets, [0] * 20)
+        self.assertEqual(main._registry.cache_path, registry_path)
+        self.assertTrue(registry_path.exists())
+
+    def test_coalesced_brightness_is_validated(self):
+        """Under the daemon's coalescer out-of-range brightness is rejected like in cli.py"""
+        commands.enable_coalescing(0.05)
+        try:
+            for value in ('250', '-5'):
+                with self.assertRaises(ServiceError):
+                    commands.run('set_brightness', [value])
+            self.assertNotIn('POST /api/services', self.server.requests)
+            commands.run('set_brightness', ['60'])
+        finally:
+            commands.enable_coalescing(0)
+        self.assertEqual(self.server.states['light.papa_light']['attributes']['brightness'], 153)
+
+    def test_queue_rides_out_slow_server(self):
+        """Timed-out calls stay queued and run once the server is fast again"""
+        config = json.loads(main.CONFIG_PATH.read_text())
+        config['request_timeout'] = 0.2
+        main.CONFIG_PATH.write_text(json.dumps(config))
+        main._file_cache.clear()
+        main.get_states()
+        queue = CommandQueue(Path(self.test_dir) / 'commands.db', commands.run, workers=2,
+                             base_delay=0.05, max_delay=0.1)
+        self.addCleanup(setattr, commands, '_command_queue', commands._command_queue)
+        commands._command_queue = queue.start()
+        self.addCleanup(queue.close)
+
+        self.server.latency = 0.5
+        self.assertEqual(commands.run('queue', ['--key', 'msg-1', 'turn_on', '30']), 'Queued #1: turn_on 30')
+        self.assertTrue(commands.run('queue', ['--key', 'msg-1', 'turn_on', '30']).startswith('Already queued as #1'))
+        deadline = time.monotonic() + 5
+        while queue.get(1)['attempts'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIn(queue.get(1)['status'], ('pending', 'running'))
+        self.server.latency = 0
+        while queue.get(1)['status'] != 'done' and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIn('#1 turn_on 30: done', commands.run('queue', []))
+        self.assertEqual(self.server.states['light.papa_light']['attributes']['brightness'], 76)
+
+    def test_schedule_commands(self):
+        """Scheduled commands run later against the server and can be cancelled"""
+        self.addCleanup(setattr, commands, '_scheduler', commands._scheduler)
+        self.addCleanup(lambda: commands._scheduler.close())
+        commands.enable_scheduler()
+        reply = commands.run('schedule', ['in', '0.2s', 'set_brightness', '20'])
+        self.assertRegex(reply, r'^Scheduled #1 at .*: set_brightness 20$')
+        commands.run('schedule', ['at', '23:59', 'call', 'cover', 'open_cover', 'Cover 3'])
+        self.assertIn('#2', commands.run('schedules', []))
+        self.assertEqual(commands.run('unschedule', ['2']), 'Cancelled #2')
+        with self.assertRaises(commands.CommandError):
+            commands.run('schedule', ['tomorrowish', 'turn_off'])
+        reply = commands.run('say', ['turn', 'off', 'the', 'light', 'in', '0.2s'])
+        self.assertIn('say turn off the light', reply)
+        # An entry leaves the list before its service call is answered.
+        deadline = time.monotonic() + 3
+        while ((commands.run('schedules', []) != 'Nothing scheduled'
+                or self.server.requests.get('POST /api/services', 0) < 2) and time.monotonic() < deadline):
+            time.sleep(0.02)
+        self.assertEqual(self.server.states['light.papa_light']['state'], 'off')
+        self.assertEqual(self.server.requests['POST /api/services'], 2)
+
+    def test_bad_token(self):
+        """Requests with the wrong token are rejected"""
+        self.server.token = 'other'
+        with self.assertRaises(Exception):
+            main.get_states()
+
+    def test_websocket(self):
+        """WebSocket clients authenticate, read states and receive state_changed events"""
+        sock, reader = websocket_connect(self.server.url)
+        try:
+            self.assertEqual(websocket_receive(reader)['type'], 'auth_required')
+            websocket_send(sock, {'type': 'auth', 'access_token': self.server.token})
+            self.assertEqual(websocket_receive(reader)['type'], 'auth_ok')
+            websocket_send(sock, {'id': 1, 'type': 'get_states'})
+            self.assertEqual(len(websocket_receive(reader)['result']), 20)
+            websocket_send(sock, {'id': 2, 'type': 'subscribe_events', 'event_type': 'state_changed'})
+            self.assertTrue(websocket_receive(reader)['success'])
+            main.turn_on_light()
+            event = websocket_receive(reader)
+            self.assertEqual(event['event']['data']['new_state']['state'], 'on')
+        finally:
+            sock.close()
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.test_dir, 'ha.sock')
+        self.server = daemon.CommandServer(self.socket_path, daemon.CommandHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_round_trip(self):
+        """The client gets one JSON reply per request over the socket"""
+        self.assertEqual(client.send({'action': 'ping'}, self.socket_path), {'ok': True, 'output': 'pong'})
+        reply = client.send({'action': 'bogus', 'args': []}, self.socket_path)
+        self.assertFalse(reply['ok'])
+        self.assertEqual(reply['output'], 'Unknown action: bogus')
+        reply = client.send({'action': 'say', 'args': []}, self.socket_path)
+        self.assertIn('Usage:', reply['output'])
+
+
+if __name__ == '__main__':
+    unittest.main()
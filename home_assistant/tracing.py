@@ -0,0 +1,189 @@
+"""
+Lightweight timing spans for the command path.
+
+    with span('get_states'):
+        ...
+
+Every finished span is added to an in-memory histogram for its name and
+emitted as a JSON log record on the 'home_assistant.trace' logger. When a
+trace file is configured (HOME_ASSISTANT_TRACE_FILE or configure()), the
+records are also appended there, so percentiles can be computed across
+one-shot cli.py runs as well as inside the daemon.
+"""
+
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger('home_assistant.trace')
+
+# Samples kept per span name for percentiles; count, total and max cover
+# the whole lifetime.
+RESERVOIR_SIZE = 2048
+
+_lock = threading.Lock()
+_local = threading.local()
+_trace_ids = itertools.count(1)
+_histograms = {}
+_trace_file = None
+_trace_path = None
+
+
+class Histogram:
+    __slots__ = ('samples', 'count', 'total', 'max', 'errors')
+
+    def __init__(self, maxlen=RESERVOIR_SIZE):
+        self.samples = deque(maxlen=maxlen)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def add(self, duration_ms, error=False):
+        self.samples.append(duration_ms)
+        self.count += 1
+        self.total += duration_ms
+        self.max = max(self.max, duration_ms)
+        self.errors += error
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'mean_ms': round(self.total / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(percentile(ordered, 50), 3),
+            'p95_ms': round(percentile(ordered, 95), 3),
+            'p99_ms': round(percentile(ordered, 99), 3),
+            'max_ms': round(self.max, 3),
+        }
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def configure(trace_file=None):
+    """Append span records to trace_file (None stops writing)."""
+    global _trace_file, _trace_path
+    with _lock:
+        if _trace_file is not None:
+            _trace_file.close()
+        _trace_file = open(trace_file, 'a', buffering=1, encoding='utf-8') if trace_file else None
+        _trace_path = trace_file
+
+
+def trace_path():
+    return _trace_path
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextmanager
+def span(name, **fields):
+    stack = _stack()
+    # Several cli.py processes may share a trace file, so ids carry the pid.
+    trace_id = stack[-1][1] if stack else f'{os.getpid()}-{next(_trace_ids)}'
+    parent = stack[-1][0] if stack else None
+    stack.append((name, trace_id))
+    error = None
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        stack.pop()
+        record(name, duration_ms, error=error, trace=trace_id, parent=parent, **fields)
+
+
+def traced(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name, duration_ms, error=None, **fields):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(duration_ms, error is not None)
+        trace_file = _trace_file
+
+    if trace_file is None and not logger.isEnabledFor(logging.DEBUG):
+        return
+    entry = {'ts': round(time.time(), 3), 'span': name, 'ms': round(duration_ms, 3)}
+    if error:
+        entry['error'] = error
+    entry.update({key: value for key, value in fields.items() if value is not None})
+    line = json.dumps(entry, default=str)
+    logger.debug(line)
+    if trace_file is not None:
+        with _lock:
+            if not trace_file.closed:
+                trace_file.write(line + '\n')
+
+
+def stats():
+    with _lock:
+        return {name: histogram.summary() for name, histogram in sorted(_histograms.items())}
+
+
+def stats_from_file(path):
+    """Rebuild the histograms from a trace file written by configure()."""
+    histograms = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            histogram = histograms.get(entry['span'])
+            if histogram is None:
+                histogram = histograms[entry['span']] = Histogram(maxlen=None)
+            histogram.add(entry['ms'], 'error' in entry)
+    return {name: histogram.summary() for name, histogram in sorted(histograms.items())}
+
+
+def format_stats(summary):
+    if not summary:
+        return 'No timings recorded yet'
+    width = max(len(name) for name in summary)
+    lines = [f"{'span':<{width}}  {'count':>6}  {'p50':>8}  {'p95':>8}  {'p99':>8}  {'max':>8}  errors"]
+    for name, s in summary.items():
+        lines.append(
+            f"{name:<{width}}  {s['count']:>6}  {s['p50_ms']:>8.2f}  {s['p95_ms']:>8.2f}  "
+            f"{s['p99_ms']:>8.2f}  {s['max_ms']:>8.2f}  {s['errors']}"
+        )
+    return '\n'.join(lines)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+if os.environ.get('HOME_ASSISTANT_TRACE_FILE'):
+    configure(os.environ['HOME_ASSISTANT_TRACE_FILE'])
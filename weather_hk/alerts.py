@@ -0,0 +1,198 @@
+"""
+Weather warning alerts for any number of subscribers.
+
+One AlertPoller polls the HKO warnings summary (warnsum), compares it with
+the previous poll and hands the differences to every subscriber: a signal
+raised, changed (amber to red rainstorm, T3 to T8) or cancelled. Upstream
+traffic is one request per interval however many users are subscribed.
+Subscribers get events through a callback, or from a queue they read at
+their own pace.
+"""
+
+import logging
+import queue
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+from hko_parsers import WarningSignal, parse_warnsum
+
+logger = logging.getLogger("weather_hk.alerts")
+
+DEFAULT_INTERVAL = 60.0
+# Events a queue subscriber may fall behind by before new ones are dropped.
+QUEUE_SIZE = 100
+
+ISSUED = "issued"
+CHANGED = "changed"
+CANCELLED = "cancelled"
+
+
+class AlertEvent:
+    __slots__ = ("kind", "warning", "previous")
+
+    def __init__(self, kind: str, warning: WarningSignal, previous: Optional[WarningSignal] = None):
+        self.kind = kind  # ISSUED, CHANGED or CANCELLED
+        self.warning = warning
+        self.previous = previous
+
+    @property
+    def text(self) -> str:
+        if self.kind == ISSUED:
+            return f"{self.warning.name} issued ({self.warning.code})"
+        if self.kind == CANCELLED:
+            return f"{self.warning.name} cancelled"
+        return f"{self.warning.name} changed from {self.previous.code} to {self.warning.code}"
+
+    def as_dict(self) -> dict:
+        return {"kind": self.kind, "type": self.warning.type, "name": self.warning.name,
+                "code": self.warning.code, "previous_code": self.previous.code if self.previous else None,
+                "update_time": self.warning.update_time, "text": self.text}
+
+    def __repr__(self):
+        return f"AlertEvent({self.kind!r}, {self.warning.code!r})"
+
+
+def diff_warnings(old: Dict[str, WarningSignal], new: Dict[str, WarningSignal]) -> List[AlertEvent]:
+    """Events that turn the warnings in `old` into those in `new`."""
+    events = []
+    for kind, warning in new.items():
+        previous = old.get(kind)
+        if previous is None:
+            events.append(AlertEvent(ISSUED, warning))
+        elif previous.code != warning.code:
+            events.append(AlertEvent(CHANGED, warning, previous))
+    events.extend(AlertEvent(CANCELLED, warning) for kind, warning in old.items() if kind not in new)
+    return events
+
+
+class Subscription:
+    def __init__(self, poller: "AlertPoller", callback: Optional[Callable[[AlertEvent], None]],
+                 types: Optional[Iterable[str]]):
+        self.poller = poller
+        self.callback = callback
+        self.types = frozenset(types) if types else None
+        # Only used without a callback.
+        self.queue: "queue.Queue[AlertEvent]" = queue.Queue(QUEUE_SIZE)
+        self.dropped = 0
+
+    def wants(self, event: AlertEvent) -> bool:
+        return self.types is None or event.warning.type in self.types
+
+    def deliver(self, event: AlertEvent) -> None:
+        if self.callback is not None:
+            self.callback(event)
+            return
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def get(self, timeout: Optional[float] = None) -> Optional[AlertEvent]:
+        """Next event from the queue, or None after timeout seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def cancel(self) -> None:
+        self.poller.unsubscribe(self)
+
+
+class AlertPoller:
+    def __init__(self, fetch: Callable[[], dict], interval: float = DEFAULT_INTERVAL):
+        """
+        Args:
+            fetch: callable returning the raw warnsum payload, e.g.
+                WeatherHKSkill.fetch_warnings
+            interval: seconds between polls
+        """
+        self.fetch = fetch
+        self.interval = interval
+        self.active: Dict[str, WarningSignal] = {}
+        self._baseline = False
+        self._subscriptions: List[Subscription] = []
+        self._lock = threading.Lock()
+        # Held while events are delivered, so a new subscriber gets the
+        # warnings in force before any later change. Reentrant for callbacks
+        # that subscribe.
+        self._publish_lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback: Optional[Callable[[AlertEvent], None]] = None,
+                  types: Optional[Iterable[str]] = None, current: bool = False) -> Subscription:
+        """
+        Args:
+            callback: called with each AlertEvent on the poller thread; without
+                one, events are queued on the returned Subscription
+            types: only these warning types (e.g. {"WRAIN", "WTCSGNL"})
+            current: deliver the warnings already in force as ISSUED events
+
+        Returns:
+            The Subscription (cancel() it to stop receiving events)
+        """
+        subscription = Subscription(self, callback, types)
+        with self._publish_lock:
+            with self._lock:
+                self._subscriptions.append(subscription)
+                active = list(self.active.values()) if current else []
+            for warning in active:
+                event = AlertEvent(ISSUED, warning)
+                if subscription.wants(event):
+                    self._deliver(subscription, event)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    @staticmethod
+    def _deliver(subscription: Subscription, event: AlertEvent) -> None:
+        try:
+            subscription.deliver(event)
+        except Exception:
+            # One broken subscriber must not cost the others their alerts.
+            logger.exception("Alert subscriber failed on %r", event)
+
+    def poll(self) -> List[AlertEvent]:
+        """
+        Fetch once and publish the changes since the previous poll. The
+        first poll only records what is in force.
+
+        Returns:
+            The events published
+        """
+        warnings = parse_warnsum(self.fetch())
+        with self._publish_lock:
+            with self._lock:
+                events = diff_warnings(self.active, warnings) if self._baseline else []
+                self.active = warnings
+                self._baseline = True
+                subscriptions = list(self._subscriptions)
+            for event in events:
+                logger.info("%s", event.text)
+                for subscription in subscriptions:
+                    if subscription.wants(event):
+                        self._deliver(subscription, event)
+        return events
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning("Warning poll failed: %s", e)
+            self._stop.wait(self.interval)
+
+    def start(self) -> "AlertPoller":
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="weather_hk_alerts", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
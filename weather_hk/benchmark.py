@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark for the Hong Kong Weather skill.
+
+Starts stand_in_server.MockWeatherServer with a delay on every endpoint and
+times each skill method under three setups, reporting latency percentiles
+and upstream requests per call:
+
+    sequential   no cache, sources fetched one after another
+    concurrent   no cache, sources fetched in parallel
+    cached       default TTLs, after one warm-up call
+
+    python3 benchmark.py --runs 20 --delay-ms 50
+    python3 benchmark.py --delay-ms 50 --endpoint-delay-ms forecast=400 --json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from forecast_analytics import np
+from http_cache import DEFAULT_TTLS
+from stand_in_server import MockWeatherServer, parse_pairs
+from weather_hk import WeatherHKSkill
+
+METHODS = {
+    "get_current_weather": lambda skill: skill.get_current_weather(),
+    "get_forecast": lambda skill: skill.get_forecast(),
+    "get_rain_chance_and_humidity": lambda skill: skill.get_rain_chance_and_humidity(),
+    "get_district_weather": lambda skill: skill.get_district_weather("Sha Tin"),
+}
+if np is not None:
+    METHODS["get_forecast_analysis"] = lambda skill: skill.get_forecast_analysis()
+
+SETUPS = {
+    "sequential": {"concurrent": False, "cache_ttl": {name: 0 for name in DEFAULT_TTLS}, "stale_ttl": 0},
+    "concurrent": {"concurrent": True, "cache_ttl": {name: 0 for name in DEFAULT_TTLS}, "stale_ttl": 0},
+    "cached": {"concurrent": True},
+}
+
+
+def percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def measure(server: MockWeatherServer, setup: dict, method, runs: int) -> dict:
+    """Time `runs` calls of method on a fresh skill; returns the latency and request figures."""
+    skill = WeatherHKSkill(cache_dir=None, snapshot_path=None, history_path=None, **setup)
+    server.configure(skill)
+    if "cache_ttl" not in setup:
+        method(skill)
+    server.reset_counts()
+    latencies = []
+    errors = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        try:
+            method(skill)
+        except Exception:
+            errors += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": round(percentile(ordered, 50), 2),
+        "p95_ms": round(percentile(ordered, 95), 2),
+        "max_ms": round(ordered[-1], 2),
+        "requests_per_call": round(sum(server.requests.values()) / runs, 2),
+        "errors": errors,
+    }
+
+
+def run_benchmark(runs: int = 10, delay: float = 0.05, endpoint_delays: Optional[Dict[str, float]] = None,
+                  setups: Optional[List[str]] = None) -> Dict[str, Dict[str, dict]]:
+    """
+    Args:
+        runs: calls per method and setup
+        delay: seconds the stand-in server waits before every answer
+        endpoint_delays: per-endpoint overrides of delay
+        setups: names from SETUPS to run (all by default)
+
+    Returns:
+        setup -> method -> measure() result
+    """
+    delays = {name: delay for name in DEFAULT_TTLS}
+    delays.update(endpoint_delays or {})
+    report = {}
+    with MockWeatherServer(delays=delays) as server:
+        for setup in setups or SETUPS:
+            report[setup] = {name: measure(server, SETUPS[setup], method, runs) for name, method in METHODS.items()}
+    return report
+
+
+def format_report(report: Dict[str, Dict[str, dict]]) -> str:
+    lines = [f"{'method':<30} {'setup':<11} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'req/call':>8}"]
+    for name in METHODS:
+        for setup, results in report.items():
+            r = results[name]
+            lines.append(f"{name:<30} {setup:<11} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['max_ms']:>8} "
+                         f"{r['requests_per_call']:>8}" + (f"  ({r['errors']} errors)" if r["errors"] else ""))
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Hong Kong Weather skill against a stand-in server")
+    parser.add_argument("--runs", type=int, default=10, help="calls per method and setup")
+    parser.add_argument("--delay-ms", type=float, default=50, help="stand-in server latency for every endpoint")
+    parser.add_argument("--endpoint-delay-ms", action="append", metavar="ENDPOINT=MS",
+                        help="latency for one endpoint, may be repeated")
+    parser.add_argument("--setup", action="append", choices=list(SETUPS), help="only run these setups")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args.runs, args.delay_ms / 1000,
+                           parse_pairs(args.endpoint_delay_ms, lambda ms: float(ms) / 1000), args.setup)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
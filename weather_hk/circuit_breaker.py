@@ -0,0 +1,99 @@
+"""
+Circuit breaker per upstream host.
+
+After a few consecutive failures (no connection, timeouts, 5xx, 429) the
+breaker opens and requests to that host fail at once instead of waiting for
+another timeout. After reset_timeout one trial request is let through: if it
+succeeds the breaker closes, otherwise it stays open for another period.
+"""
+
+import threading
+import time
+from typing import Callable
+
+import requests
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_RESET_TIMEOUT = 30.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request to an upstream that is failing."""
+
+
+def is_failure(exc: BaseException) -> bool:
+    """True for errors that say the upstream is unwell rather than the request wrong."""
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is not None:
+        return status >= 500 or status == 429
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, OSError))
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            name: upstream the breaker protects, used in error messages
+            failure_threshold: consecutive failures that open the breaker
+            reset_timeout: seconds to stay open before a trial request
+            clock: time source (monotonic seconds)
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def retry_in(self) -> float:
+        """Seconds until the next trial request is allowed (0 when closed)."""
+        with self._lock:
+            if self._state == CLOSED:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - self.clock())
+
+    def allow(self) -> bool:
+        """
+        Whether a request may be sent now. While half-open, only the caller
+        that gets True sends the trial request; everyone else waits for its
+        outcome.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self.clock() - self._opened_at < self.reset_timeout:
+                return False
+            # Claim the trial; the next period starts now in case it hangs.
+            self._state = HALF_OPEN
+            self._opened_at = self.clock()
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._state = CLOSED
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = self.clock()
+
+    def error(self) -> CircuitOpenError:
+        return CircuitOpenError(f"{self.name} is failing; not retrying for {self.retry_in():.0f}s")
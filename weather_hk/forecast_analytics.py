@@ -0,0 +1,148 @@
+"""
+Vectorized analytics over the OpenWeatherMap 5-day / 3-hour forecast.
+
+The whole forecast (up to 40 periods) is loaded into NumPy arrays once, and
+daily aggregates, rolling windows and dry-window searches are computed on
+those arrays, so richer answers cost no extra requests. NumPy is optional:
+without it, ForecastArrays raises ImportError and the rest of the skill
+works as before.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the installation
+    np = None
+
+PERIOD_HOURS = 3
+# Hong Kong time, used when the payload has no city.timezone.
+DEFAULT_UTC_OFFSET = 8 * 3600
+
+
+def _isoformat(timestamp: float, offset: int) -> str:
+    return datetime.fromtimestamp(timestamp, timezone(timedelta(seconds=offset))).strftime("%Y-%m-%d %H:%M")
+
+
+class ForecastArrays:
+    """Forecast periods as parallel arrays, one element per 3-hour period."""
+
+    def __init__(self, periods: List[dict], utc_offset: int = DEFAULT_UTC_OFFSET):
+        """
+        Args:
+            periods: the "list" of an OpenWeatherMap forecast response
+            utc_offset: seconds east of UTC used to split the days
+
+        Raises:
+            ImportError: NumPy is not installed
+        """
+        if np is None:
+            raise ImportError("Forecast analytics need NumPy: pip install numpy")
+        self.utc_offset = utc_offset
+        count = len(periods)
+        self.time = np.fromiter((p["dt"] for p in periods), dtype=np.int64, count=count)
+        self.temp = np.fromiter((p["main"]["temp"] for p in periods), dtype=np.float64, count=count)
+        self.humidity = np.fromiter((p["main"]["humidity"] for p in periods), dtype=np.float64, count=count)
+        self.rain = np.fromiter(((p.get("rain") or {}).get("3h", 0.0) for p in periods), dtype=np.float64, count=count)
+        # Probability of precipitation, 0..1; older responses do not have it.
+        self.pop = np.fromiter((p.get("pop", 0.0) for p in periods), dtype=np.float64, count=count)
+        self.day = (self.time + utc_offset) // 86400
+
+    @classmethod
+    def from_response(cls, data: dict) -> "ForecastArrays":
+        """Build from a full forecast response (uses city.timezone if present)."""
+        offset = (data.get("city") or {}).get("timezone", DEFAULT_UTC_OFFSET)
+        return cls(data.get("list") or [], offset)
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def rolling_mean(self, values: "np.ndarray", hours: int) -> "np.ndarray":
+        """
+        Mean over each run of `hours` consecutive hours
+
+        Args:
+            values: one of the per-period arrays
+            hours: window length, rounded up to whole periods
+
+        Returns:
+            Array with one value per complete window (empty if the forecast is shorter)
+        """
+        window = max(1, -(-hours // PERIOD_HOURS))
+        if len(values) < window:
+            return np.empty(0)
+        sums = np.cumsum(np.concatenate(([0.0], values)))
+        return (sums[window:] - sums[:-window]) / window
+
+    def next_hours(self, hours: int = 24) -> dict:
+        """Rain chance and average humidity over the first `hours` of the forecast."""
+        count = min(len(self), max(1, -(-hours // PERIOD_HOURS)))
+        if count == 0:
+            return {"chance_of_rain": 0.0, "average_humidity": None, "rain_total": 0.0}
+        return {
+            "chance_of_rain": round(float(np.mean(self.rain[:count] > 0)) * 100, 1),
+            "average_humidity": round(float(np.mean(self.humidity[:count])), 1),
+            "rain_total": round(float(np.sum(self.rain[:count])), 1),
+        }
+
+    def daily(self) -> List[dict]:
+        """
+        Aggregates per local calendar day
+
+        Returns:
+            One dictionary per day: temperature range, mean humidity, total
+            rain and the chance of rain at some point that day (from pop,
+            treating the periods as independent)
+        """
+        if len(self) == 0:
+            return []
+        days, starts = np.unique(self.day, return_index=True)
+        counts = np.diff(np.append(starts, len(self)))
+        temp_min = np.minimum.reduceat(self.temp, starts)
+        temp_max = np.maximum.reduceat(self.temp, starts)
+        humidity = np.add.reduceat(self.humidity, starts) / counts
+        rain = np.add.reduceat(self.rain, starts)
+        dry = np.multiply.reduceat(1.0 - self.pop, starts)
+        rainy_periods = np.add.reduceat((self.rain > 0).astype(np.int64), starts)
+        return [
+            {
+                "date": (datetime(1970, 1, 1) + timedelta(days=int(day))).strftime("%Y-%m-%d"),
+                "periods": int(counts[i]),
+                "temp_min": round(float(temp_min[i]), 1),
+                "temp_max": round(float(temp_max[i]), 1),
+                "humidity_mean": round(float(humidity[i]), 1),
+                "rain_total": round(float(rain[i]), 1),
+                "rainy_periods": int(rainy_periods[i]),
+                "chance_of_rain": round(float(1.0 - dry[i]) * 100, 1),
+            }
+            for i, day in enumerate(days)
+        ]
+
+    def best_dry_window(self, hours: int = 3, within_hours: Optional[int] = None) -> Optional[dict]:
+        """
+        Find the driest stretch of `hours` consecutive hours
+
+        Args:
+            hours: length of the window
+            within_hours: only search the first this many hours of the forecast
+
+        Returns:
+            Start and end time, expected rain and mean rain probability of
+            the window with the least expected rain (earliest wins ties), or
+            None if the forecast is too short
+        """
+        count = len(self) if within_hours is None else min(len(self), -(-within_hours // PERIOD_HOURS))
+        window = max(1, -(-hours // PERIOD_HOURS))
+        if count < window:
+            return None
+        rain = self.rolling_mean(self.rain[:count], hours) * window
+        pop = self.rolling_mean(self.pop[:count], hours)
+        # Least rain first, then the lowest chance of any rain.
+        best = int(np.lexsort((pop, np.round(rain, 2)))[0])
+        return {
+            "start": _isoformat(int(self.time[best]), self.utc_offset),
+            "end": _isoformat(int(self.time[best + window - 1]) + PERIOD_HOURS * 3600, self.utc_offset),
+            "rain_total": round(float(rain[best]), 1),
+            "chance_of_rain": round(float(pop[best]) * 100, 1),
+        }
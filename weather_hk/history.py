@@ -0,0 +1,228 @@
+"""
+Local history of weather observations and forecasts.
+
+Every HKO report and OpenWeatherMap forecast the skill fetches is written to
+a SQLite file, one row per station, quantity and time. Rows are keyed by the
+time HKO published them, so the same cached report seen twice is stored once.
+Trend questions ("rain this week", "humidity trend", "compare to
+yesterday") are then answered with indexed range queries on this file
+instead of more API calls.
+"""
+
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from http_cache import DEFAULT_CACHE_DIR
+from locations import StationReadings
+
+DEFAULT_HISTORY_PATH = DEFAULT_CACHE_DIR / "history.db"
+# Older rows are dropped by prune(), which the refresher runs once a day.
+DEFAULT_RETENTION = 400 * 24 * 3600
+HKT = timezone(timedelta(hours=8))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    station TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (station, kind, time)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS observations_time ON observations (kind, time);
+CREATE TABLE IF NOT EXISTS forecasts (
+    target INTEGER NOT NULL,
+    issued INTEGER NOT NULL,
+    temp REAL,
+    humidity REAL,
+    rain REAL,
+    pop REAL,
+    PRIMARY KEY (target, issued)
+) WITHOUT ROWID;
+"""
+
+# Observation kinds: HKO temperature and humidity stations, past-hour
+# rainfall per automatic weather station (hrf) and per district (rhb).
+TEMPERATURE = "temperature"
+HUMIDITY = "humidity"
+RAINFALL = "rainfall"
+DISTRICT_RAINFALL = "district_rainfall"
+
+
+def timestamp(value: Optional[str]) -> Optional[int]:
+    """Seconds since the epoch for an HKO time such as 2026-10-19T11:02:00+08:00."""
+    if not value:
+        return None
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        return None
+
+
+def start_of_week(now: Optional[float] = None) -> int:
+    """Monday 00:00 Hong Kong time of the current week."""
+    today = datetime.fromtimestamp(time.time() if now is None else now, HKT).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    return int((today - timedelta(days=today.weekday())).timestamp())
+
+
+class HistoryStore:
+    def __init__(self, path: Path = DEFAULT_HISTORY_PATH):
+        """
+        Args:
+            path: SQLite file, created on first use (":memory:" for tests)
+        """
+        self.path = path if str(path) == ":memory:" else Path(path).expanduser()
+        self._local = threading.local()
+        self._shared = None
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _db(self) -> sqlite3.Connection:
+        if self.path == ":memory:":
+            # A private in-memory database only exists on its one connection.
+            if self._shared is None:
+                self._shared = sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False)
+                self._shared.executescript(SCHEMA)
+            return self._shared
+        db = getattr(self._local, "db", None)
+        if db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            with self._lock:
+                if not self._schema_ready:
+                    db.executescript(SCHEMA)
+                    self._schema_ready = True
+            self._local.db = db
+        return db
+
+    def _write(self, sql: str, rows: List[tuple]) -> int:
+        if not rows:
+            return 0
+        db = self._db()
+        with self._lock:
+            db.execute("BEGIN")
+            try:
+                before = db.total_changes
+                db.executemany(sql, rows)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return db.total_changes - before
+
+    def record_readings(self, readings: StationReadings) -> int:
+        """
+        Store one parsed rhb/hrf pair
+
+        Returns:
+            Number of new rows (0 when this update was already recorded)
+        """
+        rows = []
+        report_time = timestamp(readings.update_time)
+        if report_time is not None:
+            for kind, values in ((TEMPERATURE, readings.temperature), (HUMIDITY, readings.humidity),
+                                 (DISTRICT_RAINFALL, readings.district_rainfall)):
+                rows.extend((station, kind, report_time, value) for station, value in values.items())
+        rainfall_time = timestamp(readings.obs_time)
+        if rainfall_time is not None:
+            rows.extend((station, RAINFALL, rainfall_time, value)
+                        for station, value in readings.station_rainfall.items())
+        return self._write("INSERT OR IGNORE INTO observations VALUES (?, ?, ?, ?)", rows)
+
+    def record_forecast(self, response: dict) -> int:
+        """
+        Store an OpenWeatherMap 5-day / 3-hour forecast
+
+        The first period stands in for the issue time, which the response
+        does not include; a re-fetch of the same run replaces its rows.
+        """
+        periods = response.get("list") or []
+        if not periods:
+            return 0
+        issued = periods[0]["dt"]
+        rows = [(p["dt"], issued, p["main"].get("temp"), p["main"].get("humidity"),
+                 (p.get("rain") or {}).get("3h", 0.0), p.get("pop")) for p in periods]
+        return self._write("INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def series(self, kind: str, station: str, since: float, until: Optional[float] = None) -> List[Tuple[int, float]]:
+        """(time, value) readings of one station between since and until, oldest first."""
+        until = time.time() if until is None else until
+        return self._db().execute(
+            "SELECT time, value FROM observations WHERE station = ? AND kind = ? AND time >= ? AND time <= ?"
+            " ORDER BY time", (station, kind, int(since), int(until))).fetchall()
+
+    def hourly(self, kind: str, station: str, since: float, until: Optional[float] = None) -> List[Tuple[int, float]]:
+        """Mean value per clock hour: (start of the hour, mean), oldest first."""
+        until = time.time() if until is None else until
+        return self._db().execute(
+            "SELECT time / 3600 * 3600 AS hour, AVG(value) FROM observations"
+            " WHERE station = ? AND kind = ? AND time >= ? AND time <= ? GROUP BY hour ORDER BY hour",
+            (station, kind, int(since), int(until))).fetchall()
+
+    def rain_total(self, since: float, until: Optional[float] = None,
+                   station: Optional[str] = None) -> Dict[str, float]:
+        """
+        Rainfall per station between two times
+
+        hrf readings cover the past hour and are published every 15
+        minutes, so only the latest reading of each clock hour is added up.
+
+        Args:
+            since, until: time range in seconds since the epoch
+            station: one station instead of all of them
+
+        Returns:
+            Station -> total rainfall in mm
+        """
+        until = time.time() if until is None else until
+        params = [RAINFALL, int(since), int(until)]
+        where = "kind = ? AND time >= ? AND time <= ?"
+        if station is not None:
+            where += " AND station = ?"
+            params.append(station)
+        rows = self._db().execute(
+            "SELECT station, SUM(value) FROM ("
+            "  SELECT station, value, ROW_NUMBER() OVER ("
+            "    PARTITION BY station, time / 3600 ORDER BY time DESC) AS latest"
+            f"  FROM observations WHERE {where})"
+            " WHERE latest = 1 GROUP BY station", params).fetchall()
+        return {name: round(total, 1) for name, total in rows}
+
+    def nearest(self, kind: str, station: str, when: float, tolerance: float = 3600) -> Optional[Tuple[int, float]]:
+        """The (time, value) reading closest to `when`, if one is within tolerance seconds."""
+        return self._db().execute(
+            "SELECT time, value FROM observations WHERE station = ? AND kind = ? AND time BETWEEN ? AND ?"
+            " ORDER BY ABS(time - ?) LIMIT 1",
+            (station, kind, int(when - tolerance), int(when + tolerance), int(when))).fetchone()
+
+    def latest(self, kind: str, station: str) -> Optional[Tuple[int, float]]:
+        return self._db().execute(
+            "SELECT time, value FROM observations WHERE station = ? AND kind = ? ORDER BY time DESC LIMIT 1",
+            (station, kind)).fetchone()
+
+    def forecast_for(self, since: float, until: float) -> List[dict]:
+        """Latest forecast for each period between two times."""
+        rows = self._db().execute(
+            "SELECT target, MAX(issued), temp, humidity, rain, pop FROM forecasts"
+            " WHERE target >= ? AND target <= ? GROUP BY target ORDER BY target",
+            (int(since), int(until))).fetchall()
+        return [dict(zip(("target", "issued", "temp", "humidity", "rain", "pop"), row)) for row in rows]
+
+    def prune(self, retention: float = DEFAULT_RETENTION) -> None:
+        cutoff = int(time.time() - retention)
+        db = self._db()
+        with self._lock:
+            db.execute("DELETE FROM observations WHERE time < ?", (cutoff,))
+            db.execute("DELETE FROM forecasts WHERE target < ?", (cutoff,))
+
+    def close(self) -> None:
+        db = self._shared or getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+        self._shared = None
+        self._local = threading.local()
@@ -0,0 +1,223 @@
+"""
+Typed parsers for the Hong Kong Observatory open data payloads.
+
+Each parser makes one pass over the arrays of one dataset and keeps only
+the fields the skill uses, in small slotted dataclasses:
+
+    rhb  regional weather report   -> RegionalWeather
+    hrf  past-hour rainfall        -> HourlyRainfall
+    flw  local weather forecast    -> LocalForecast
+    fnd  9-day weather forecast    -> NineDayForecast
+    warnsum  warnings in force     -> {type: WarningSignal}
+
+Missing sections ("" in HKO payloads), readings under maintenance ("M")
+and unexpected types become None or empty tuples instead of exceptions, so
+one bad field does not hide the rest of the report.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+
+def _number(value) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _section(payload: dict, name: str) -> list:
+    # Sections are {"data": [...], ...}, or "" when there is nothing to report.
+    section = payload.get(name)
+    if isinstance(section, dict) and isinstance(section.get("data"), list):
+        return section["data"]
+    return []
+
+
+def _text(value) -> str:
+    return value if isinstance(value, str) else ""
+
+
+@dataclass(frozen=True)
+class Reading:
+    __slots__ = ("place", "value")
+    place: str
+    value: Optional[float]
+
+
+@dataclass(frozen=True)
+class RegionalWeather:
+    __slots__ = ("update_time", "temperature", "humidity", "district_rainfall", "uv_index",
+                 "uv_description", "rainfall_00_to_12", "icons", "warnings")
+    update_time: Optional[str]
+    temperature: Tuple[Reading, ...]
+    humidity: Tuple[Reading, ...]
+    # Past-hour maximum per district.
+    district_rainfall: Tuple[Reading, ...]
+    uv_index: Optional[float]
+    uv_description: Optional[str]
+    # Rainfall at the Observatory from midnight to noon, published after noon.
+    rainfall_00_to_12: Optional[float]
+    icons: Tuple[int, ...]
+    warnings: Tuple[str, ...]
+
+    def temperature_at(self, place: str) -> Optional[float]:
+        return next((r.value for r in self.temperature if r.place == place), None)
+
+    @property
+    def observatory_humidity(self) -> Optional[float]:
+        values = [r.value for r in self.humidity if r.value is not None]
+        return values[0] if values else None
+
+
+@dataclass(frozen=True)
+class HourlyRainfall:
+    __slots__ = ("obs_time", "stations")
+    obs_time: Optional[str]
+    stations: Tuple[Reading, ...]
+
+    @property
+    def max(self) -> Optional[float]:
+        values = [r.value for r in self.stations if r.value is not None]
+        return max(values) if values else None
+
+
+@dataclass(frozen=True)
+class LocalForecast:
+    __slots__ = ("update_time", "general_situation", "forecast_period", "forecast", "outlook", "tc_info")
+    update_time: Optional[str]
+    general_situation: str
+    forecast_period: str
+    forecast: str
+    outlook: str
+    tc_info: str
+
+
+@dataclass(frozen=True)
+class DayForecast:
+    __slots__ = ("date", "weekday", "weather", "wind", "temp_min", "temp_max", "rh_min", "rh_max",
+                 "rain_probability", "icon")
+    date: str
+    weekday: str
+    weather: str
+    wind: str
+    temp_min: Optional[float]
+    temp_max: Optional[float]
+    rh_min: Optional[float]
+    rh_max: Optional[float]
+    # HKO's probability of significant rain: "Low", "Medium Low", "Medium", "Medium High" or "High".
+    rain_probability: str
+    icon: Optional[int]
+
+
+@dataclass(frozen=True)
+class NineDayForecast:
+    __slots__ = ("update_time", "general_situation", "days")
+    update_time: Optional[str]
+    general_situation: str
+    days: Tuple[DayForecast, ...]
+
+
+@dataclass(frozen=True)
+class WarningSignal:
+    __slots__ = ("type", "name", "code", "action", "issue_time", "update_time")
+    # Key in warnsum, e.g. "WRAIN" or "WTCSGNL".
+    type: str
+    name: str
+    # The signal itself, e.g. "WRAINA" (amber rainstorm) or "TC8NE".
+    code: str
+    # ISSUE, REISSUE, EXTEND, UPDATE or CANCEL.
+    action: str
+    issue_time: Optional[str]
+    update_time: Optional[str]
+
+
+def parse_rhb(payload: dict) -> RegionalWeather:
+    payload = payload if isinstance(payload, dict) else {}
+    temperature = tuple(Reading(item.get("place"), _number(item.get("value")))
+                        for item in _section(payload, "temperature") if item.get("place"))
+    humidity = tuple(Reading(item.get("place"), _number(item.get("value")))
+                     for item in _section(payload, "humidity") if item.get("place"))
+    district_rainfall = tuple(Reading(item.get("place"), _number(item.get("max")))
+                              for item in _section(payload, "rainfall") if item.get("place"))
+    uv = _section(payload, "uvindex")
+    warnings = payload.get("warningMessage")
+    return RegionalWeather(
+        update_time=payload.get("updateTime"),
+        temperature=temperature,
+        humidity=humidity,
+        district_rainfall=district_rainfall,
+        uv_index=_number(uv[0].get("value")) if uv else None,
+        uv_description=uv[0].get("desc") if uv else None,
+        rainfall_00_to_12=_number(payload.get("rainfallFrom00To12")),
+        icons=tuple(icon for icon in payload.get("icon") or () if isinstance(icon, int)),
+        warnings=tuple(w for w in warnings if isinstance(w, str)) if isinstance(warnings, list) else (),
+    )
+
+
+def parse_hrf(payload: dict) -> HourlyRainfall:
+    payload = payload if isinstance(payload, dict) else {}
+    stations = tuple(Reading(item.get("automaticWeatherStation"), _number(item.get("value")))
+                     for item in payload.get("hourlyRainfall") or () if item.get("automaticWeatherStation"))
+    return HourlyRainfall(obs_time=payload.get("obsTime"), stations=stations)
+
+
+def parse_flw(payload: dict) -> LocalForecast:
+    payload = payload if isinstance(payload, dict) else {}
+    return LocalForecast(
+        update_time=payload.get("updateTime"),
+        general_situation=_text(payload.get("generalSituation")),
+        forecast_period=_text(payload.get("forecastPeriod")),
+        forecast=_text(payload.get("forecastDesc")),
+        outlook=_text(payload.get("outlook")),
+        tc_info=_text(payload.get("tcInfo")),
+    )
+
+
+def parse_fnd(payload: dict) -> NineDayForecast:
+    payload = payload if isinstance(payload, dict) else {}
+    days = []
+    for item in payload.get("weatherForecast") or ():
+        date = _text(item.get("forecastDate"))
+        days.append(DayForecast(
+            date=f"{date[:4]}-{date[4:6]}-{date[6:]}" if len(date) == 8 else date,
+            weekday=_text(item.get("week")),
+            weather=_text(item.get("forecastWeather")),
+            wind=_text(item.get("forecastWind")),
+            temp_min=_number((item.get("forecastMintemp") or {}).get("value")),
+            temp_max=_number((item.get("forecastMaxtemp") or {}).get("value")),
+            rh_min=_number((item.get("forecastMinrh") or {}).get("value")),
+            rh_max=_number((item.get("forecastMaxrh") or {}).get("value")),
+            rain_probability=_text(item.get("PSR")),
+            icon=item.get("ForecastIcon") if isinstance(item.get("ForecastIcon"), int) else None,
+        ))
+    return NineDayForecast(
+        update_time=payload.get("updateTime"),
+        general_situation=_text(payload.get("generalSituation")),
+        days=tuple(days),
+    )
+
+
+def parse_warnsum(payload: dict) -> Dict[str, WarningSignal]:
+    """Warnings in force by type; cancelled ones are left out."""
+    payload = payload if isinstance(payload, dict) else {}
+    warnings = {}
+    for kind, item in payload.items():
+        if not isinstance(item, dict) or item.get("actionCode") == "CANCEL":
+            continue
+        warnings[kind] = WarningSignal(
+            type=kind,
+            name=_text(item.get("name")),
+            code=_text(item.get("code")) or kind,
+            action=_text(item.get("actionCode")),
+            issue_time=item.get("issueTime"),
+            update_time=item.get("updateTime"),
+        )
+    return warnings
+
+
+PARSERS = {"rhb": parse_rhb, "hrf": parse_hrf, "flw": parse_flw, "fnd": parse_fnd, "warnsum": parse_warnsum}
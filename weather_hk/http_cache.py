@@ -0,0 +1,284 @@
+"""
+HTTP response cache for the weather APIs.
+
+Responses are cached by URL and query parameters with a time-to-live per
+endpoint, in memory and on disk, so separate processes answering the same
+question share one upstream request. Once an entry expires it is
+revalidated with If-None-Match / If-Modified-Since when the server sent an
+ETag or Last-Modified header, and a 304 answer just renews the entry.
+
+For up to stale_ttl seconds past its TTL an expired entry is still returned
+at once while a background thread refreshes it, so a slow or failing
+upstream does not slow the answer down. Each upstream host has a circuit
+breaker (circuit_breaker.py), so an upstream that keeps failing is not asked
+again until it had time to recover.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from circuit_breaker import DEFAULT_FAILURE_THRESHOLD, DEFAULT_RESET_TIMEOUT, CircuitBreaker, is_failure
+
+logger = logging.getLogger("weather_hk.http")
+
+# Seconds each endpoint stays fresh, keyed by OpenWeatherMap path or HKO
+# dataType. HKO issues the regional weather report (rhb) hourly and the
+# rainfall table (hrf) every 15 minutes; the local forecast (flw) a few
+# times a day and the 9-day forecast (fnd) twice a day. Warnings (warnsum)
+# change at any time.
+DEFAULT_TTLS = {
+    "weather": 10 * 60,
+    "forecast": 3 * 3600,
+    "rhb": 15 * 60,
+    "hrf": 15 * 60,
+    "flw": 30 * 60,
+    "fnd": 60 * 60,
+    "warnsum": 60,
+}
+DEFAULT_TTL = 5 * 60
+# Seconds past its TTL an entry is still served while it is refreshed.
+DEFAULT_STALE_TTL = 60 * 60
+# (connect, read) seconds for every upstream request.
+DEFAULT_TIMEOUT = (3.05, 10)
+DEFAULT_CACHE_DIR = Path(os.environ.get("WEATHER_HK_CACHE_DIR", Path.home() / ".cache" / "weather_hk"))
+
+# Query parameters that do not change the response and are kept out of
+# cache keys (and therefore out of the files on disk).
+_IGNORED_PARAMS = ("appid",)
+
+
+def endpoint_name(url: str, params: Optional[dict] = None) -> str:
+    """Name used to look up the TTL: HKO dataType, else the last path segment."""
+    if params and params.get("dataType"):
+        return params["dataType"]
+    query = urlsplit(url).query
+    for pair in query.split("&"):
+        name, _, value = pair.partition("=")
+        if name == "dataType" and value:
+            return value
+    return urlsplit(url).path.rstrip("/").rsplit("/", 1)[-1]
+
+
+class CacheEntry:
+    __slots__ = ("data", "stored_at", "etag", "last_modified")
+
+    def __init__(self, data: Any, stored_at: float, etag: Optional[str] = None,
+                 last_modified: Optional[str] = None):
+        self.data = data
+        self.stored_at = stored_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def as_dict(self) -> dict:
+        return {"data": self.data, "stored_at": self.stored_at, "etag": self.etag,
+                "last_modified": self.last_modified}
+
+
+class HTTPCache:
+    """
+    Fetches JSON over a pooled session, answering from the cache while the
+    entry is fresh.
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = DEFAULT_CACHE_DIR, ttls: Optional[Dict[str, float]] = None,
+                 session: Optional[requests.Session] = None, timeout=DEFAULT_TIMEOUT,
+                 stale_ttl: float = DEFAULT_STALE_TTL, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        """
+        Args:
+            cache_dir: directory for the on-disk copies (None keeps the cache in memory only)
+            ttls: per-endpoint TTL overrides, merged over DEFAULT_TTLS
+            session: requests session to use (a new one by default)
+            timeout: seconds, or (connect, read), for each request
+            stale_ttl: seconds past the TTL an entry is served while it is
+                refreshed in the background (0 always waits for upstream)
+            failure_threshold: consecutive failures that open a host's breaker
+            reset_timeout: seconds an open breaker fails requests at once
+        """
+        self.cache_dir = Path(cache_dir).expanduser() if cache_dir else None
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.stale_ttl = stale_ttl
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._entries: Dict[str, CacheEntry] = {}
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._executor = None
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "stale": 0, "short_circuited": 0}
+
+    def ttl(self, endpoint: str) -> float:
+        return self.ttls.get(endpoint, DEFAULT_TTL)
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        with self._lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    @staticmethod
+    def key(url: str, params: Optional[dict] = None) -> str:
+        items = sorted((str(k), str(v)) for k, v in (params or {}).items() if k not in _IGNORED_PARAMS)
+        return hashlib.sha1(json.dumps([url, items]).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Optional[Path]:
+        return self.cache_dir / f"{key}.json" if self.cache_dir else None
+
+    def _load(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+        path = self._path(key)
+        if path is None:
+            return entry
+        # Another process may have stored a newer copy.
+        try:
+            if entry is not None and path.stat().st_mtime <= entry.stored_at:
+                return entry
+            stored = json.loads(path.read_text(encoding="utf-8"))
+            entry = CacheEntry(stored["data"], stored["stored_at"], stored.get("etag"), stored.get("last_modified"))
+        except (OSError, ValueError, KeyError):
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def _store(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+        path = self._path(key)
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_text(json.dumps(entry.as_dict()), encoding="utf-8")
+            os.replace(tmp_path, path)
+            # Keep mtime and stored_at in step so _load can compare them.
+            os.utime(path, (entry.stored_at, entry.stored_at))
+        except OSError:
+            pass
+
+    def get_cached(self, url: str, params: Optional[dict] = None) -> Optional[CacheEntry]:
+        """The cached entry for url/params, fresh or not, without any request."""
+        return self._load(self.key(url, params))
+
+    def fetch(self, url: str, params: Optional[dict] = None, endpoint: Optional[str] = None,
+              max_age: Optional[float] = None) -> Any:
+        """
+        Return the decoded JSON for url/params.
+
+        Args:
+            url: request URL
+            params: query parameters
+            endpoint: name for the TTL lookup (derived from the URL by default)
+            max_age: use this TTL instead of the endpoint's, and never
+                answer with an older entry (0 always asks upstream)
+
+        Returns:
+            The response JSON, from the cache when it is fresh enough or
+            within stale_ttl of it
+
+        Raises:
+            requests.exceptions.RequestException: the request failed, or
+                circuit_breaker.CircuitOpenError if the upstream's breaker is open
+        """
+        key = self.key(url, params)
+        ttl = self.ttl(endpoint or endpoint_name(url, params)) if max_age is None else max_age
+        entry = self._load(key)
+        if entry is not None:
+            age = time.time() - entry.stored_at
+            if age < ttl:
+                self.stats["hits"] += 1
+                return entry.data
+            if max_age is None and age < ttl + self.stale_ttl:
+                self.stats["stale"] += 1
+                self._refresh_later(key, url, params, entry)
+                return entry.data
+        return self._request(key, url, params, entry)
+
+    def _request(self, key: str, url: str, params: Optional[dict], entry: Optional[CacheEntry]) -> Any:
+        breaker = self.breaker(url)
+        if not breaker.allow():
+            self.stats["short_circuited"] += 1
+            raise breaker.error()
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        try:
+            response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and entry is not None:
+                self.stats["revalidated"] += 1
+                self._store(key, CacheEntry(entry.data, time.time(), entry.etag, entry.last_modified))
+                breaker.record_success()
+                return entry.data
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            # A 4xx or a bad body still means the upstream is answering.
+            if is_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        breaker.record_success()
+        self.stats["misses"] += 1
+        self._store(key, CacheEntry(data, time.time(), response.headers.get("ETag"),
+                                    response.headers.get("Last-Modified")))
+        return data
+
+    def _refresh_later(self, key: str, url: str, params: Optional[dict], entry: CacheEntry) -> None:
+        # One refresh per key at a time, however many callers saw it stale.
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="weather_hk_refresh")
+
+        def refresh():
+            try:
+                self._request(key, url, params, entry)
+            except Exception as e:
+                logger.debug("Background refresh of %s failed: %s", url, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(refresh)
+
+    def wait_for_refreshes(self, timeout: float = 10.0) -> bool:
+        """Wait until no background refresh is running; False on timeout."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._refreshing:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self.cache_dir and self.cache_dir.is_dir():
+            for path in self.cache_dir.glob("*.json"):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
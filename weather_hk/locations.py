@@ -0,0 +1,182 @@
+"""
+Districts, weather stations and per-place readings for Hong Kong.
+
+locations.json lists the 18 districts and the HKO temperature stations with
+approximate coordinates, plus common area names (English and Chinese) for
+each district. LocationIndex resolves what a user typed to a district or a
+station and finds the nearest station to any point. StationReadings parses
+the station arrays of one rhb/hrf pair into dictionaries once, so answers
+for any number of places share a single fetch and a single parse.
+"""
+
+import json
+import math
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from hko_parsers import parse_hrf, parse_rhb
+
+LOCATIONS_PATH = Path(__file__).with_name("locations.json")
+
+_EARTH_RADIUS_KM = 6371.0
+
+
+def normalize(name: str) -> str:
+    """Lower-case, '&' as 'and', no punctuation and no trailing 'district'."""
+    name = name.strip().lower().replace("&", " and ").replace("’", "'")
+    name = re.sub(r"[^\w\s]", " ", name)
+    name = re.sub(r"\s+", " ", name).strip()
+    return re.sub(r"\s*(district|區)$", "", name) or name
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * _EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class Place:
+    __slots__ = ("kind", "name", "lat", "lon", "district")
+
+    def __init__(self, kind: str, name: str, lat: float, lon: float, district: str):
+        self.kind = kind  # "district" or "station"
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        self.district = district
+
+    def __repr__(self):
+        return f"Place({self.kind!r}, {self.name!r})"
+
+
+class LocationIndex:
+    def __init__(self, districts: Dict[str, dict], stations: Dict[str, dict]):
+        """
+        Args:
+            districts: name -> {"lat", "lon", "aliases"}
+            stations: name -> {"lat", "lon", "district"}
+        """
+        self.districts = {name: Place("district", name, d["lat"], d["lon"], name) for name, d in districts.items()}
+        self.stations = {name: Place("station", name, s["lat"], s["lon"], s["district"])
+                         for name, s in stations.items()}
+        self._names: Dict[str, Place] = {}
+        # Stations first, so that a district of the same name (Sha Tin,
+        # Tai Po, ...) wins: its rainfall covers the whole district.
+        for place in self.stations.values():
+            self._names[normalize(place.name)] = place
+        for name, d in districts.items():
+            place = self.districts[name]
+            for alias in d.get("aliases", []):
+                self._names.setdefault(normalize(alias), place)
+            self._names[normalize(name)] = place
+
+    @classmethod
+    def from_file(cls, path: Path = LOCATIONS_PATH) -> "LocationIndex":
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        return cls(data["districts"], data["stations"])
+
+    def resolve(self, text: str) -> Optional[Place]:
+        """
+        Find the district or station a user means
+
+        Args:
+            text: place name, e.g. "Mong Kok", "sha tin district" or "旺角"
+
+        Returns:
+            The matching Place, or None
+        """
+        name = normalize(text)
+        place = self._names.get(name)
+        if place is not None:
+            return place
+        # "weather in mong kok today" -> the longest known name it contains.
+        matches = [key for key in self._names if re.search(rf"(?<!\w){re.escape(key)}(?!\w)", name)
+                   or (not key.isascii() and key in name)]
+        if matches:
+            return self._names[max(matches, key=len)]
+        return None
+
+    def nearest_station(self, lat: float, lon: float,
+                        available: Optional[Iterable[str]] = None) -> Optional[Tuple[Place, float]]:
+        """
+        Closest station to a point
+
+        Args:
+            lat, lon: the point
+            available: only consider these station names (e.g. the ones
+                that reported a reading)
+
+        Returns:
+            (station, distance in km), or None if no station qualifies
+        """
+        names = self.stations.keys() if available is None else [n for n in available if n in self.stations]
+        best = None
+        for name in names:
+            station = self.stations[name]
+            distance = distance_km(lat, lon, station.lat, station.lon)
+            if best is None or distance < best[1]:
+                best = (station, distance)
+        return best
+
+    def nearest_district(self, lat: float, lon: float) -> Place:
+        return min(self.districts.values(), key=lambda d: distance_km(lat, lon, d.lat, d.lon))
+
+
+class StationReadings:
+    """Per-station and per-district values from one rhb and hrf payload."""
+
+    def __init__(self, weather_data: Optional[dict], rainfall_data: Optional[dict] = None):
+        report = parse_rhb(weather_data)
+        rainfall = parse_hrf(rainfall_data)
+        self.update_time = report.update_time
+        self.obs_time = rainfall.obs_time
+        # Stations under maintenance ("M") are left out.
+        self.temperature: Dict[str, float] = {r.place: r.value for r in report.temperature if r.value is not None}
+        self.humidity: Dict[str, float] = {r.place: r.value for r in report.humidity if r.value is not None}
+        # Past-hour maximum per district, keyed by normalized district name.
+        self.district_rainfall: Dict[str, float] = {normalize(r.place): r.value for r in report.district_rainfall
+                                                    if r.value is not None}
+        self.station_rainfall: Dict[str, float] = {r.place: r.value for r in rainfall.stations if r.value is not None}
+
+    @property
+    def key(self) -> Tuple[Optional[str], Optional[str]]:
+        return self.update_time, self.obs_time
+
+    def for_place(self, place: Place, index: LocationIndex) -> dict:
+        """
+        Readings for a district or station
+
+        Args:
+            place: resolved Place
+            index: index used for the nearest-station lookup
+
+        Returns:
+            Dictionary with temperature, humidity and rainfall for the place
+        """
+        if place.kind == "station" and place.name in self.temperature:
+            station, distance = place, 0.0
+        else:
+            nearest = index.nearest_station(place.lat, place.lon, self.temperature)
+            station, distance = nearest if nearest else (None, None)
+
+        humidity = next(iter(self.humidity.values()), "N/A")
+        return {
+            "location": place.name,
+            "district": place.district,
+            "temperature": {
+                "value": self.temperature[station.name] if station else "N/A",
+                "station": station.name if station else None,
+                "distance_km": round(distance, 1) if station else None,
+                "unit": "C",
+            },
+            "humidity": {"value": humidity, "unit": "%"},
+            "rainfall_past_hour": {
+                "district_max": self.district_rainfall.get(normalize(place.district), "N/A"),
+                "station": self.station_rainfall.get(station.name, "N/A") if station else "N/A",
+                "unit": "mm",
+            },
+            "update_time": self.update_time,
+        }
+
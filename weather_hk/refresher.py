@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Background refresher for the Hong Kong Weather skill.
+
+Polls the upstream APIs on their own cadence and publishes the
+get_rain_chance_and_humidity result and its formatted text to the snapshot
+file, so the skill answers from a local file and the request volume no
+longer depends on how often users ask.
+
+    python3 refresher.py --config config.local.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from snapshot import DEFAULT_SNAPSHOT_PATH, write_snapshot
+from weather_hk import WeatherHKSkill, format_rain_summary, initialize_skill
+
+logger = logging.getLogger("weather_hk.refresher")
+
+# Endpoints behind get_rain_chance_and_humidity; the refresher wakes up as
+# often as the quickest of them expires.
+SOURCES = ("weather", "forecast", "rhb", "hrf")
+# Wait before trying again after a failed refresh.
+RETRY_INTERVAL = 60
+# Seconds between two runs of HistoryStore.prune() on the skill's history.
+PRUNE_INTERVAL = 24 * 3600
+
+
+class Refresher:
+    def __init__(self, skill: WeatherHKSkill, snapshot_path: Path = DEFAULT_SNAPSHOT_PATH,
+                 interval: Optional[float] = None):
+        """
+        Args:
+            skill: skill used to fetch (its HTTP cache decides what is re-fetched)
+            snapshot_path: file the snapshot is published to
+            interval: seconds between refreshes (default: the shortest TTL of SOURCES)
+        """
+        self.skill = skill
+        self.snapshot_path = Path(snapshot_path).expanduser()
+        self.interval = interval or min(skill.http.ttl(name) for name in SOURCES)
+        self._stop = threading.Event()
+        self._next_prune = 0.0
+
+    def refresh(self) -> dict:
+        """Fetch, compute and publish one snapshot, pruning the history once a day."""
+        summary = self.skill.fetch_rain_chance_and_humidity()
+        snapshot = write_snapshot(self.snapshot_path, summary, format_rain_summary(summary))
+        logger.info("Snapshot written to %s", self.snapshot_path)
+        self.prune_history()
+        return snapshot
+
+    def prune_history(self) -> None:
+        """Drop history rows past their retention, at most once per PRUNE_INTERVAL."""
+        if self.skill.history is None or time.monotonic() < self._next_prune:
+            return
+        try:
+            self.skill.history.prune()
+        except sqlite3.Error as e:
+            logger.warning("Could not prune weather history: %s", e)
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+                delay = self.interval
+            except Exception as e:
+                # The previous snapshot stays until it is too old to use.
+                logger.warning("Refresh failed: %s", e)
+                delay = min(self.interval, RETRY_INTERVAL)
+            self._stop.wait(delay)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute Hong Kong weather answers in the background")
+    parser.add_argument("--config", help="JSON file with the skill configuration (api_key, cache_dir, ...)")
+    parser.add_argument("--snapshot", help=f"snapshot file (default: snapshot_path from the config, or {DEFAULT_SNAPSHOT_PATH})")
+    parser.add_argument("--interval", type=float, help="seconds between refreshes (default: shortest endpoint TTL)")
+    parser.add_argument("--once", action="store_true", help="write one snapshot and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    config = {}
+    if args.config:
+        config = json.loads(Path(args.config).read_text(encoding="utf-8"))
+    config.setdefault("api_key", os.environ.get("OPENWEATHERMAP_API_KEY"))
+    # The refresher must never answer from its own snapshot, nor publish
+    # stale responses it could have refreshed.
+    config["use_snapshot"] = False
+    config["stale_ttl"] = 0
+    skill = initialize_skill(config)
+    refresher = Refresher(skill, args.snapshot or config.get("snapshot_path") or DEFAULT_SNAPSHOT_PATH,
+                          args.interval)
+    if args.once:
+        print(refresher.refresh()["text"])
+        return
+    try:
+        refresher.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Record/replay transport for the weather APIs.
+
+RecordingSession wraps a real requests session and saves every successful
+JSON response to fixtures/<endpoint>.json (OpenWeatherMap path or HKO
+dataType, as http_cache.endpoint_name names it). ReplaySession answers
+from those files with optional per-endpoint delays and failures, so the
+skill runs and can be measured without a network:
+
+    skill.http.session = ReplaySession(delays={"forecast": 0.2}, failures={"hrf": 503})
+"""
+
+import json
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import requests
+
+from http_cache import endpoint_name
+
+FIXTURES_DIR = Path(__file__).with_name("fixtures")
+
+
+class ReplayResponse:
+    """The part of requests.Response that HTTPCache uses."""
+
+    def __init__(self, status_code: int, body: str = "", headers: Optional[dict] = None, url: str = ""):
+        self.status_code = status_code
+        self.text = body
+        self.headers = headers or {}
+        self.url = url
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+class ReplaySession:
+    def __init__(self, fixtures_dir: Path = FIXTURES_DIR, delays: Optional[Dict[str, float]] = None,
+                 failures: Optional[Dict[str, Union[int, Exception]]] = None):
+        """
+        Args:
+            fixtures_dir: directory of recorded <endpoint>.json payloads
+            delays: endpoint -> seconds to wait before answering
+            failures: endpoint -> HTTP status to answer with, or an
+                exception to raise (e.g. requests.exceptions.ConnectTimeout)
+        """
+        self.fixtures_dir = Path(fixtures_dir)
+        self.delays = dict(delays or {})
+        self.failures = dict(failures or {})
+        self.requests = Counter()
+        self._bodies: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _body(self, endpoint: str) -> Optional[str]:
+        with self._lock:
+            if endpoint not in self._bodies:
+                path = self.fixtures_dir / f"{endpoint}.json"
+                self._bodies[endpoint] = path.read_text(encoding="utf-8") if path.is_file() else None
+            return self._bodies[endpoint]
+
+    def get(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None, timeout=None):
+        endpoint = endpoint_name(url, params)
+        with self._lock:
+            self.requests[endpoint] += 1
+        delay = self.delays.get(endpoint, 0)
+        if timeout is not None:
+            read_timeout = timeout[-1] if isinstance(timeout, (tuple, list)) else timeout
+            if delay > read_timeout:
+                time.sleep(read_timeout)
+                raise requests.exceptions.ReadTimeout(f"{endpoint} took longer than {read_timeout}s")
+        if delay:
+            time.sleep(delay)
+        failure = self.failures.get(endpoint)
+        if isinstance(failure, Exception):
+            raise failure
+        if failure:
+            return ReplayResponse(failure, url=url)
+        body = self._body(endpoint)
+        if body is None:
+            return ReplayResponse(404, url=url)
+        return ReplayResponse(200, body, {"Content-Type": "application/json"}, url)
+
+
+class RecordingSession:
+    """Passes requests through to a real session and saves what comes back."""
+
+    def __init__(self, fixtures_dir: Path = FIXTURES_DIR, session: Optional[requests.Session] = None):
+        self.fixtures_dir = Path(fixtures_dir)
+        self.session = session or requests.Session()
+
+    def get(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None, timeout=None):
+        # Conditional headers would turn the recording into an empty 304.
+        response = self.session.get(url, params=params, timeout=timeout)
+        if response.status_code == 200:
+            data = response.json()
+            self.fixtures_dir.mkdir(parents=True, exist_ok=True)
+            path = self.fixtures_dir / f"{endpoint_name(url, params)}.json"
+            path.write_text(json.dumps(data, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        return response
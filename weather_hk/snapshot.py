@@ -0,0 +1,79 @@
+"""
+Precomputed weather answers shared through a local snapshot file.
+
+refresher.py writes the file; WeatherHKSkill reads it. The file is replaced
+atomically and re-parsed only when its modification time changes, so a
+query costs a stat() and a dictionary lookup.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from http_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_SNAPSHOT_PATH = DEFAULT_CACHE_DIR / "snapshot.json"
+# Older snapshots are ignored and the question is answered live.
+DEFAULT_MAX_AGE = 15 * 60
+
+
+def write_snapshot(path: Path, summary: dict, text: str, generated_at: Optional[float] = None) -> dict:
+    """
+    Atomically replace the snapshot at path
+
+    Args:
+        path: snapshot file
+        summary: get_rain_chance_and_humidity() result
+        text: the summary formatted for the user
+
+    Returns:
+        The snapshot that was written
+    """
+    snapshot = {
+        "generated_at": time.time() if generated_at is None else generated_at,
+        "rain_chance_and_humidity": summary,
+        "text": text,
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(snapshot, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+    return snapshot
+
+
+class SnapshotReader:
+    """Reads the snapshot file, parsing it only when it changed."""
+
+    def __init__(self, path: Path = DEFAULT_SNAPSHOT_PATH, max_age: float = DEFAULT_MAX_AGE):
+        """
+        Args:
+            path: snapshot file written by refresher.py
+            max_age: seconds after which a snapshot is too old to use
+        """
+        self.path = Path(path).expanduser()
+        self.max_age = max_age
+        self._mtime = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def read(self) -> Optional[dict]:
+        """The current snapshot, or None if there is none or it is too old."""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                try:
+                    self._snapshot = json.loads(self.path.read_text(encoding="utf-8"))
+                except (OSError, ValueError):
+                    return None
+                self._mtime = mtime
+            snapshot = self._snapshot
+        if time.time() - snapshot.get("generated_at", 0) > self.max_age:
+            return None
+        return snapshot
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Stand-in OpenWeatherMap and HKO server for tests and benchmarks.
+
+Serves the recorded payloads in fixtures/ over real HTTP:
+
+    GET /data/2.5/weather, /data/2.5/forecast      OpenWeatherMap
+    GET /weatherAPI/opendata/weather.php?dataType=  HKO rhb, hrf, flw, fnd, warnsum
+
+Each endpoint can be given a delay or a failure status, so timeouts,
+degraded answers and the effect of caching and concurrency can be measured
+offline:
+
+    python3 stand_in_server.py --delay-ms forecast=300 --fail hrf=503
+"""
+
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional
+
+from http_cache import endpoint_name
+from replay import FIXTURES_DIR
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up before a slow reply is written.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockWeatherServer:
+    def __init__(self, fixtures_dir: Path = FIXTURES_DIR, delays: Optional[Dict[str, float]] = None,
+                 failures: Optional[Dict[str, int]] = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            fixtures_dir: directory of recorded <endpoint>.json payloads
+            delays: endpoint -> seconds added to its responses
+            failures: endpoint -> HTTP status it answers with
+        """
+        self.fixtures_dir = Path(fixtures_dir)
+        self.delays = dict(delays or {})
+        self.failures = dict(failures or {})
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.httpd = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def configure(self, skill) -> None:
+        """Point a WeatherHKSkill at this server."""
+        skill.base_url = f"{self.url}/data/2.5"
+        skill.hko_base_url = f"{self.url}/weatherAPI/opendata/"
+
+    def start(self) -> "MockWeatherServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counts(self) -> None:
+        with self.lock:
+            self.requests.clear()
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; without this a delayed
+            # ACK adds 40 ms to every response.
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body=b""):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                endpoint = endpoint_name(self.path)
+                with mock.lock:
+                    mock.requests[endpoint] += 1
+                delay = mock.delays.get(endpoint, 0)
+                if delay:
+                    time.sleep(delay)
+                if endpoint in mock.failures:
+                    self._send(mock.failures[endpoint], b'{"message": "stand-in failure"}')
+                    return
+                path = mock.fixtures_dir / f"{endpoint}.json"
+                if not path.is_file():
+                    self._send(404, b'{"message": "no fixture"}')
+                    return
+                self._send(200, path.read_bytes())
+
+        return Handler
+
+
+def parse_pairs(pairs, convert):
+    """["forecast=300", ...] -> {"forecast": convert("300"), ...}"""
+    result = {}
+    for pair in pairs or ():
+        name, _, value = pair.partition("=")
+        result[name] = convert(value)
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stand-in OpenWeatherMap and HKO server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--fixtures", default=str(FIXTURES_DIR), help="directory of recorded payloads")
+    parser.add_argument("--delay-ms", action="append", metavar="ENDPOINT=MS", help="delay one endpoint")
+    parser.add_argument("--fail", action="append", metavar="ENDPOINT=STATUS", help="make one endpoint fail")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = MockWeatherServer(args.fixtures, parse_pairs(args.delay_ms, lambda ms: float(ms) / 1000),
+                               parse_pairs(args.fail, int), args.host, args.port)
+    print(f"Stand-in weather APIs on {server.url}: base_url {server.url}/data/2.5, "
+          f"hko_base_url {server.url}/weatherAPI/opendata/")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
@@ -1,8 +1,591 @@
 """
 Test file for Hong Kong Weather Skill
 """
+import json
+import shutil
+import tempfile
+import threading
+import time
 import unittest
-from weather_hk import WeatherHKSkill
+from datetime import datetime
+from pathlib import Path
+
+import forecast_analytics
+from forecast_analytics import ForecastArrays
+from hko_parsers import parse_fnd, parse_flw, parse_hrf, parse_rhb, parse_warnsum
+from history import HKT, HistoryStore, timestamp
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from http_cache import HTTPCache
+from locations import LocationIndex
+from alerts import AlertPoller, diff_warnings
+from benchmark import run_benchmark
+from refresher import Refresher
+from replay import RecordingSession, ReplaySession
+from weather_hk import WeatherHKSkill, format_rain_summary, initialize_skill
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"HTTP {self.status_code}")
+
+
+class FakeSession:
+    """Answers every GET with the next response and records the request."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.requests.append((url, params, headers or {}))
+        return self.responses.pop(0)
+
+
+CURRENT = {"main": {"temp": 28.3, "feels_like": 31.0, "humidity": 78, "pressure": 1008},
+           "weather": [{"description": "light rain"}], "wind": {"speed": 3.1}, "clouds": {"all": 75},
+           "dt": 1760000000}
+FORECAST = {"list": [{"main": {"humidity": 70 + i}, "rain": {"3h": 0.5 if i % 2 else 0}} for i in range(8)]}
+FIXTURES = Path(__file__).with_name("fixtures")
+
+
+def fixture(name):
+    return json.loads((FIXTURES / f"{name}.json").read_text(encoding="utf-8"))
+
+
+RHB = {"temperature": {"data": [{"place": "King's Park", "value": 27},
+                                {"place": "Hong Kong Observatory", "value": 28}]},
+       "humidity": {"data": [{"place": "Hong Kong Observatory", "value": 81}]}}
+
+
+class RoutingSession:
+    """Answers by URL (or HKO dataType) after a delay; exceptions are raised."""
+
+    def __init__(self, routes, delay=0.0):
+        self.routes = routes
+        self.delay = delay
+        self.requests = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        name = (params or {}).get("dataType") or url.rsplit("/", 1)[-1]
+        self.requests.append(name)
+        time.sleep(self.delay)
+        answer = self.routes[name]
+        if isinstance(answer, Exception):
+            raise answer
+        return FakeResponse(200, answer)
+
+
+def offline_skill(routes, delay=0.0, **options):
+    options.setdefault("snapshot_path", None)
+    options.setdefault("history_path", None)
+    skill = WeatherHKSkill(cache_dir=None, **options)
+    skill.http.session = RoutingSession(routes, delay)
+    return skill
+
+
+class TestConcurrentFetch(unittest.TestCase):
+    def test_sources_are_fetched_together(self):
+        """Four slow sources take about as long as one"""
+        routes = {"weather": CURRENT, "forecast": FORECAST, "rhb": RHB, "hrf": {}}
+        skill = offline_skill(routes, delay=0.2)
+        start = time.perf_counter()
+        result = skill.get_rain_chance_and_humidity()
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(result["chance_of_rain"]["next_24_hours"], 50.0)
+        self.assertEqual(result["humidity"]["average_next_24h"], 73.5)
+        self.assertEqual(sorted(skill.http.session.requests), ["forecast", "hrf", "rhb", "weather"])
+
+    def test_partial_results(self):
+        """Missing sources degrade to N/A or to the Observatory's readings"""
+        import requests
+        down = requests.exceptions.ConnectionError("down")
+        routes = {"weather": down, "forecast": down, "rhb": RHB, "hrf": down}
+        result = offline_skill(routes).get_rain_chance_and_humidity()
+        self.assertEqual(result["current_temp"], 28)
+        self.assertEqual(result["humidity"]["current"], 81)
+        self.assertEqual(result["chance_of_rain"]["next_24_hours"], "N/A")
+        self.assertEqual(result["rainfall"]["midnight_to_noon"], "N/A")
+
+        routes["rhb"] = down
+        with self.assertRaises(Exception):
+            offline_skill(routes, concurrent=False).get_rain_chance_and_humidity()
+
+    def test_deadline(self):
+        """Sources slower than the deadline are reported missing"""
+        routes = {"weather": CURRENT, "forecast": FORECAST, "rhb": RHB, "hrf": {}}
+        skill = offline_skill(routes, delay=0.5, deadline=0.1)
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            skill.get_rain_chance_and_humidity()
+        self.assertLess(time.perf_counter() - start, 0.3)
+
+
+class TestHKOParsers(unittest.TestCase):
+    def test_rhb(self):
+        report = parse_rhb(fixture("rhb"))
+        self.assertEqual(report.temperature_at("Hong Kong Observatory"), 26)
+        self.assertIsNone(report.temperature_at("Tai Po"))
+        self.assertEqual(report.observatory_humidity, 92)
+        self.assertEqual(report.uv_index, 3)
+        self.assertEqual(report.rainfall_00_to_12, 12.4)
+        self.assertEqual([(r.place, r.value) for r in report.district_rainfall][-2:], [("Sha Tin", 5), ("Tai Po", None)])
+        self.assertEqual(len(report.warnings), 1)
+        self.assertFalse(hasattr(report, "__dict__"))
+
+        empty = parse_rhb({"uvindex": "", "rainfall": "", "rainfallFrom00To12": ""})
+        self.assertIsNone(empty.uv_index)
+        self.assertIsNone(empty.rainfall_00_to_12)
+        self.assertEqual(empty.district_rainfall, ())
+
+    def test_hrf(self):
+        rainfall = parse_hrf(fixture("hrf"))
+        self.assertEqual(rainfall.obs_time, "2026-10-19T10:45:00+08:00")
+        self.assertEqual(len(rainfall.stations), 4)
+        self.assertEqual(rainfall.max, 4.5)
+        self.assertIsNone(parse_hrf({}).max)
+
+    def test_forecasts(self):
+        local = parse_flw(fixture("flw"))
+        self.assertTrue(local.forecast.startswith("Cloudy with showers"))
+        self.assertEqual(local.tc_info, "")
+        nine_day = parse_fnd(fixture("fnd"))
+        self.assertEqual([d.date for d in nine_day.days], ["2026-10-20", "2026-10-21"])
+        self.assertEqual((nine_day.days[0].temp_min, nine_day.days[0].temp_max), (24, 27))
+        self.assertEqual(nine_day.days[0].rain_probability, "High")
+
+    def test_rain_summary_uses_recorded_payloads(self):
+        routes = {"weather": CURRENT, "forecast": FORECAST, "rhb": fixture("rhb"), "hrf": fixture("hrf")}
+        result = offline_skill(routes).get_rain_chance_and_humidity()
+        self.assertEqual(result["rainfall"]["midnight_to_noon"], 12.4)
+        self.assertEqual(result["rainfall"]["past_hour_max"], 4.5)
+        self.assertEqual(result["uv_index"], 3)
+        self.assertIn("rainfall midnight to noon: 12.4 mm (wettest station in the past hour 4.5 mm)",
+                      format_rain_summary(result))
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def hko(self, update_time, temperature, humidity, rain):
+        rhb = dict(RHB, updateTime=update_time)
+        rhb["temperature"] = {"data": [{"place": "Hong Kong Observatory", "value": temperature}]}
+        rhb["humidity"] = {"data": [{"place": "Hong Kong Observatory", "value": humidity}]}
+        hrf = {"obsTime": update_time, "hourlyRainfall": [
+            {"automaticWeatherStation": "Sha Tin", "value": rain},
+            {"automaticWeatherStation": "Central Pier", "value": rain / 2}]}
+        return rhb, hrf
+
+    def test_recorded_once_per_update(self):
+        routes = {"weather": CURRENT, "forecast": FORECAST, "rhb": fixture("rhb"), "hrf": fixture("hrf")}
+        skill = offline_skill(routes, history_path=Path(self.tmp) / "history.db")
+        skill.get_district_weather("Sha Tin")
+        skill.get_district_weather("Eastern")
+        db = skill.history._db()
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM observations").fetchone()[0], 10)
+        self.assertEqual(skill.history.latest("rainfall", "Sha Tin"), (timestamp("2026-10-19T10:45:00+08:00"), 4.5))
+
+    def test_queries(self):
+        store = HistoryStore(":memory:")
+        skill = offline_skill({}, history_path=None)
+        skill.history = store
+        # Every 15 minutes for two days; each reading is the past hour's rain.
+        start = timestamp("2026-10-18T08:00:00+08:00")
+        for step in range(4 * 48):
+            when = datetime.fromtimestamp(start + step * 900, HKT).isoformat()
+            skill._readings_for(*self.hko(when, 20 + (step % 96) / 8, 60 + step // 4, 2.0))
+        yesterday_noon = timestamp("2026-10-18T12:00:00+08:00")
+        # 24 hours, one past-hour reading counted per hour.
+        self.assertEqual(store.rain_total(yesterday_noon, yesterday_noon + 86399), {"Sha Tin": 48.0, "Central Pier": 24.0})
+        self.assertEqual(store.rain_total(yesterday_noon, yesterday_noon + 3599, station="Sha Tin"), {"Sha Tin": 2.0})
+
+        compared = skill.compare_to_yesterday()
+        self.assertEqual(compared["humidity"]["change"], 24)
+        self.assertEqual(compared["temperature"]["change"], 0)
+
+        hourly = store.hourly("humidity", "Hong Kong Observatory", yesterday_noon, yesterday_noon + 3 * 3600 - 1)
+        self.assertEqual([value for _, value in hourly], [64, 65, 66])
+
+    def test_forecast(self):
+        store = HistoryStore(":memory:")
+        periods = [{"dt": 1000 + i * 10800, "main": {"temp": 25, "humidity": 80}, "rain": {"3h": 1}} for i in range(4)]
+        self.assertEqual(store.record_forecast({"list": periods}), 4)
+        self.assertEqual(store.record_forecast({"list": periods[1:]}), 3)
+        latest = store.forecast_for(1000 + 10800, 1000 + 10800)
+        self.assertEqual(latest[0]["issued"], 1000 + 10800)
+
+
+class TestLocations(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = LocationIndex.from_file()
+
+    def test_resolve(self):
+        """Districts, areas, stations and Chinese names resolve"""
+        cases = {
+            "Sha Tin District": ("district", "Sha Tin"),
+            "mong kok": ("district", "Yau Tsim Mong"),
+            "Is it raining in Causeway Bay?": ("district", "Wan Chai"),
+            "weather in north point": ("district", "Eastern"),
+            "旺角": ("district", "Yau Tsim Mong"),
+            "King's Park": ("station", "King's Park"),
+        }
+        for text, (kind, name) in cases.items():
+            place = self.index.resolve(text)
+            self.assertEqual((place.kind, place.name), (kind, name), text)
+        self.assertIsNone(self.index.resolve("Atlantis"))
+
+    def test_nearest_station(self):
+        station, distance = self.index.nearest_station(22.3035, 114.1745)
+        self.assertEqual(station.name, "Hong Kong Observatory")
+        self.assertLess(distance, 1)
+        station, _ = self.index.nearest_station(22.3035, 114.1745, ["Sha Tin", "Tai Po"])
+        self.assertEqual(station.name, "Sha Tin")
+
+    def test_district_weather_shares_one_fetch(self):
+        """Questions about different places reuse one rhb/hrf fetch"""
+        rhb = dict(RHB, updateTime="2026-10-19T10:02:00+08:00", rainfall={"data": [
+            {"place": "Sha Tin", "max": 4, "unit": "mm"},
+            {"place": "Eastern District", "max": 0, "unit": "mm"}]})
+        rhb["temperature"] = {"data": RHB["temperature"]["data"] + [{"place": "Sha Tin", "value": 26},
+                                                                    {"place": "Shau Kei Wan", "value": "M"}]}
+        hrf = {"obsTime": "2026-10-19T10:00:00+08:00",
+               "hourlyRainfall": [{"automaticWeatherStation": "Sha Tin", "value": "3", "unit": "mm"}]}
+        skill = offline_skill({"rhb": rhb, "hrf": hrf})
+        skill.http.ttls.update(rhb=600, hrf=600)
+
+        sha_tin = skill.get_district_weather("Sha Tin")
+        self.assertEqual(sha_tin["temperature"]["value"], 26)
+        self.assertEqual(sha_tin["rainfall_past_hour"]["district_max"], 4)
+        self.assertEqual(sha_tin["rainfall_past_hour"]["station"], 3)
+        # Shau Kei Wan is under maintenance, so the nearest reporting station answers.
+        eastern = skill.get_district_weather("Chai Wan")
+        self.assertEqual(eastern["district"], "Eastern")
+        self.assertNotEqual(eastern["temperature"]["station"], "Shau Kei Wan")
+        self.assertEqual(eastern["rainfall_past_hour"]["district_max"], 0)
+        self.assertEqual(skill.get_weather_near(22.30, 114.17)["location"], "Hong Kong Observatory")
+        self.assertEqual(sorted(skill.http.session.requests), ["hrf", "rhb"])
+        with self.assertRaises(ValueError):
+            skill.get_district_weather("Atlantis")
+
+
+def forecast_period(dt, temp, humidity, rain=0.0, pop=0.0):
+    period = {"dt": dt, "main": {"temp": temp, "humidity": humidity}, "pop": pop}
+    if rain:
+        period["rain"] = {"3h": rain}
+    return period
+
+
+@unittest.skipIf(forecast_analytics.np is None, "NumPy is not installed")
+class TestForecastAnalytics(unittest.TestCase):
+    def setUp(self):
+        # 2026-10-19 00:00 Hong Kong time, then 3-hourly for two days.
+        start = 1792339200
+        rain = [0, 0, 1.5, 2.0, 0, 0, 0.2, 0, 0, 0, 0, 0, 3.0, 0, 0, 0]
+        pop = [0.1, 0.1, 0.8, 0.9, 0.3, 0.2, 0.5, 0.1, 0, 0, 0, 0.2, 0.9, 0.4, 0.1, 0]
+        self.periods = [forecast_period(start + i * 10800, 24 + i % 8, 70 + i, rain[i], pop[i]) for i in range(16)]
+        self.forecast = ForecastArrays(self.periods)
+
+    def test_daily_aggregates(self):
+        days = self.forecast.daily()
+        self.assertEqual([d["date"] for d in days], ["2026-10-19", "2026-10-20"])
+        first = days[0]
+        self.assertEqual((first["temp_min"], first["temp_max"]), (24, 31))
+        self.assertEqual(first["rain_total"], 3.7)
+        self.assertEqual(first["rainy_periods"], 3)
+        self.assertEqual(first["humidity_mean"], 73.5)
+        self.assertEqual(first["chance_of_rain"], 99.6)
+
+    def test_windows(self):
+        """Rolling means and the driest window match a plain loop"""
+        rolling = self.forecast.rolling_mean(self.forecast.humidity, 12)
+        expected = [sum(70 + j for j in range(i, i + 4)) / 4 for i in range(13)]
+        self.assertEqual(list(rolling), expected)
+        window = self.forecast.best_dry_window(6, within_hours=24)
+        self.assertEqual((window["start"], window["end"], window["rain_total"]),
+                         ("2026-10-19 00:00", "2026-10-19 06:00", 0.0))
+        window = self.forecast.best_dry_window(9)
+        self.assertEqual(window["start"], "2026-10-20 00:00")
+        self.assertEqual(self.forecast.next_hours(24)["chance_of_rain"], 37.5)
+
+    def test_skill_uses_the_cached_forecast(self):
+        skill = offline_skill({"forecast": {"list": self.periods, "city": {"timezone": 28800}}})
+        skill.http.ttls["forecast"] = 600
+        skill.get_forecast()
+        analysis = skill.get_forecast_analysis()
+        self.assertEqual(analysis["periods"], 16)
+        self.assertEqual(len(analysis["daily"]), 2)
+        self.assertEqual(skill.http.session.requests, ["forecast"])
+
+
+class TestRefresher(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.snapshot_path = Path(self.test_dir) / "snapshot.json"
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_answers_come_from_the_snapshot(self):
+        """Once the refresher has run, queries make no requests"""
+        routes = {"weather": CURRENT, "forecast": FORECAST, "rhb": RHB, "hrf": {}}
+        refresher = Refresher(offline_skill(routes), self.snapshot_path)
+        self.assertEqual(refresher.interval, 600)
+        refresher.refresh()
+
+        skill = offline_skill({}, snapshot_path=self.snapshot_path)
+        for _ in range(3):
+            result = skill.get_rain_chance_and_humidity()
+        self.assertEqual(result["current_temp"], 28.3)
+        self.assertIn("Chance of rain in the next 24 hours: 50.0%", skill.get_rain_summary_text())
+        self.assertEqual(skill.http.session.requests, [])
+
+    def test_history_is_pruned_daily(self):
+        """Rows past the retention go away while the refresher runs"""
+        routes = {"weather": CURRENT, "forecast": FORECAST, "rhb": RHB, "hrf": {}}
+        skill = offline_skill(routes)
+        skill.history = HistoryStore(":memory:")
+        db = skill.history._db()
+        old = int(time.time()) - 500 * 86400
+        db.execute("INSERT INTO observations VALUES ('Sha Tin', 'rainfall', ?, 1.0)", (old,))
+        db.execute("INSERT INTO observations VALUES ('Sha Tin', 'rainfall', ?, 2.0)", (int(time.time()),))
+        refresher = Refresher(skill, self.snapshot_path)
+        refresher.refresh()
+        self.assertEqual(db.execute("SELECT value FROM observations").fetchall(), [(2.0,)])
+        # Not again until a day has passed.
+        db.execute("INSERT INTO observations VALUES ('Sha Tin', 'rainfall', ?, 1.0)", (old,))
+        refresher.refresh()
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM observations").fetchone()[0], 2)
+
+    def test_stale_snapshot_is_ignored(self):
+        routes = {"weather": CURRENT, "forecast": FORECAST, "rhb": RHB, "hrf": {}}
+        Refresher(offline_skill(routes), self.snapshot_path).refresh()
+        skill = offline_skill(routes, snapshot_path=self.snapshot_path, snapshot_max_age=-1)
+        skill.get_rain_chance_and_humidity()
+        self.assertEqual(len(skill.http.session.requests), 4)
+
+
+class TestHTTPCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_ttl_per_endpoint(self):
+        """Fresh entries are served locally; keys ignore the API key"""
+        session = FakeSession(FakeResponse(200, {"n": 1}), FakeResponse(200, {"n": 2}))
+        cache = HTTPCache(self.cache_dir, {"weather": 600, "rhb": 0}, session=session)
+        url = "http://api.example/data/2.5/weather"
+        self.assertEqual(cache.fetch(url, {"lat": 1, "appid": "a"}), {"n": 1})
+        self.assertEqual(cache.fetch(url, {"lat": 1, "appid": "b"}), {"n": 1})
+        self.assertEqual(cache.fetch("http://hko.example/weather.php", {"dataType": "rhb"}), {"n": 2})
+        self.assertEqual(len(session.requests), 2)
+        self.assertEqual(cache.stats["hits"], 1)
+
+    def test_shared_on_disk_and_revalidated(self):
+        """Another process reads the disk copy and revalidates it with the ETag"""
+        url = "http://hko.example/weather.php"
+        params = {"dataType": "hrf", "lang": "en"}
+        first = HTTPCache(self.cache_dir, session=FakeSession(FakeResponse(200, {"n": 1}, {"ETag": '"v1"'})))
+        first.fetch(url, params)
+
+        session = FakeSession(FakeResponse(304))
+        second = HTTPCache(self.cache_dir, session=session)
+        self.assertEqual(second.fetch(url, params), {"n": 1})
+        self.assertEqual(session.requests, [])
+        self.assertEqual(second.fetch(url, params, max_age=0), {"n": 1})
+        self.assertEqual(session.requests[0][2], {"If-None-Match": '"v1"'})
+        self.assertEqual(second.stats["revalidated"], 1)
+        self.assertTrue(list(Path(self.cache_dir).glob("*.json")))
+
+    def test_timeout_from_config(self):
+        """A [connect, read] pair from config.json reaches requests as a tuple"""
+        options = {"cache_dir": "", "history_path": "", "use_snapshot": False}
+        self.assertEqual(initialize_skill(dict(options, timeout=[2, 5])).http.timeout, (2, 5))
+        self.assertEqual(initialize_skill(dict(options, timeout=7)).http.timeout, 7)
+        self.assertEqual(initialize_skill(options).http.timeout, (3.05, 10))
+
+
+class TestResilience(unittest.TestCase):
+    def test_breaker_states(self):
+        now = [0.0]
+        breaker = CircuitBreaker("hko", failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        now[0] = 30
+        self.assertTrue(breaker.allow())
+        # Only one trial while it is half-open.
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        now[0] = 60
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_stale_served_while_refreshing(self):
+        """An expired entry answers at once; the slow refresh lands later"""
+        routes = {"rhb": {"n": 1}}
+        cache = HTTPCache(None, {"rhb": 0.05}, session=RoutingSession(routes, delay=0.3), stale_ttl=60)
+        url = "http://hko.example/weather.php"
+        self.assertEqual(cache.fetch(url, {"dataType": "rhb"}), {"n": 1})
+        time.sleep(0.1)
+        routes["rhb"] = {"n": 2}
+        start = time.perf_counter()
+        self.assertEqual(cache.fetch(url, {"dataType": "rhb"}), {"n": 1})
+        self.assertEqual(cache.fetch(url, {"dataType": "rhb"}), {"n": 1})
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertTrue(cache.wait_for_refreshes())
+        self.assertEqual(cache.fetch(url, {"dataType": "rhb"}), {"n": 2})
+        # Two stale answers, one background request.
+        self.assertEqual(cache.session.requests, ["rhb", "rhb"])
+        self.assertEqual(cache.stats["stale"], 2)
+
+    def test_failing_upstream_is_short_circuited(self):
+        import requests
+        down = requests.exceptions.ConnectTimeout("slow")
+        routes = {"weather": down, "forecast": down, "rhb": RHB, "hrf": {}}
+        skill = offline_skill(routes, concurrent=False)
+        skill.http.failure_threshold = 2
+        for _ in range(2):
+            skill.get_rain_chance_and_humidity()
+        # Later answers use the HKO fallback without trying OpenWeatherMap.
+        self.assertEqual(skill.http.session.requests.count("weather") + skill.http.session.requests.count("forecast"), 2)
+        self.assertEqual(skill.http.stats["short_circuited"], 2)
+        with self.assertRaises(Exception) as raised:
+            skill.get_current_weather()
+        self.assertIsInstance(raised.exception.__context__, CircuitOpenError)
+
+
+class TestReplay(unittest.TestCase):
+    def test_skill_on_recorded_payloads(self):
+        skill = offline_skill({})
+        skill.http.session = ReplaySession(failures={"hrf": 503})
+        result = skill.get_rain_chance_and_humidity()
+        self.assertEqual(result["current_temp"], 26.4)
+        self.assertEqual(result["chance_of_rain"]["next_24_hours"], 100.0)
+        self.assertEqual(result["rainfall"]["past_hour_max"], "N/A")
+        self.assertEqual(skill.get_district_weather("Sha Tin")["temperature"]["value"], 25)
+        self.assertEqual(skill.http.session.requests, {"weather": 1, "forecast": 1, "rhb": 1, "hrf": 2})
+
+    def test_recording_round_trip(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        skill = offline_skill({})
+        skill.http.session = RecordingSession(tmp, session=ReplaySession())
+        skill.get_forecast()
+        recorded = json.loads((Path(tmp) / "forecast.json").read_text(encoding="utf-8"))
+        self.assertEqual(recorded, fixture("forecast"))
+
+    def test_benchmark(self):
+        """Concurrency and caching show up in latency and request counts"""
+        report = run_benchmark(runs=2, delay=0.05, setups=["sequential", "concurrent", "cached"])
+        rain = {setup: results["get_rain_chance_and_humidity"] for setup, results in report.items()}
+        self.assertEqual(rain["sequential"]["requests_per_call"], 4)
+        self.assertEqual(rain["cached"]["requests_per_call"], 0)
+        self.assertGreater(rain["sequential"]["p50_ms"], 200)
+        self.assertLess(rain["concurrent"]["p50_ms"], 150)
+        self.assertLess(rain["cached"]["p50_ms"], 50)
+
+
+class TestAlerts(unittest.TestCase):
+    def test_diff(self):
+        before = parse_warnsum(fixture("warnsum"))
+        self.assertEqual(sorted(before), ["WRAIN", "WTS"])
+        after = parse_warnsum(dict(fixture("warnsum"), WRAIN=dict(fixture("warnsum")["WRAIN"], code="WRAINR"),
+                                   WTS=dict(fixture("warnsum")["WTS"], actionCode="CANCEL"),
+                                   WTCSGNL={"name": "Tropical Cyclone Warning Signal", "code": "TC8NE",
+                                            "actionCode": "ISSUE"}))
+        events = {event.warning.type: event for event in diff_warnings(before, after)}
+        self.assertEqual({t: e.kind for t, e in events.items()}, {"WRAIN": "changed", "WTS": "cancelled", "WTCSGNL": "issued"})
+        self.assertEqual(events["WRAIN"].text, "Rainstorm Warning Signal changed from WRAINA to WRAINR")
+
+    def test_one_poll_for_all_subscribers(self):
+        routes = {"warnsum": {}}
+        skill = offline_skill(routes)
+        poller = skill.alert_poller(interval=0.01)
+        received = []
+        poller.subscribe(received.append)
+        rain_only = poller.subscribe(types={"WRAIN"})
+        subscribers = [poller.subscribe() for _ in range(50)]
+        poller.subscribe(lambda event: 1 / 0)
+
+        poller.poll()
+        routes["warnsum"] = fixture("warnsum")
+        time.sleep(0.02)
+        events = poller.poll()
+        self.assertEqual(sorted(e.warning.code for e in events), ["WRAINA", "WTS"])
+        self.assertEqual(len(received), 2)
+        self.assertEqual(rain_only.get(timeout=0).warning.code, "WRAINA")
+        self.assertIsNone(rain_only.get(timeout=0))
+        self.assertEqual(subscribers[-1].queue.qsize(), 2)
+        self.assertEqual(skill.http.session.requests, ["warnsum", "warnsum"])
+
+        late = poller.subscribe(current=True)
+        self.assertEqual(late.queue.qsize(), 2)
+        late.cancel()
+        time.sleep(0.02)
+        self.assertEqual(poller.poll(), [])
+        self.assertEqual(skill.get_warnings()[0]["code"], "WRAINA")
+
+    def test_current_warnings_come_before_later_changes(self):
+        """A poll during subscribe(current=True) is published after the warnings in force"""
+        payloads = iter([fixture("warnsum"), {}])
+        poller = AlertPoller(lambda: next(payloads))
+        poller.poll()
+        received = []
+
+        def slow_subscriber(event):
+            if event.kind == "issued":
+                time.sleep(0.1)
+            received.append((event.kind, event.warning.type))
+
+        subscribing = threading.Thread(target=poller.subscribe, args=(slow_subscriber,),
+                                       kwargs={"types": {"WRAIN"}, "current": True})
+        subscribing.start()
+        time.sleep(0.02)
+        poller.poll()
+        subscribing.join()
+        self.assertEqual(received, [("issued", "WRAIN"), ("cancelled", "WRAIN")])
+
+    def test_warnings_are_never_stale(self):
+        """Past the warnsum TTL, get_warnings waits for HKO instead of serving the old copy"""
+        routes = {"warnsum": fixture("warnsum")}
+        skill = offline_skill(routes, cache_ttl={"warnsum": 0.01}, stale_ttl=3600)
+        self.assertEqual(len(skill.get_warnings()), 2)
+        routes["warnsum"] = {}
+        time.sleep(0.02)
+        self.assertEqual(skill.get_warnings(), [])
+        self.assertEqual(skill.http.stats["stale"], 0)
+
+    def test_poller_thread(self):
+        """A started poller publishes changes from its own thread until stopped"""
+        payloads = [{}, fixture("warnsum")]
+        received = threading.Event()
+        events = []
+        poller = AlertPoller(lambda: payloads[0] if len(payloads) == 1 else payloads.pop(0), interval=0.01)
+        poller.subscribe(lambda event: events.append(event) or received.set())
+        poller.start()
+        try:
+            self.assertTrue(received.wait(2))
+        finally:
+            poller.stop()
+        self.assertIn("WRAINA", [event.warning.code for event in events])
+        self.assertIsNone(poller._thread)
 
 
 class TestWeatherHKSkill(unittest.TestCase):
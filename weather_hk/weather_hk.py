@@ -5,8 +5,26 @@ Specifically checks for chance of rain and humidity in Hong Kong
 
 import requests
 import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-from typing import Dict, List, Optional, Union
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+from http_cache import DEFAULT_CACHE_DIR, DEFAULT_STALE_TTL, DEFAULT_TIMEOUT, HTTPCache
+from forecast_analytics import ForecastArrays
+from alerts import DEFAULT_INTERVAL, AlertPoller
+from hko_parsers import parse_hrf, parse_rhb, parse_warnsum
+from history import DEFAULT_HISTORY_PATH, HKT, HUMIDITY, TEMPERATURE, HistoryStore, start_of_week
+from locations import LocationIndex, StationReadings
+from snapshot import DEFAULT_MAX_AGE, DEFAULT_SNAPSHOT_PATH, SnapshotReader
+
+# Seconds get_rain_chance_and_humidity waits for all of its sources together.
+DEFAULT_DEADLINE = 8.0
+# Station used for Hong Kong-wide history answers.
+OBSERVATORY = "Hong Kong Observatory"
 
 
 class WeatherHKSkill:
@@ -16,14 +34,43 @@ class WeatherHKSkill:
     Uses the OpenWeatherMap API and Hong Kong Observatory data.
     """
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, cache_dir: Optional[Union[str, Path]] = DEFAULT_CACHE_DIR,
+                 cache_ttl: Optional[Dict[str, float]] = None, timeout=DEFAULT_TIMEOUT,
+                 stale_ttl: float = DEFAULT_STALE_TTL,
+                 concurrent: bool = True, deadline: float = DEFAULT_DEADLINE,
+                 snapshot_path: Optional[Union[str, Path]] = DEFAULT_SNAPSHOT_PATH,
+                 snapshot_max_age: float = DEFAULT_MAX_AGE,
+                 history_path: Optional[Union[str, Path]] = DEFAULT_HISTORY_PATH):
         """
         Initialize the Hong Kong Weather skill
         
         Args:
             api_key: OpenWeatherMap API key (optional, will use free tier without key)
+            cache_dir: Directory for cached responses shared between processes
+                (None keeps them in memory only)
+            cache_ttl: Per-endpoint TTL overrides in seconds, e.g. {"weather": 300}
+            timeout: Request timeout in seconds, or (connect, read)
+            stale_ttl: Seconds past its TTL a cached response is still used
+                while it is refreshed in the background (0 always waits)
+            concurrent: Fetch the sources of a combined answer in parallel
+            deadline: Seconds a combined answer may wait for its sources
+            snapshot_path: Snapshot written by refresher.py, used while it is
+                younger than snapshot_max_age (None always fetches live)
+            snapshot_max_age: Seconds before a snapshot is considered stale
+            history_path: SQLite file every fetched observation and forecast
+                is recorded to (None keeps no history)
         """
         self.api_key = api_key
+        self.http = HTTPCache(cache_dir, cache_ttl, timeout=timeout, stale_ttl=stale_ttl)
+        self.concurrent = concurrent
+        self.deadline = deadline
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.snapshot = SnapshotReader(snapshot_path, snapshot_max_age) if snapshot_path else None
+        self._locations = None
+        self._readings = None
+        self.history = HistoryStore(history_path) if history_path else None
+        self._recorded_forecast = None
         self.base_url = "http://api.openweathermap.org/data/2.5"
         self.hko_base_url = "https://data.weather.gov.hk/weatherAPI/opendata/"
         
@@ -31,21 +78,21 @@ class WeatherHKSkill:
         self.hk_lat = 22.3964
         self.hk_lon = 114.1095
         
-    def _make_request(self, url: str, params: dict = None) -> dict:
+    def _make_request(self, url: str, params: dict = None, max_age: Optional[float] = None) -> dict:
         """
-        Make a request to the weather API
+        Make a request to the weather API, answered from the cache while the
+        endpoint's TTL has not passed
         
         Args:
             url: API endpoint URL
             params: Query parameters
+            max_age: Oldest cached copy to accept instead of the endpoint's TTL
             
         Returns:
             Response JSON data
         """
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
+            return self.http.fetch(url, params, max_age=max_age)
         except requests.exceptions.RequestException as e:
             raise Exception(f"Error making request to weather API: {str(e)}")
     
@@ -85,30 +132,138 @@ class WeatherHKSkill:
         """
         Get chance of rain and humidity for Hong Kong
         
+        Answered from the refresher's snapshot when a recent one exists,
+        otherwise fetched live.
+        
+        Returns:
+            Dictionary with rain chance and humidity information
+        """
+        snapshot = self.snapshot.read() if self.snapshot else None
+        if snapshot is not None:
+            return snapshot["rain_chance_and_humidity"]
+        return self.fetch_rain_chance_and_humidity()
+    
+    def get_rain_summary_text(self) -> str:
+        """
+        Get the rain chance and humidity summary as text for the user
+        
+        Returns:
+            Formatted summary, precomputed by the refresher when available
+        """
+        snapshot = self.snapshot.read() if self.snapshot else None
+        if snapshot is not None:
+            return snapshot["text"]
+        return format_rain_summary(self.fetch_rain_chance_and_humidity())
+    
+    def fetch_rain_chance_and_humidity(self) -> dict:
+        """
+        Fetch chance of rain and humidity for Hong Kong from the APIs
+        
+        The current weather, the forecast and the two HKO datasets are
+        fetched together (see _fetch_all), so the answer takes about as long
+        as the slowest of them. Anything but the current weather may be
+        missing and is reported as "N/A".
+        
         Returns:
             Dictionary with rain chance and humidity information
         """
-        # Get current weather
-        current_weather = self.get_current_weather()
+        hko_url = f"{self.hko_base_url}weather.php"
+        results = self._fetch_all({
+            "current": self.get_current_weather,
+            "forecast": self.get_forecast,
+            "rhb": lambda: self._make_request(hko_url, {"dataType": "rhb", "lang": "en"}),
+            "hrf": lambda: self._make_request(hko_url, {"dataType": "hrf", "lang": "en"}),
+        })
+        
+        current_weather = results["current"]
+        if isinstance(current_weather, Exception):
+            current_weather = self._current_from_hko(results["rhb"])
+            if current_weather is None:
+                raise results["current"]
         
-        # Get forecast for next 5 days to calculate rain chance
-        forecast = self.get_forecast()
+        forecast = results["forecast"]
+        if isinstance(forecast, Exception):
+            print(f"Could not fetch forecast: {forecast}")
+            forecast = None
         
-        # Calculate chance of rain from forecast
-        rain_periods = 0
-        total_periods = len(forecast)
+        hko_errors = [results[name] for name in ("rhb", "hrf") if isinstance(results[name], Exception)]
+        if hko_errors:
+            print(f"Could not fetch HKO data: {hko_errors[0]}")
+            hko_data = {"chance_of_rain_1hr": "N/A", "midnight_to_noon_rainfall": "N/A",
+                        "past_hour_max_rainfall": "N/A", "uv_index": "N/A"}
+        else:
+            hko_data = self._summarize_hko(results["rhb"], results["hrf"])
+            self._readings_for(results["rhb"], results["hrf"])
         
-        for period in forecast:
-            if "rain" in period and period["rain"].get("3h", 0) > 0:
-                rain_periods += 1
+        return self._build_rain_summary(current_weather, forecast, hko_data)
+    
+    def _fetch_all(self, calls: Dict[str, Callable[[], object]]) -> Dict[str, object]:
+        """
+        Run several fetches at once within one shared time budget
         
-        rain_chance_percent = (rain_periods / total_periods) * 100 if total_periods > 0 else 0
+        Args:
+            calls: Name -> callable doing one fetch
+            
+        Returns:
+            Name -> result, or the exception the call raised (a TimeoutError
+            if it did not finish within self.deadline seconds)
+        """
+        if not self.concurrent:
+            results = {}
+            for name, call in calls.items():
+                try:
+                    results[name] = call()
+                except Exception as e:
+                    results[name] = e
+            return results
         
-        # Extract detailed humidity info
-        avg_humidity = sum([period["main"]["humidity"] for period in forecast]) / len(forecast) if forecast else current_weather["humidity"]
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="weather_hk")
+        futures = {name: self._executor.submit(call) for name, call in calls.items()}
+        wait(futures.values(), timeout=self.deadline)
+        results = {}
+        for name, future in futures.items():
+            if not future.done():
+                # Left to finish in the background; its response still
+                # lands in the cache for the next question.
+                results[name] = TimeoutError(f"{name} took longer than {self.deadline}s")
+            elif future.exception() is not None:
+                results[name] = future.exception()
+            else:
+                results[name] = future.result()
+        return results
+    
+    def _build_rain_summary(self, current_weather: dict, forecast: Optional[List[dict]], hko_data: dict) -> dict:
+        """
+        Combine current weather, forecast periods and HKO data into the
+        get_rain_chance_and_humidity result
         
-        # Try to get more accurate Hong Kong-specific data from HKO
-        hko_data = self._get_hko_weather_data()
+        Args:
+            current_weather: get_current_weather() result
+            forecast: get_forecast() result, or None if it could not be fetched
+            hko_data: _summarize_hko() of the rhb and hrf payloads from
+                _fetch_all(), or "N/A" values if either could not be fetched
+            
+        Returns:
+            Dictionary with rain chance and humidity information
+        """
+        if forecast is None:
+            rain_chance = "N/A"
+            avg_humidity = current_weather["humidity"]
+        else:
+            # Calculate chance of rain from forecast
+            rain_periods = 0
+            total_periods = len(forecast)
+            
+            for period in forecast:
+                if "rain" in period and period["rain"].get("3h", 0) > 0:
+                    rain_periods += 1
+            
+            rain_chance = round((rain_periods / total_periods) * 100 if total_periods > 0 else 0, 1)
+            
+            # Extract detailed humidity info
+            avg_humidity = sum([period["main"]["humidity"] for period in forecast]) / len(forecast) if forecast else current_weather["humidity"]
         
         result = {
             "location": "Hong Kong",
@@ -120,11 +275,15 @@ class WeatherHKSkill:
             },
             "chance_of_rain": {
                 "next_hour": hko_data.get("chance_of_rain_1hr", "N/A"),
-                "next_24_hours": round(rain_chance_percent, 1),
+                "next_24_hours": rain_chance,
                 "unit": "%"
             },
             "rainfall": {
-                "today": hko_data.get("today_rainfall", "N/A"),
+                # HKO publishes no whole-day total: this is midnight to noon,
+                # available from the afternoon.
+                "midnight_to_noon": hko_data.get("midnight_to_noon_rainfall", "N/A"),
+                # Wettest automatic weather station, not a territory-wide figure.
+                "past_hour_max": hko_data.get("past_hour_max_rainfall", "N/A"),
                 "unit": "mm"
             },
             "uv_index": hko_data.get("uv_index", "N/A"),
@@ -133,6 +292,104 @@ class WeatherHKSkill:
         
         return result
     
+    def _current_from_hko(self, weather_data) -> Optional[dict]:
+        """
+        Fall back to the Observatory's own readings when OpenWeatherMap
+        is unavailable
+        
+        Args:
+            weather_data: HKO rhb payload, or the exception fetching it raised
+            
+        Returns:
+            Dictionary with current_temp and humidity, or None
+        """
+        if not isinstance(weather_data, dict):
+            return None
+        report = parse_rhb(weather_data)
+        temperature = report.temperature_at("Hong Kong Observatory")
+        humidity = report.observatory_humidity
+        if temperature is None or humidity is None:
+            return None
+        return {"location": "Hong Kong", "current_temp": temperature, "humidity": humidity}
+    
+    @property
+    def locations(self) -> LocationIndex:
+        if self._locations is None:
+            self._locations = LocationIndex.from_file()
+        return self._locations
+    
+    def _station_readings(self) -> StationReadings:
+        """
+        Parse the HKO station arrays, once per published update
+        
+        Returns:
+            StationReadings for the current rhb and hrf payloads
+        """
+        hko_url = f"{self.hko_base_url}weather.php"
+        results = self._fetch_all({
+            "rhb": lambda: self._make_request(hko_url, {"dataType": "rhb", "lang": "en"}),
+            "hrf": lambda: self._make_request(hko_url, {"dataType": "hrf", "lang": "en"}),
+        })
+        if isinstance(results["rhb"], Exception):
+            raise results["rhb"]
+        rainfall_data = None if isinstance(results["hrf"], Exception) else results["hrf"]
+        return self._readings_for(results["rhb"], rainfall_data)
+    
+    def _readings_for(self, weather_data: dict, rainfall_data: Optional[dict]) -> StationReadings:
+        """
+        StationReadings for an rhb/hrf pair, parsed and recorded to the
+        history only when HKO has published a new update
+        """
+        key = (weather_data.get("updateTime"), (rainfall_data or {}).get("obsTime"))
+        readings = self._readings
+        if readings is None or readings.key != key:
+            readings = self._readings = StationReadings(weather_data, rainfall_data)
+            self._record(lambda history: history.record_readings(readings))
+        return readings
+    
+    def _record(self, write: Callable[[HistoryStore], object]) -> None:
+        # History is a by-product of answering; a full disk must not
+        # keep the answer from the user.
+        if self.history is None:
+            return
+        try:
+            write(self.history)
+        except sqlite3.Error as e:
+            print(f"Could not record weather history: {e}")
+    
+    def get_district_weather(self, place: str) -> dict:
+        """
+        Get current temperature, humidity and rainfall for a district,
+        area or weather station in Hong Kong
+        
+        Args:
+            place: e.g. "Sha Tin", "Mong Kok", "Causeway Bay" or "旺角"
+            
+        Returns:
+            Dictionary with the readings of the nearest station and the
+            district's past-hour rainfall
+        """
+        resolved = self.locations.resolve(place)
+        if resolved is None:
+            raise ValueError(f"Unknown place in Hong Kong: {place}")
+        return self._station_readings().for_place(resolved, self.locations)
+    
+    def get_weather_near(self, lat: float, lon: float) -> dict:
+        """
+        Get current readings for the station nearest to a point
+        
+        Args:
+            lat: Latitude
+            lon: Longitude
+            
+        Returns:
+            Same shape as get_district_weather
+        """
+        readings = self._station_readings()
+        nearest = self.locations.nearest_station(lat, lon, readings.temperature)
+        place = nearest[0] if nearest else self.locations.nearest_district(lat, lon)
+        return readings.for_place(place, self.locations)
+    
     def get_forecast(self) -> List[dict]:
         """
         Get weather forecast for Hong Kong
@@ -140,6 +397,17 @@ class WeatherHKSkill:
         Returns:
             List of forecast periods
         """
+        data = self._get_forecast_response()
+        return data["list"][:8]  # Next 8 periods (approx 24 hours)
+    
+    def _get_forecast_response(self) -> dict:
+        """
+        Get the full 5-day / 3-hour forecast response (cached, so
+        get_forecast and get_forecast_analysis share one request)
+        
+        Returns:
+            Raw OpenWeatherMap forecast response
+        """
         endpoint = f"{self.base_url}/forecast"
         params = {
             "lat": self.hk_lat,
@@ -149,58 +417,200 @@ class WeatherHKSkill:
         }
         
         data = self._make_request(endpoint, params)
-        return data["list"][:8]  # Next 8 periods (approx 24 hours)
+        periods = data.get("list") or []
+        if periods and periods[0].get("dt") != self._recorded_forecast:
+            self._record(lambda history: history.record_forecast(data))
+            self._recorded_forecast = periods[0].get("dt")
+        return data
     
-    def _get_hko_weather_data(self) -> dict:
+    def get_forecast_analysis(self, dry_window_hours: int = 3) -> dict:
         """
-        Get Hong Kong specific weather data from Hong Kong Observatory
+        Analyse the whole 5-day forecast: next 24 hours, daily aggregates
+        and the driest upcoming window (requires NumPy)
         
+        Args:
+            dry_window_hours: Length of the dry window to look for
+            
         Returns:
-            Dictionary with HKO weather information
+            Dictionary with next_24_hours, daily and best_dry_window entries
         """
-        try:
-            # Get current weather report
-            weather_url = f"{self.hko_base_url}weather.php?dataType=rhb&lang=en"
-            weather_data = self._make_request(weather_url)
-            
-            # Get rainfall data
-            rainfall_url = f"{self.hko_base_url}weather.php?dataType=hrf&lang=en"
-            rainfall_data = self._make_request(rainfall_url)
-            
-            result = {
-                "chance_of_rain_1hr": "N/A",  # Would need specific API for this
-                "today_rainfall": self._parse_today_rainfall(rainfall_data),
-                "uv_index": weather_data.get("uvindex", [{}])[0].get("value") if weather_data.get("uvindex") else "N/A"
-            }
+        forecast = ForecastArrays.from_response(self._get_forecast_response())
+        return {
+            "location": "Hong Kong",
+            "periods": len(forecast),
+            "next_24_hours": forecast.next_hours(24),
+            "daily": forecast.daily(),
+            "best_dry_window": {
+                "today": forecast.best_dry_window(dry_window_hours, within_hours=24),
+                "next_5_days": forecast.best_dry_window(dry_window_hours),
+            },
+            "humidity_rolling_12h": [round(float(v), 1) for v in forecast.rolling_mean(forecast.humidity, 12)],
+        }
+    
+    def get_rain_this_week(self, station: Optional[str] = None) -> dict:
+        """
+        Rainfall since Monday from the recorded history (no API call)
+        
+        Args:
+            station: HKO rainfall station; by default the wettest one
+            
+        Returns:
+            Dictionary with the total and the station it was measured at
+        """
+        since = start_of_week()
+        totals = self.history.rain_total(since, station=station) if self.history else {}
+        wettest = max(totals, key=totals.get) if totals else station
+        return {
+            "location": wettest or "Hong Kong",
+            "since": datetime.fromtimestamp(since, HKT).strftime("%Y-%m-%d %H:%M"),
+            "rainfall": totals.get(wettest, "N/A") if wettest else "N/A",
+            "stations_recorded": len(totals),
+            "unit": "mm"
+        }
+    
+    def get_humidity_trend(self, hours: int = 24, station: str = OBSERVATORY) -> dict:
+        """
+        Hourly humidity over the past hours from the recorded history
+        
+        Args:
+            hours: How far back to look
+            station: HKO humidity station
+            
+        Returns:
+            Dictionary with the hourly means and the change over the period
+        """
+        hourly = self.history.hourly(HUMIDITY, station, time.time() - hours * 3600) if self.history else []
+        return {
+            "location": station,
+            "hourly": [{"time": datetime.fromtimestamp(hour, HKT).strftime("%Y-%m-%d %H:%M"), "humidity": round(value, 1)}
+                       for hour, value in hourly],
+            "change": round(hourly[-1][1] - hourly[0][1], 1) if len(hourly) > 1 else "N/A",
+            "unit": "%"
+        }
+    
+    def compare_to_yesterday(self, station: str = OBSERVATORY) -> dict:
+        """
+        Latest temperature and humidity against the same time yesterday
+        
+        Args:
+            station: HKO station with both readings
             
-            return result
-        except Exception as e:
-            print(f"Could not fetch HKO data: {e}")
-            return {
-                "chance_of_rain_1hr": "N/A",
-                "today_rainfall": "N/A",
-                "uv_index": "N/A"
+        Returns:
+            Dictionary with now, yesterday and the difference for each
+        """
+        result = {"location": station}
+        for kind, unit in ((TEMPERATURE, "C"), (HUMIDITY, "%")):
+            now = self.history.latest(kind, station) if self.history else None
+            before = self.history.nearest(kind, station, now[0] - 86400) if now else None
+            result[kind] = {
+                "now": now[1] if now else "N/A",
+                "yesterday": before[1] if before else "N/A",
+                "change": round(now[1] - before[1], 1) if now and before else "N/A",
+                "unit": unit
             }
+        return result
     
-    def _parse_today_rainfall(self, rainfall_data) -> Union[float, str]:
+    def fetch_warnings(self, max_age: Optional[float] = None) -> dict:
         """
-        Parse today's rainfall from HKO data
+        Get the raw HKO warnings summary (warnsum)
         
         Args:
-            rainfall_data: Raw rainfall data from HKO API
+            max_age: Oldest cached copy to accept, in seconds (default: the
+                warnsum TTL). Warnings are never served stale.
             
         Returns:
-            Today's rainfall in mm or 'N/A' if unavailable
+            Warning type -> HKO warning entry
         """
-        try:
-            # Look for today's rainfall summary
-            if isinstance(rainfall_data, dict) and "rainfallLast60Minutes" in rainfall_data:
-                # Calculate total rainfall for today
-                hourly_rain = rainfall_data["rainfallLast60Minutes"]
-                return sum(float(obs.get("amount", 0)) for obs in hourly_rain if obs.get("amount"))
-            return "N/A"
-        except:
-            return "N/A"
+        if max_age is None:
+            max_age = self.http.ttl("warnsum")
+        return self._make_request(f"{self.hko_base_url}weather.php", {"dataType": "warnsum", "lang": "en"},
+                                  max_age=max_age)
+    
+    def get_warnings(self) -> List[dict]:
+        """
+        Get the weather warnings in force in Hong Kong
+        
+        Returns:
+            One dictionary per warning with its type, name and code
+        """
+        return [{"type": w.type, "name": w.name, "code": w.code, "issue_time": w.issue_time,
+                 "update_time": w.update_time} for w in parse_warnsum(self.fetch_warnings()).values()]
+    
+    def alert_poller(self, interval: float = DEFAULT_INTERVAL) -> AlertPoller:
+        """
+        Create a poller that tells subscribers when a warning is issued,
+        changed or cancelled (call start() on it)
+        
+        Args:
+            interval: Seconds between polls
+            
+        Returns:
+            AlertPoller fed by this skill's cache and circuit breakers
+        """
+        # Half the interval, so our own previous poll is always expired but
+        # a fresh copy fetched by another process is reused.
+        return AlertPoller(lambda: self.fetch_warnings(max_age=interval / 2), interval)
+    
+    def _summarize_hko(self, weather_data: dict, rainfall_data: dict) -> dict:
+        """
+        Extract the fields we report from the HKO rhb and hrf payloads
+        
+        Args:
+            weather_data: Raw regional weather report (rhb)
+            rainfall_data: Raw rainfall data (hrf)
+            
+        Returns:
+            Dictionary with HKO weather information
+        """
+        report = parse_rhb(weather_data)
+        return {
+            "chance_of_rain_1hr": "N/A",  # Would need specific API for this
+            "midnight_to_noon_rainfall": "N/A" if report.rainfall_00_to_12 is None else report.rainfall_00_to_12,
+            "past_hour_max_rainfall": self._parse_past_hour_rainfall(rainfall_data),
+            "uv_index": "N/A" if report.uv_index is None else report.uv_index
+        }
+    
+    def _parse_past_hour_rainfall(self, rainfall_data) -> Union[float, str]:
+        """
+        Parse the latest rainfall from HKO data
+        
+        The hrf dataset only covers the past hour, one value per automatic
+        weather station, so this is the highest of those readings.
+        
+        Args:
+            rainfall_data: Raw rainfall data from HKO API (hrf)
+            
+        Returns:
+            Rainfall in mm or 'N/A' if no station reported one
+        """
+        highest = parse_hrf(rainfall_data).max
+        return "N/A" if highest is None else highest
+
+
+def format_rain_summary(summary: dict) -> str:
+    """
+    Format a get_rain_chance_and_humidity result for the user
+    
+    Args:
+        summary: Rain chance and humidity information
+        
+    Returns:
+        One or two lines of text
+    """
+    def value(amount, unit):
+        return "N/A" if amount == "N/A" else f"{amount}{unit}"
+    
+    humidity = summary["humidity"]
+    rain = summary["chance_of_rain"]
+    lines = [
+        f"{summary['location']}: {summary['current_temp']}°C, humidity {value(humidity['current'], '%')} "
+        f"(next 24h average {value(humidity['average_next_24h'], '%')})",
+        f"Chance of rain in the next 24 hours: {value(rain['next_24_hours'], '%')}; "
+        f"rainfall midnight to noon: {value(summary['rainfall']['midnight_to_noon'], ' mm')} "
+        f"(wettest station in the past hour {value(summary['rainfall']['past_hour_max'], ' mm')}); "
+        f"UV index: {summary['uv_index']}",
+    ]
+    return "\n".join(lines)
 
 
 # Example usage and helper functions for OpenClaw
@@ -209,14 +619,40 @@ def initialize_skill(config: dict) -> WeatherHKSkill:
     Initialize the Hong Kong Weather skill with configuration
     
     Args:
-        config: Configuration dictionary containing 'api_key' (optional)
+        config: Configuration dictionary containing 'api_key', 'cache_dir',
+            'cache_ttl', 'timeout', 'stale_ttl', 'concurrent', 'deadline', 'use_snapshot',
+            'snapshot_path', 'snapshot_max_age' and 'history_path' (all
+            optional)
         
     Returns:
         Initialized WeatherHKSkill instance
     """
     api_key = config.get('api_key')  # Optional OpenWeatherMap API key
+    options = {}
+    if 'cache_dir' in config:
+        options['cache_dir'] = config['cache_dir'] or None
+    if config.get('cache_ttl'):
+        options['cache_ttl'] = config['cache_ttl']
+    if config.get('timeout'):
+        timeout = config['timeout']
+        # JSON has no tuples; requests wants (connect, read).
+        options['timeout'] = tuple(timeout) if isinstance(timeout, list) else timeout
+    if 'stale_ttl' in config:
+        options['stale_ttl'] = config['stale_ttl'] or 0
+    if 'concurrent' in config:
+        options['concurrent'] = bool(config['concurrent'])
+    if config.get('deadline'):
+        options['deadline'] = config['deadline']
+    if config.get('use_snapshot') is False:
+        options['snapshot_path'] = None
+    elif config.get('snapshot_path'):
+        options['snapshot_path'] = config['snapshot_path']
+    if config.get('snapshot_max_age'):
+        options['snapshot_max_age'] = config['snapshot_max_age']
+    if 'history_path' in config:
+        options['history_path'] = config['history_path'] or None
     
-    return WeatherHKSkill(api_key=api_key)
+    return WeatherHKSkill(api_key=api_key, **options)
 
 
 def get_supported_operations():
@@ -226,7 +662,15 @@ def get_supported_operations():
     return [
         "get_current_weather",
         "get_rain_chance_and_humidity", 
-        "get_forecast"
+        "get_rain_summary_text",
+        "get_district_weather",
+        "get_weather_near",
+        "get_forecast",
+        "get_forecast_analysis",
+        "get_rain_this_week",
+        "get_humidity_trend",
+        "compare_to_yesterday",
+        "get_warnings"
     ]
 
 
@@ -237,6 +681,12 @@ EXAMPLE_COMMANDS = {
         "Check humidity levels in Hong Kong",
         "Get Hong Kong weather forecast",
         "Will it rain in Hong Kong today?",
-        "What's the humidity like in Hong Kong right now?"
+        "What's the humidity like in Hong Kong right now?",
+        "How hot is it in Sha Tin?",
+        "Is it raining in Mong Kok?",
+        "When is the best time to go out without rain this week?",
+        "How much has it rained this week?",
+        "Is it more humid than yesterday?",
+        "Is there a rainstorm or typhoon signal?"
     ]
 }
\ No newline at end of file